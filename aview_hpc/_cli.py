@@ -6,28 +6,53 @@ import os
 import re
 import shutil
 import socket
+import sqlite3
 import sys
+import tarfile
+import threading
 import time
 import traceback as tb
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from dataclasses import asdict
 from getpass import getpass
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Dict, Generator, List, Type, Union
+from typing import Callable, Dict, Generator, List, Type, Union
 
 import keyring
+import numpy as np
 import pandas as pd
-from adamspy.postprocess.msg import check_if_finished as check_if_msg_finished
 from paramiko import AuthenticationException, AutoAddPolicy, SSHClient, SSHException
 
 from .aview_hpc import get_binary_version
-from .config import get_config, set_config
+from . import daemon
+from .asset_store import MAX_SIZE as STORE_MAX_SIZE
+from .asset_store import MIN_AGE as STORE_MIN_AGE
+from .asset_store import MIN_SIZE as STORE_MIN_SIZE
+from .asset_store import AssetStore
+from .config import get_config, is_enabled, set_config
+from .dir_status import parse_status_output, status_command
+from .extract import REMOTE_PYTHON, helper_command, read_helper_output
+from .fixed_width import FixedWidthData, read_fixed_width
 from .get_binary import get_binary
+from .job_cache import get_job_cache, sort_by_job_id
+from .job_index import get_job_index
+from .journal import SUBMITTED, SUBMITTING, UPLOADED, Journal
+from .msg import get_tail
+from .pool import get_pool
+from .result_cache import CACHE_EXTS, get_result_cache, parse_result_file
+from .scheduler import QUEUE_FILE, SubmitQueue, get_scheduler
+from .res import STEPS_PER_BLOCK, concat_blocks, iter_remote_chunks, iter_res
+from .transfer import CONCURRENCY, MANIFEST_NAME, download_files, sync_files, upload_files
 from .version import version
+from .waiter import WaitResult, Waiter
 
 RE_SUBMISSION_RESPONSE = re.compile(r'.*submitted batch job (\d+)\w*', flags=re.I)
 RE_MODEL = re.compile(r'file/.*model[ \t]*=[ \t]*(.+)[ \t]*(?:,|$)', flags=re.I | re.MULTILINE)
 RE_NTHREADS = re.compile(r'nthreads[ \t]*=[ \t]*(\d+)\b', flags=re.I)
+RE_BACKPRESSURE = re.compile(r'resource temporarily unavailable|socket timed out|try again later'
+                             r'|MaxSubmit|slurm_receive_msg|slurmctld', flags=re.I)
 LINUX_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 RES_EXTS = ('.res', '.req', '.gra', '.msg', '.out')
 LOG = logging.getLogger(__name__)
@@ -43,6 +68,49 @@ JOB_TABLE_COLUMNS = ['jobid',
                      'submitline%-70',
                      'workdir%-70']
 SLEEP_TIME = 10
+_SUBMIT_QUEUE: SubmitQueue = None
+_SUBMIT_QUEUE_LOCK = threading.Lock()
+MAX_SLEEP_TIME = 300
+TRANSFER_MODES = ('sftp', 'tar')
+
+# Slurm's default MaxArraySize (used if it can't be read from `scontrol show config`)
+MAX_ARRAY_SIZE = 1001
+
+
+class SubmissionBackpressure(RuntimeError):
+    """Raised when the scheduler rejects a submission because it is busy or a limit was hit"""
+
+
+class Pacer():
+    """Spaces out submissions from several threads, backing off when the scheduler pushes back
+
+    Use as a context manager around the submit command. Only one thread is inside the context at
+    a time, and it is entered no sooner than `delay` seconds after the previous submission. The
+    delay doubles (starting at `SLEEP_TIME`, up to `MAX_SLEEP_TIME`) on backpressure and halves on
+    success.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        wait = self._last + self.delay - time.monotonic()
+        if wait > 0:
+            LOG.info(f'Waiting {wait:.0f} seconds before submitting the next job...')
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self._last = time.monotonic()
+        if exc_type is not None and issubclass(exc_type, SubmissionBackpressure):
+            self.delay = min(max(self.delay * 2, SLEEP_TIME), MAX_SLEEP_TIME)
+            LOG.warning(f'The scheduler is busy. Backing off to {self.delay:.0f} seconds.')
+        elif exc_type is None:
+            self.delay = self.delay / 2 if self.delay > 1 else 0.0
+        self._lock.release()
 
 
 class HPCSession():
@@ -71,7 +139,8 @@ class HPCSession():
         self.job_name: str = job_name
         self.job_id: int = job_id
 
-        self.ssh, self.ftp = self._connect()
+        self._conn = get_pool().acquire(self.host, self.username, self._connect)
+        self.ssh, self.ftp = self._conn.ssh, self._conn.ftp
 
         self.uploaded_files = {}
 
@@ -97,40 +166,175 @@ class HPCSession():
 
         return ssh, ftp
 
-    def get_results(self, local_dir: Path, extensions=None):
+    def get_results(self,
+                    local_dir: Path,
+                    extensions=None,
+                    callback: Callable[[Path, int, int], None] = None,
+                    sync: bool = False,
+                    cache: bool = False):
         """Get the results files from the cluster
 
+        The files are downloaded concurrently over several SFTP channels and large files are split
+        into ranges (see `transfer.download_files`). An interrupted download is resumed the next
+        time this is called.
+
         Parameters
         ----------
         dst : Path
             Local path to place files
         extensions : List[str], optional
             A list of file extensions to get (including the leading '.'), by default `RES_EXTS`
+        callback : Callable[[Path, int, int], None], optional
+            Called with (local file, bytes downloaded, total bytes) as each file progresses, by
+            default None
+        sync : bool, optional
+            If True, skip files that haven't changed since they were last fetched into `local_dir`
+            and only fetch the new tail of files that have grown (see `transfer.sync_files`), by
+            default False
+        cache : bool, optional
+            If True, also parse the .res, .req and .gra files into the local result cache (see
+            `load_results`), by default False
 
         Returns
         -------
         List[Path]
-            A list of the files that were downloaded
+            A list of the files that were downloaded (or are already up to date if `sync` is True)
         """
         if extensions is None:
             extensions = RES_EXTS
 
         try:
-            remote_files = self.ftp.listdir(self.remote_dir.as_posix())
+            remote_files = self.ftp.listdir_attr(self.remote_dir.as_posix())
         except FileNotFoundError as err:
             raise FileNotFoundError(f'Could not find remote directory {self.remote_dir}') from err
 
-        files = [Path(f) for f in remote_files if Path(f).suffix in extensions]
-        for file in files:
-            self.ftp.get((self.remote_dir / str(file)).as_posix(), local_dir / file)
+        attrs = [a for a in remote_files if Path(a.filename).suffix in extensions]
+        files = [((self.remote_dir / a.filename).as_posix(), Path(local_dir) / a.filename)
+                 for a in attrs]
+        concurrency = int(get_config().get('download_concurrency', CONCURRENCY))
+        if sync:
+            sync_files(self.ssh.get_transport(),
+                       files,
+                       attrs,
+                       Path(local_dir) / MANIFEST_NAME,
+                       concurrency=concurrency,
+                       ftp=self.ftp,
+                       callback=callback)
+        else:
+            download_files(self.ssh.get_transport(),
+                           files,
+                           concurrency=concurrency,
+                           ftp=self.ftp,
+                           attrs=attrs,
+                           callback=callback)
+
+        if cache:
+            result_cache = get_result_cache(f'{self.username}@{self.host}')
+            for (remote, local), attr in zip(files, attrs):
+                if (local.suffix in CACHE_EXTS
+                        and result_cache.get(remote, attr.st_size, attr.st_mtime) is None):
+                    result_cache.put(remote, attr.st_size, attr.st_mtime, parse_result_file(local))
+
+        return [local for _, local in files]
+
+    def load_results(self, extension: str = '.res') -> Dict[str, np.ndarray]:
+        """Load a parsed result file of the job, from the local result cache if it is up to date
+
+        On a cache miss the file is parsed while it is read from the cluster (nothing is written to
+        disk except the cache entry).
+
+        Parameters
+        ----------
+        extension : str, optional
+            '.res', '.req' or '.gra', by default '.res'
+
+        Returns
+        -------
+        Dict[str, np.ndarray]
+            The columns of the file (see `result_cache.parse_result_file`)
+        """
+        remote_file = self.find_remote_file(extension)
+        attr = self.ftp.stat(remote_file)
+        result_cache = get_result_cache(f'{self.username}@{self.host}')
+
+        data = result_cache.get(remote_file, attr.st_size, attr.st_mtime)
+        if data is None:
+            if extension == '.res':
+                data = concat_blocks(iter_res(iter_remote_chunks(self.ftp, remote_file)))
+            else:
+                times, values = read_fixed_width(self.read_remote_file(extension))
+                data = {'time': times, 'values': values}
+
+            result_cache.put(remote_file, attr.st_size, attr.st_mtime, data)
+
+        return data
 
-        return [local_dir / f for f in files]
+    def iter_res(self, components: List[str] = None, steps_per_block: int = STEPS_PER_BLOCK):
+        """Stream the job's .res file from the cluster, parsing it as it downloads
+
+        Parameters
+        ----------
+        components : List[str], optional
+            The components to read (`<entity>.<component>` or `<entity>`), by default all
+        steps_per_block : int, optional
+            The maximum number of steps in each block, by default `res.STEPS_PER_BLOCK`
+
+        Yields
+        ------
+        ResBlock
+            Blocks of steps (see `res.iter_res`)
+        """
+        chunks = iter_remote_chunks(self.ftp, self.find_remote_file('.res'))
+        yield from iter_res(chunks, components, steps_per_block)
+
+    def extract_results(self, channels: List[str] = None) -> Dict[str, np.ndarray]:
+        """Extract components from the job's .res file on the cluster and get only those
+
+        The .res file is filtered by a helper script run over SSH (see `extract.HELPER_SCRIPT`), so
+        only the requested components are sent back.
+
+        Parameters
+        ----------
+        channels : List[str], optional
+            The components to extract (`<entity>.<component>` or `<entity>`), by default all
+
+        Returns
+        -------
+        Dict[str, np.ndarray]
+            The values of each component for every step in the file
+        """
+        cmd = helper_command(self.find_remote_file('.res'),
+                             channels,
+                             python=get_config().get('remote_python', REMOTE_PYTHON))
+        _, stdout, stderr = self.ssh.exec_command(cmd)
+        data = read_helper_output(stdout)
+
+        if stdout.channel.recv_exit_status() != 0:
+            raise RuntimeError(f'Failed to extract results from {self.remote_dir}: '
+                               f'{stderr.read().decode().strip()}')
+
+        return data
+
+    def read_remote_file(self, extension: str) -> bytes:
+        """Read the content of the job's result file with the given extension into memory"""
+        return b''.join(iter_remote_chunks(self.ftp, self.find_remote_file(extension)))
+
+    def find_remote_file(self, extension: str) -> str:
+        """Get the posix path of the first file in the remote directory with the given extension"""
+        try:
+            name = next(f for f in self.ftp.listdir(self.remote_dir.as_posix())
+                        if f.endswith(extension))
+        except StopIteration as err:
+            raise FileNotFoundError(f'No {extension} file found in {self.remote_dir}') from err
+
+        return (self.remote_dir / name).as_posix()
 
     def submit(self,
                acf_file: Path,
                adm_file: Path = None,
                aux_files: List[Path] = None,
                _ignore_resubmit=False,
+               transfer_mode: str = None,
                **kwargs):
         """Submit an ACF file to the cluster
 
@@ -140,23 +344,46 @@ class HPCSession():
             The path to the ACF file to submit
         adm_file : Path, optional
             The path to the ADM file to submit, by default None
+        transfer_mode : str, optional
+            How the input files are sent to the cluster. 'sftp' uploads each file over parallel SFTP
+            channels. 'tar' sends all files as one compressed tar stream over a single exec channel.
+            By default the `transfer_mode` config setting or 'sftp'.
         """
         LOG.debug('`submit` called with the following arguments:')
         LOG.debug(f'   acf_file: {acf_file}')
         LOG.debug(f'   adm_file: {adm_file}')
         LOG.debug(f'   aux_files: {aux_files}')
         LOG.debug(f'   _ignore_resubmit: {_ignore_resubmit}')
+        LOG.debug(f'   transfer_mode: {transfer_mode}')
         for k, v in kwargs.items():
             LOG.debug(f'   {k}: {v}')
 
         if self.job_name is not None and not _ignore_resubmit:
             raise RuntimeError('Please instantiate a new object to submit another job.')
+
+        self.upload_job(acf_file, adm_file, aux_files, transfer_mode)
+        self.job_id = self.run_submit_cmd((self.remote_dir / acf_file.name).as_posix(), **kwargs)
+        self._index_submission(self.job_id, self.job_name, self.remote_dir, acf_file,
+                               [acf_file, adm_file, *(aux_files or [])])
+
+    def upload_job(self,
+                   acf_file: Path,
+                   adm_file: Path = None,
+                   aux_files: List[Path] = None,
+                   transfer_mode: str = None):
+        """Create a temporary directory on the cluster and upload the files for a job to it
+
+        Sets `remote_dir` and `job_name`. See `submit` for a description of the parameters.
+        """
         if aux_files is None:
             aux_files = []
 
+        transfer_mode = transfer_mode or get_config().get('transfer_mode', 'sftp')
+        if transfer_mode not in TRANSFER_MODES:
+            raise ValueError(f'Unknown transfer mode {transfer_mode}. Must be one of {TRANSFER_MODES}')
+
         adm_file = adm_file or get_adm_from_acf(acf_file)
         self.job_name = acf_file.stem
-        self.remote_dir = self.mkdtemp_remote(self.job_name)
 
         with TemporaryDirectory() as tmp_dir:
 
@@ -178,28 +405,77 @@ class HPCSession():
             for src, dst in zip(aux_files, aux_files_):
                 shutil.copyfile(src, dst)
 
+            local_files = [acf_file, adm_file, *aux_files]
+            tmp_files = [acf_file_, adm_file_, *aux_files_]
+
+            # The acf file is modified before uploading, so it doesn't go through the store
+            store = self.get_asset_store()
+            in_store = set(store.known(local_files[1:])) if store is not None else set()
+            copies = [f for f in local_files if f in self.uploaded_files]
+
+            if transfer_mode == 'tar':
+                archived = [(local, tmp) for local, tmp in zip(local_files, tmp_files)
+                            if local not in in_store and local not in copies]
+                self.remote_dir = self.upload_archive(self.job_name, [tmp for _, tmp in archived])
+                uploaded = [local for local, _ in archived]
+            else:
+                self.remote_dir = self.mkdtemp_remote(self.job_name)
+                uploaded = []
+
             LOG.info(f'Uploading files for {self.job_name}')
-            for local_file, tmp_file in zip([acf_file, adm_file, *aux_files],
-                                            [acf_file_, adm_file_, *aux_files_]):
+            uploads = []
+            # Only recorded in `uploaded_files` once the upload has finished
+            remote_files = {}
+            for local_file, tmp_file in zip(local_files, tmp_files):
                 remote_file = (self.remote_dir / local_file.name).as_posix()
+                if local_file in remote_files:
+                    # Listed twice in this job
+                    continue
 
                 size = local_file.stat().st_size
-                if local_file not in self.uploaded_files:
-
-                    LOG.info(f' Uploading: {local_file.as_posix():>100} '
-                             f' ({size*1e-3:.1f} MB) '
-                             f'--> {remote_file}')
-                    self.ftp.put(tmp_file, remote_file)
-                    self.uploaded_files[local_file] = remote_file
-                else:
+                if local_file in copies:
                     # Copy the file that was already uploaded
                     LOG.info(f' Copying: {self.uploaded_files[local_file]:>100} '
-                             f' ({size*1e-3:.1f} MB) '
+                             f' ({size*1e-6:.1f} MB) '
+                             f'--> {remote_file}')
+                    cmd = f'cp {self.uploaded_files[local_file]} {remote_file}'
+                    _, stdout, _ = self.ssh.exec_command(cmd)
+                    stdout.channel.recv_exit_status()
+
+                elif local_file not in uploaded:
+                    LOG.info(f' Uploading: {local_file.as_posix():>100} '
+                             f' ({size*1e-6:.1f} MB) '
                              f'--> {remote_file}')
-                    self.ssh.exec_command(f'cp {self.uploaded_files[local_file]} {remote_file}')
+                    uploads.append((local_file, tmp_file, remote_file))
 
-        cmd = [self.submit_cmd,
-               (self.remote_dir / acf_file.name).as_posix()]
+                remote_files[local_file] = remote_file
+
+            if store is not None:
+                not_linked = store.link_known([(local, remote) for local, _, remote in uploads
+                                               if local in in_store])
+                uploads = [(local, tmp, remote) for local, tmp, remote in uploads
+                           if local not in in_store or (local, remote) in not_linked]
+
+            upload_files(self.ssh.get_transport(),
+                         [(tmp, remote) for _, tmp, remote in uploads],
+                         concurrency=int(get_config().get('upload_concurrency', CONCURRENCY)),
+                         ftp=self.ftp)
+            self.uploaded_files.update(remote_files)
+
+            if store is not None:
+                store.add([(local, (self.remote_dir / local.name).as_posix())
+                           for local in [*uploaded, *(local for local, _, _ in uploads)]
+                           if local != acf_file])
+
+    def run_submit_cmd(self, *args: str, **kwargs) -> int:
+        """Run `submit_cmd` with the given positional arguments and `--key value` options
+
+        Returns
+        -------
+        int
+            The job ID from the submission response
+        """
+        cmd = [self.submit_cmd, *args]
 
         for k, v in kwargs.items():
             cmd += [f'--{k}', str(v)]
@@ -209,11 +485,283 @@ class HPCSession():
         output = stdout.read().decode()
         LOG.info(f'Output: {output}')
         if not RE_SUBMISSION_RESPONSE.match(output):
-            raise RuntimeError(f'Could not submit {acf_file} to the cluster.\n'
-                               f'Output: {output}.\n'
+            error = stderr.read().decode()
+            exc_type = (SubmissionBackpressure if RE_BACKPRESSURE.search(output + error)
+                        else RuntimeError)
+            raise exc_type(f'Could not submit {" ".join(args)} to the cluster.\n'
+                           f'Output: {output}.\n'
+                           f'Error: {error}')
+
+        return int(RE_SUBMISSION_RESPONSE.match(output).group(1))
+
+    def submit_array(self,
+                     acf_files: List[Path],
+                     adm_files: List[Path],
+                     aux_files: List[List[Path]],
+                     throttle: int = None,
+                     transfer_mode: str = None,
+                     journal: Journal = None,
+                     **kwargs):
+        """Upload several jobs and submit them as Slurm job arrays
+
+        Each job is uploaded to its own temporary directory. A task file listing the remote ACF
+        files (one per line, in order) is written to a separate batch directory and passed to
+        `submit_cmd` with `--array <task file>`. The submit command must run task `i` (the
+        `SLURM_ARRAY_TASK_ID`) using the ACF on line `i + 1`, with the job directory as its working
+        directory and the ACF name as its job name, and should put the task file in the array's
+        comment (see `hpc_scripts/slurm.py`). Batches larger than the cluster's MaxArraySize are
+        split into several arrays.
+
+        Parameters
+        ----------
+        acf_files : List[Path]
+            The ACF files to submit
+        adm_files : List[Path]
+            The ADM files to submit
+        aux_files : List[List[Path]]
+            Auxiliary files for each job
+        throttle : int, optional
+            The maximum number of array tasks that may run at once in each array, by default None (no
+            limit)
+        journal : Journal, optional
+            If given, the progress of each job is recorded in it. Jobs it says were uploaded are
+            not uploaded again, and jobs it says were submitted (or that were being submitted and
+            can be found on the cluster, see `find_array_tasks`) are not submitted again. By
+            default None.
+
+        Returns
+        -------
+        Tuple[List[Path], List[str], List[str]]
+            The remote directories, job names and array task job IDs (`<array job id>_<task id>`)
+        """
+        entries = dict(journal.entries) if journal is not None else {}
+
+        # Jobs whose array was being submitted when the batch was interrupted may be on the cluster.
+        # Those that can't be found anywhere (sacct or squeue) were never submitted.
+        submitting = {i: e for i, e in entries.items() if e['state'] == SUBMITTING}
+        if submitting:
+            found = self.find_array_tasks(submitting)
+            LOG.info(f'{len(found)} of {len(submitting)} interrupted array tasks were submitted')
+            if journal is not None and found:
+                journal.record_many({i: {'remote_dir': submitting[i]['remote_dir'],
+                                         'job_name': submitting[i]['job_name'],
+                                         'job_id': job_id}
+                                     for i, job_id in found.items()}, SUBMITTED)
+                entries = dict(journal.entries)
+
+        remote_dirs: List[Path] = []
+        job_names: List[str] = []
+        job_ids: List[str] = []
+        for i, (acf_file, adm_file, aux_file) in enumerate(zip(acf_files, adm_files, aux_files)):
+            entry = entries.get(i)
+            if entry is not None:
+                remote_dirs.append(Path(entry['remote_dir']))
+                job_names.append(entry['job_name'])
+                job_ids.append(entry['job_id'] if entry['state'] == SUBMITTED else None)
+                continue
+
+            self.upload_job(acf_file, adm_file, aux_file, transfer_mode)
+            remote_dirs.append(self.remote_dir)
+            job_names.append(self.job_name)
+            job_ids.append(None)
+
+            if journal is not None:
+                journal.record(i, UPLOADED, remote_dir=self.remote_dir.as_posix(),
+                               job_name=self.job_name)
+
+        if throttle is not None:
+            kwargs['throttle'] = throttle
+
+        # Only the jobs that aren't on the cluster yet go in the task files
+        to_submit = [i for i, job_id in enumerate(job_ids) if job_id is None]
+        if not to_submit:
+            return remote_dirs, job_names, job_ids
+
+        batch_dir = self.mkdtemp_remote('array')
+        max_array_size = self.get_max_array_size()
+        for start in range(0, len(to_submit), max_array_size):
+            chunk = to_submit[start:start + max_array_size]
+            task_file = (batch_dir / f'tasks_{start // max_array_size}.txt').as_posix()
+            with self.ftp.open(task_file, 'w') as fid:
+                fid.write(''.join(f'{(remote_dirs[i] / acf_files[i].name).as_posix()}\n'
+                                  for i in chunk))
+
+            if journal is not None:
+                journal.record_many({i: {'remote_dir': remote_dirs[i].as_posix(),
+                                         'job_name': job_names[i],
+                                         'task_file': task_file,
+                                         'task_id': task_id}
+                                     for task_id, i in enumerate(chunk)}, SUBMITTING)
+
+            array_job_id = self.run_submit_cmd(array=task_file, **kwargs)
+            self.job_id = array_job_id
+            for task_id, i in enumerate(chunk):
+                job_ids[i] = f'{array_job_id}_{task_id}'
+
+            if journal is not None:
+                journal.record_many({i: {'remote_dir': remote_dirs[i].as_posix(),
+                                         'job_name': job_names[i],
+                                         'job_id': job_ids[i]}
+                                     for i in chunk}, SUBMITTED)
+
+        for i in to_submit:
+            self._index_submission(job_ids[i], job_names[i], remote_dirs[i], acf_files[i],
+                                   [acf_files[i], adm_files[i], *aux_files[i]])
+
+        return remote_dirs, job_names, job_ids
+
+    def find_array_tasks(self, entries: Dict[int, dict]) -> Dict[int, str]:
+        """Find the array tasks that were submitted for journal entries left `SUBMITTING`
+
+        A task is found by its working directory, or, if the array was submitted but its tasks were
+        not given their own directories yet, by the task file in the array's submit line or
+        comment. Both the job table (sacct) and the queue (`get_queued_jobs`) are searched, since
+        sacct may not show an array that was submitted moments ago.
+
+        Parameters
+        ----------
+        entries : Dict[int, dict]
+            Journal entries with `remote_dir`, `task_file` and `task_id`
+
+        Returns
+        -------
+        Dict[int, str]
+            The job ID of each entry that was found
+
+        Raises
+        ------
+        RuntimeError
+            If an entry wasn't found but a queued job is running from its task file's directory
+            (i.e. the array may have been submitted but can't be matched to its task file)
+        """
+        table = self.get_job_table()
+        if 'State' in table:
+            # e.g. an array cancelled by the submit command because it couldn't be released
+            never_ran = table['State'].astype(str).str.startswith('CANCELLED') & table['Start'].isna()
+            table = table[~never_ran]
+
+        queued = self.get_queued_jobs()
+        df = pd.concat([table.assign(Comment=''), queued.assign(SubmitLine='')], ignore_index=True)
+        job_ids = df['JobID'].astype(str)
+        by_workdir = dict(zip(df['WorkDir'].astype(str), job_ids))
+
+        found = {}
+        for i, entry in entries.items():
+            if entry['remote_dir'] in by_workdir:
+                found[i] = by_workdir[entry['remote_dir']]
+                continue
+
+            task_file = entry['task_file']
+            arrays = job_ids[df['SubmitLine'].astype(str).str.contains(task_file, regex=False)
+                             | (df['Comment'].astype(str) == task_file)]
+            if len(arrays) > 0:
+                found[i] = f'{arrays.iloc[-1].split("_")[0]}_{entry["task_id"]}'
+
+        missing = [e for i, e in entries.items() if i not in found]
+        batch_dirs = {Path(e['task_file']).parent.as_posix() for e in missing}
+        uncertain = queued[queued['WorkDir'].astype(str).isin(batch_dirs)]
+        if len(uncertain) > 0:
+            raise RuntimeError(f'{len(missing)} jobs of this batch were being submitted when it was '
+                               f'interrupted, and jobs {", ".join(uncertain["JobID"])} are queued '
+                               f'in {", ".join(sorted(batch_dirs))}. They were not submitted again '
+                               'in case they are those jobs. Check the queue (squeue) before '
+                               'running the batch again.')
+
+        return found
+
+    def get_queued_jobs(self) -> pd.DataFrame:
+        """Get the user's jobs that are known to the controller (`squeue`), one row per array task
+
+        Unlike the job table, this includes jobs the moment they are submitted.
+
+        Returns
+        -------
+        pd.DataFrame
+            The JobID, WorkDir and Comment of each job
+        """
+        _, stdout, stderr = self.ssh.exec_command(f'squeue -r -h -u {self.username} -o "%i|%Z|%k"')
+        stdout = stdout.read().decode()
+        stderr = stderr.read().decode()
+        if stderr != '':
+            raise RuntimeError(f'Error while getting the job queue: {stderr}')
+
+        rows = [line.split('|', 2) for line in stdout.splitlines() if line.strip()]
+        return pd.DataFrame(rows, columns=['JobID', 'WorkDir', 'Comment'])
+
+    def find_job_id(self, remote_dir: Path):
+        """Get the ID of the most recent job that ran in `remote_dir` (None if there isn't one)
+
+        Array tasks have IDs of the form `<array job id>_<task id>`, which are returned as strings.
+        """
+        df = self.get_job_table()
+        matches = df[df['WorkDir'] == Path(remote_dir).as_posix()]
+        if len(matches) == 0:
+            return None
+
+        job_id = str(matches['JobID'].iloc[-1])
+        return int(job_id) if job_id.isdigit() else job_id
+
+    def get_max_array_size(self) -> int:
+        """Get the cluster's MaxArraySize (the number of tasks allowed in one job array)"""
+        _, stdout, _ = self.ssh.exec_command('scontrol show config')
+        match = re.search(r'^MaxArraySize\s*=\s*(\d+)', stdout.read().decode(), flags=re.MULTILINE)
+        return int(match.group(1)) if match is not None else MAX_ARRAY_SIZE
+
+    def get_asset_store(self):
+        """Get the content addressed store of uploaded files (None if it is disabled)"""
+        config = get_config()
+        if self.remote_tempdir is None or not is_enabled(config, 'asset_store'):
+            return None
+
+        return AssetStore(self.ssh,
+                          f'{self.username}@{self.host}',
+                          self.remote_tempdir,
+                          max_size=int(float(config.get('asset_store_max_size', STORE_MAX_SIZE))),
+                          min_size=int(float(config.get('asset_store_min_size', STORE_MIN_SIZE))),
+                          min_age=float(config.get('asset_store_min_age', STORE_MIN_AGE)))
+
+    def upload_archive(self, name: str, files: List[Path], n_rand=4) -> Path:
+        """Create a temporary directory on the cluster and unpack `files` into it
+
+        The files are sent as a single gzipped tar stream over one exec channel, and the directory
+        is created, its permissions set and the archive unpacked by a single remote command.
+
+        Parameters
+        ----------
+        name : str
+            The prefix of the temporary directory
+        files : List[Path]
+            Local files to send. They are placed at the top level of the directory.
+
+        Returns
+        -------
+        Path
+            The remote directory
+        """
+        mktemp = 'mktemp -d'
+        if self.remote_tempdir:
+            mktemp += f' -p {self.remote_tempdir.as_posix()}'
+        mktemp += f' {name}.' + 'X' * n_rand
+
+        cmd = f'd=$({mktemp}) && chmod 775 "$d" && tar -xzf - -C "$d" && echo "$d"'
+        stdin, stdout, stderr = self.ssh.exec_command(cmd)
+
+        size = sum(f.stat().st_size for f in files)
+        t_start = time.perf_counter()
+        with tarfile.open(fileobj=stdin, mode='w|gz') as tar:
+            for file in files:
+                tar.add(file, arcname=file.name)
+        stdin.close()
+
+        if stdout.channel.recv_exit_status() != 0:
+            raise RuntimeError(f'Could not upload the archive for {name}.\n'
                                f'Error: {stderr.read().decode()}')
 
-        self.job_id = int(RE_SUBMISSION_RESPONSE.match(output).group(1))
+        elapsed = max(time.perf_counter() - t_start, 1e-6)
+        LOG.info(f' Uploaded archive of {len(files)} files '
+                 f'({size*1e-6:.1f} MB in {elapsed:.1f} s, {size*1e-6/elapsed:.1f} MB/s)')
+
+        return Path(stdout.read().decode().strip())
 
     def mkdtemp_remote(self, name=None, n_rand=4):
         """Create a temporary directory on the cluster"""
@@ -234,8 +782,29 @@ class HPCSession():
         return remote_dir
 
     def get_job_table(self, days=7):
+        """Get the jobs of the last `days` days
+
+        Unless the `job_table_cache` setting is disabled, the table is kept in a process-wide cache
+        and only the jobs that changed since the previous call are queried (see `job_cache`).
+        """
+        if not is_enabled(get_config(), 'job_table_cache'):
+            df = self.query_job_table(f'now-{days:.0f}days')
+        else:
+            df = get_job_cache(f'{self.username}@{self.host}', days).refresh(self.query_job_table)
+
+        if is_enabled(get_config(), 'job_index'):
+            try:
+                get_job_index().record_states(f'{self.username}@{self.host}', df)
+            except (sqlite3.Error, OSError) as err:
+                LOG.warning(f'Could not update the job index: {err}')
+
+        return df
+
+    def query_job_table(self, start: str) -> pd.DataFrame:
+        """Run sacct for the jobs active since `start` (any time format sacct accepts, e.g.
+        now-7days)"""
         cmd = ['sacct',
-               f'-S now-{days:.0f}days',
+               f'-S {start}',
                '-X',
                '-P',
                '--delimiter=,',
@@ -247,7 +816,7 @@ class HPCSession():
         if stderr != '':
             raise RuntimeError(f'Error while getting job table: {stderr}')
 
-        df = pd.read_csv(stdout, delimiter=',')
+        df = pd.read_csv(stdout, delimiter=',', dtype={'JobID': str})
         df = df.assign(
             JobName=df['JobName'].str.replace('.slurm', ''),
             Elapsed=df['Elapsed'].str.replace('Unknown', '00:00:00'),
@@ -255,7 +824,7 @@ class HPCSession():
             Start=pd.to_datetime(df['Start'].str.replace('Unknown', '')).dt.strftime('%G-%m-%dT%H:%M:%S'),
         )
 
-        return df.sort_values('JobID')
+        return sort_by_job_id(df)
 
     @property
     def last_update(self):
@@ -283,6 +852,65 @@ class HPCSession():
         return [parse_ls_output(line) for line in stdout.read().decode().splitlines()
                 if line.strip() != '' and not line.startswith('total')]
 
+    def get_dirs_status(self, remote_dirs: List[Path]) -> Dict[str, dict]:
+        """Get the files, last update and completion of several job directories in one exec call
+
+        Parameters
+        ----------
+        remote_dirs : List[Path]
+            The remote directories of the jobs
+
+        Returns
+        -------
+        Dict[str, dict]
+            The status of each directory, keyed by its posix path (see `dir_status`)
+        """
+        remote_dirs = [Path(d).as_posix() for d in remote_dirs]
+        if not remote_dirs:
+            return {}
+
+        _, stdout, _ = self.ssh.exec_command(status_command(remote_dirs))
+        return parse_status_output(stdout.read().decode(), remote_dirs)
+
+    def check_if_finished_and_get_errors(self,
+                                         remote_dir: Path = None,
+                                         ignore_static: bool = False,
+                                         ignore_parse: bool = False):
+        """Check whether a job has finished and get the errors in its .msg file
+
+        Only the part of the .msg file that was appended since the last check is read from the
+        cluster (see `msg.MsgTail`).
+
+        Parameters
+        ----------
+        remote_dir : Path, optional
+            The remote directory of the job, by default `self.remote_dir`
+        ignore_static : bool, optional
+            Ignore failed static equilibrium errors, by default False
+        ignore_parse : bool, optional
+            Ignore command parsing errors, by default False
+
+        Returns
+        -------
+        bool
+            True if the job has finished
+        List[str]
+            The errors in the .msg file
+        """
+        remote_dir = Path(remote_dir) if remote_dir is not None else self.remote_dir
+        tail = get_tail(remote_dir, f'{self.username}@{self.host}').update(self.ftp)
+        errors = tail.errors
+
+        if ignore_static:
+            errors = [e for e in errors
+                      if 'static equilibrium analysis has not been successful' not in e.lower()]
+
+        if ignore_parse:
+            errors = [e for e in errors
+                      if 'errors found parsing command. command ignored.' not in e.lower()]
+
+        return tail.finished, errors
+
     def get_job_messages(self):
         """Checks the files in the remote directory and returns a summary of the job
 
@@ -304,6 +932,15 @@ class HPCSession():
 
         return msg
 
+    def cancel_job(self, job_id: Union[int, str] = None):
+        """Cancel a job (`scancel`), by default `job_id`"""
+        job_id = job_id if job_id is not None else self.job_id
+        _, stdout, stderr = self.ssh.exec_command(f'scancel {job_id}')
+        stdout.channel.recv_exit_status()
+        error = stderr.read().decode()
+        if error != '':
+            raise RuntimeError(f'Could not cancel job {job_id}.\nError: {error}')
+
     def resubmit_job(self, remote_dir: Path, **kwargs):
         """Resubmit a in a given remote directory"""
         self.ssh.exec_command(f'rm {remote_dir.as_posix()}/*.slurm')
@@ -313,26 +950,38 @@ class HPCSession():
         except StopIteration as err:
             raise StopIteration(f'No ACF file found in {remote_dir}') from err
 
-        cmd = [self.submit_cmd, acf_file.as_posix()]
-        for k, v in kwargs.items():
-            cmd += [f'--{k}', str(v)]
-
-        _, stdout, stderr = self.ssh.exec_command(' '.join(cmd))
-        output = stdout.read().decode()
-
-        LOG.info(f'Output: {output}')
-        if not RE_SUBMISSION_RESPONSE.match(output):
-            raise RuntimeError(f'Could not submit {acf_file} to the cluster.\n'
-                               f'Output: {output}.\n'
-                               f'Error: {stderr.read().decode()}')
-
-        self.job_id = int(RE_SUBMISSION_RESPONSE.match(output).group(1))
+        self.job_id = self.run_submit_cmd(acf_file.as_posix(), **kwargs)
         self.remote_dir = remote_dir
         self.job_name = remote_dir.stem
+        self._index_submission(self.job_id, self.job_name, self.remote_dir)
+
+    def _index_submission(self,
+                          job_id: Union[int, str],
+                          job_name: str,
+                          remote_dir: Path,
+                          acf_file: Path = None,
+                          input_files: List[Path] = None):
+        """Record a submission in the job index (unless the `job_index` setting is disabled)"""
+        if not is_enabled(get_config(), 'job_index'):
+            return
+
+        try:
+            get_job_index().record_submission(f'{self.username}@{self.host}', job_id, job_name,
+                                              remote_dir, acf_file, input_files)
+        except (sqlite3.Error, OSError) as err:
+            LOG.warning(f'Could not record job {job_id} in the job index: {err}')
+
+    def close(self, discard: bool = False):
+        """Return the connection to the pool
 
-    def close(self):
-        self.ssh.close()
-        self.ftp.close()
+        Parameters
+        ----------
+        discard : bool, optional
+            If True, close the connection instead of returning it to the pool, by default False
+        """
+        if self._conn is not None:
+            get_pool().release(self.host, self.username, self._conn, discard=discard)
+            self._conn = None
 
 
 def parse_ls_output(line: str) -> Dict[str, Union[str, int, datetime.datetime]]:
@@ -435,6 +1084,10 @@ def hpc_session(host=None,
 
     try:
         yield session
+    except (SSHException, EOFError, ConnectionError, socket.timeout):
+        # Don't return a connection that may be broken to the pool
+        session.close(discard=True)
+        raise
     finally:
         session.close()
 
@@ -474,12 +1127,125 @@ def submit(acf_file: Path,
         return hpc.remote_dir, hpc.job_name, hpc.job_id
 
 
+def enqueue_submit(acf_file: Path,
+                   adm_file: Path = None,
+                   aux_files: List[Path] = None,
+                   priority: int = 0,
+                   ncpus: int = None,
+                   max_user_jobs: int = None,
+                   max_cpus: int = None,
+                   host=None,
+                   username=None,
+                   start: bool = True,
+                   **kwargs) -> int:
+    """Add a submission to the local queue and return straight away (see `scheduler`)
+
+    Parameters
+    ----------
+    acf_file : Path
+        The path to the ACF file to submit
+    adm_file : Path, optional
+        The path to the ADM file to submit, by default None
+    aux_files : List[Path], optional
+        A list of auxiliary files to submit, by default None
+    priority : int, optional
+        Submissions with a higher priority are released first, by default 0
+    ncpus : int, optional
+        The number of CPUs the job will use, by default the `nthreads` in the ACF file or 1
+    max_user_jobs : int, optional
+        Only submit while the user has fewer active jobs than this, by default the
+        `queue_max_jobs` config setting (no limit if that isn't set)
+    max_cpus : int, optional
+        Only submit if the user's active jobs and this one use no more CPUs than this, by default
+        the `queue_max_cpus` config setting (no limit if that isn't set)
+    start : bool, optional
+        Start a scheduler thread in this process if one isn't running, by default True
+    **kwargs
+        Passed to the submit command
+
+    Returns
+    -------
+    int
+        The ticket (see `get_ticket`)
+    """
+    config = get_config()
+    host, username = host or config.get('host'), username or config.get('username')
+
+    if ncpus is None:
+        match = RE_NTHREADS.search(Path(acf_file).read_text())
+        ncpus = int(match.group(1)) if match else 1
+
+    request = {'acf_file': Path(acf_file).absolute().as_posix(),
+               'adm_file': Path(adm_file).absolute().as_posix() if adm_file is not None else None,
+               'aux_files': [Path(f).absolute().as_posix() for f in aux_files or []],
+               **{k: str(v) for k, v in kwargs.items()}}
+    ticket = get_submit_queue().enqueue(f'{username}@{host}', request, priority=priority,
+                                        ncpus=ncpus, max_jobs=max_user_jobs, max_cpus=max_cpus)
+    LOG.info(f'{acf_file} queued as ticket {ticket}')
+
+    if start:
+        _get_scheduler(host, username).start()
+
+    return ticket
+
+
+def get_ticket(ticket: int) -> dict:
+    """Get the state of a queued submission (`pending`, `submitting`, `submitted`, `failed` or
+    `cancelled`) and, once it has been submitted, its remote_dir, job_name and job_id"""
+    info = get_submit_queue().get(ticket)
+    if info is None:
+        raise RuntimeError(f'No such ticket: {ticket}')
+
+    return info
+
+
+def cancel_ticket(ticket: int) -> bool:
+    """Remove a submission from the queue. Returns False if it has already been released."""
+    return get_submit_queue().cancel(ticket)
+
+
+def run_queue(host=None, username=None):
+    """Release the queued submissions of a cluster in the foreground until there are none left"""
+    config = get_config()
+    _get_scheduler(host or config.get('host'), username or config.get('username')).run()
+
+
+def get_submit_queue() -> SubmitQueue:
+    """Get the submission queue (in the `queue_file` config setting or `scheduler.QUEUE_FILE`)"""
+    global _SUBMIT_QUEUE
+    with _SUBMIT_QUEUE_LOCK:
+        if _SUBMIT_QUEUE is None:
+            _SUBMIT_QUEUE = SubmitQueue(Path(get_config().get('queue_file', QUEUE_FILE)))
+
+    return _SUBMIT_QUEUE
+
+
+def _get_scheduler(host: str, username: str):
+    def submit_ticket(acf_file: str, adm_file: str = None, aux_files: list = None, **kwargs):
+        return submit(Path(acf_file),
+                      Path(adm_file) if adm_file is not None else None,
+                      [Path(f) for f in aux_files or []],
+                      host=host,
+                      username=username,
+                      **kwargs)
+
+    return get_scheduler(get_submit_queue(),
+                         f'{username}@{host}',
+                         lambda: hpc_session(host=host, username=username),
+                         submit_ticket)
+
+
 def submit_multi(acf_files: List[Path],
                  adm_files: List[Path],
                  aux_files: List[List[Path]] = None,
                  host=None,
                  username=None,
                  max_user_jobs: int = None,
+                 array: bool = False,
+                 array_throttle: int = None,
+                 workers: int = None,
+                 callback: Callable[[int, Path, str, int], None] = None,
+                 resume: bool = None,
                  **kwargs):
     """Submit multiple ACF files to the cluster
 
@@ -491,6 +1257,22 @@ def submit_multi(acf_files: List[Path],
         A list of ADM files to submit, by default None
     aux_files : List[List[Path]], optional
         A list of lists of auxiliary files to submit, by default None
+    array : bool, optional
+        If True, submit all jobs with a single `sbatch --array` call (see
+        `HPCSession.submit_array`). The job IDs are then strings of the form
+        `<array job id>_<task id>`. By default False.
+    array_throttle : int, optional
+        The maximum number of array tasks that may run at once, by default None
+    workers : int, optional
+        The number of jobs uploaded and submitted concurrently, each over its own connection, by
+        default the `submit_workers` config setting or 1. Submit commands are spaced out
+        adaptively based on the scheduler's responses (see `Pacer`).
+    callback : Callable[[int, Path, str, int], None], optional
+        Called with (index, remote_dir, job_name, job_id) as each job is accepted, by default None
+    resume : bool, optional
+        If True, record the progress of the batch in a `Journal` so that running the same batch
+        again after an interruption skips the jobs that were already uploaded or submitted, by
+        default the `submit_journal` config setting or True
 
     Returns
     -------
@@ -502,50 +1284,153 @@ def submit_multi(acf_files: List[Path],
     if aux_files is None:
         aux_files = [[]] * len(acf_files)
 
-    remote_dirs: List[Path] = []
-    job_names: List[str] = []
-    job_ids: List[int] = []
-    with hpc_session(host=host, username=username) as hpc:
-        for acf_file, adm_file, aux_file in zip(acf_files, adm_files, aux_files):
+    if resume is None:
+        resume = is_enabled(get_config(), 'submit_journal')
+    journal = (Journal.for_batch(acf_files, adm_files, aux_files, array=array, **kwargs)
+               if resume else None)
+
+    if array:
+        if journal is not None and all(journal.entries.get(i, {}).get('state') == SUBMITTED
+                                       for i in range(len(acf_files))):
+            entries = [journal.entries[i] for i in range(len(acf_files))]
+            journal.complete()
+            return ([Path(e['remote_dir']) for e in entries],
+                    [e['job_name'] for e in entries],
+                    [e['job_id'] for e in entries])
+
+        with hpc_session(host=host, username=username) as hpc:
+            if max_user_jobs is not None:
+                hpc.wait_for_user_jobs(max_user_jobs)
+
+            results = hpc.submit_array(acf_files, adm_files, aux_files, throttle=array_throttle,
+                                       journal=journal, **kwargs)
+
+        if journal is not None:
+            journal.complete()
+
+        return results
+
+    workers = int(workers or get_config().get('submit_workers', 1))
+    pacer = Pacer()
+    n_submitted = 0
+    n_lock = threading.Lock()
+
+    def submit_one(i: int):
+        nonlocal n_submitted
+        entry = journal.entries.get(i) if journal is not None else None
+        if entry is not None and entry['state'] == SUBMITTED:
+            LOG.info(f'{acf_files[i]} was already submitted as job {entry["job_id"]}.')
+            return Path(entry['remote_dir']), entry['job_name'], entry['job_id']
+
+        remote_dir, job_name, job_id = _submit_with_retries(acf_files[i], adm_files[i], aux_files[i],
+                                                            pacer, host, username, max_user_jobs,
+                                                            journal=journal, index=i, **kwargs)
+        with n_lock:
+            n_submitted += 1
+            LOG.info(f'[{n_submitted}/{len(acf_files)}] {acf_files[i]} submitted as job {job_id}.')
+
+        if callback is not None:
+            callback(i, remote_dir, job_name, job_id)
+
+        return remote_dir, job_name, job_id
+
+    if workers > 1:
+        LOG.info(f'Submitting {len(acf_files)} jobs with {workers} workers')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(submit_one, range(len(acf_files))))
+    else:
+        results = [submit_one(i) for i in range(len(acf_files))]
 
-            # This is in a loop so that it can keep trying if there is a connection issue
-            for i in range(N := 120):
-                try:
+    if journal is not None:
+        journal.complete()
 
-                    if max_user_jobs is not None:
-                        hpc.wait_for_user_jobs(max_user_jobs)
+    remote_dirs = [r[0] for r in results]
+    job_names = [r[1] for r in results]
+    job_ids = [r[2] for r in results]
 
-                    hpc.submit(acf_file, adm_file, aux_file, _ignore_resubmit=True, **kwargs)
-                    remote_dirs.append(hpc.remote_dir)
-                    job_names.append(hpc.job_name)
-                    job_ids.append(hpc.job_id)
+    return remote_dirs, job_names, job_ids
 
-                except (SSHException, ConnectionResetError) as err:
-                    # This may happen if the VPN disconnects
-                    LOG.warning(f'Could not submit {acf_file} to the cluster. '
-                                f'due to the following error: {err}')
 
-                    if i < N-1:
-                        # Keep Trying
-                        LOG.warning('Waiting 60 seconds and trying again...')
-                        time.sleep(60)
+def _submit_with_retries(acf_file: Path,
+                         adm_file: Path,
+                         aux_files: List[Path],
+                         pacer: Pacer,
+                         host=None,
+                         username=None,
+                         max_user_jobs: int = None,
+                         n_retries: int = 120,
+                         journal: Journal = None,
+                         index: int = None,
+                         **kwargs):
+    """Upload and submit one job, retrying on connection errors and scheduler backpressure
+
+    The upload happens outside of `pacer` so that other threads can upload at the same time. Only
+    the submit command is paced. If a `journal` is given, the job's progress is recorded in it under
+    `index`, and a job the journal says was already uploaded is submitted from its existing remote
+    directory (unless the job table shows it was submitted already).
+    """
+    # This is in a loop so that it can keep trying if there is a connection issue
+    for i in range(n_retries):
+        try:
+            with hpc_session(host=host, username=username) as hpc:
+                entry = journal.entries.get(index) if journal is not None else None
 
-                    else:
-                        # Waited long enough, raise the error
-                        raise err
+                if entry is not None and entry['state'] == UPLOADED:
+                    hpc.remote_dir = Path(entry['remote_dir'])
+                    hpc.job_name = entry['job_name']
+                    hpc.job_id = hpc.find_job_id(hpc.remote_dir)
 
                 else:
-                    # If successful...
-                    LOG.info(f'{acf_file} submitted.')
-                    break
-
-            LOG.info(f'Waiting {SLEEP_TIME} seconds before submitting the next job...')
-            time.sleep(SLEEP_TIME)
+                    hpc.upload_job(acf_file, adm_file, aux_files)
+                    hpc.job_id = None
+                    if journal is not None:
+                        journal.record(index, UPLOADED, remote_dir=hpc.remote_dir.as_posix(),
+                                       job_name=hpc.job_name)
+
+                submitted = hpc.job_id is None
+                while hpc.job_id is None:
+                    try:
+                        with pacer:
+                            if max_user_jobs is not None:
+                                hpc.wait_for_user_jobs(max_user_jobs)
+                            remote_acf = (hpc.remote_dir / acf_file.name).as_posix()
+                            hpc.job_id = hpc.run_submit_cmd(remote_acf, **kwargs)
+                    except SubmissionBackpressure as err:
+                        LOG.warning(f'{err}')
+
+                if journal is not None:
+                    journal.record(index, SUBMITTED, remote_dir=hpc.remote_dir.as_posix(),
+                                   job_name=hpc.job_name, job_id=hpc.job_id)
+
+                if submitted:
+                    hpc._index_submission(hpc.job_id, hpc.job_name, hpc.remote_dir, acf_file,
+                                          [acf_file, adm_file, *(aux_files or [])])
+
+                return hpc.remote_dir, hpc.job_name, hpc.job_id
+
+        except (SSHException, ConnectionResetError, EOFError) as err:
+            # This may happen if the VPN disconnects
+            LOG.warning(f'Could not submit {acf_file} to the cluster. '
+                        f'due to the following error: {err}')
+
+            if i < n_retries-1:
+                # Keep Trying
+                LOG.warning('Waiting 60 seconds and trying again...')
+                time.sleep(60)
 
-    return remote_dirs, job_names, job_ids
+            else:
+                # Waited long enough, raise the error
+                raise err
 
 
-def get_results(remote_dir: Path, local_dir: Path, host=None, username=None, extensions=None):
+def get_results(remote_dir: Path,
+                local_dir: Path,
+                host=None,
+                username=None,
+                extensions=None,
+                callback: Callable[[Path, int, int], None] = None,
+                sync: bool = False,
+                cache: bool = False):
     """Get the results files from the cluster
 
     Parameters
@@ -558,6 +1443,15 @@ def get_results(remote_dir: Path, local_dir: Path, host=None, username=None, ext
         Local path to place files
     extensions : List[str], optional
         A list of file extensionsto get (including the leading '.'), by default `RES_EXTS`
+    callback : Callable[[Path, int, int], None], optional
+        Called with (local file, bytes downloaded, total bytes) as each file progresses, by default
+        None
+    sync : bool, optional
+        If True, only fetch files (or the tails of files) that have changed since they were last
+        fetched into `local_dir`, by default False
+    cache : bool, optional
+        If True, also parse the .res, .req and .gra files into the local result cache, by default
+        False
 
     Returns
     -------
@@ -570,15 +1464,113 @@ def get_results(remote_dir: Path, local_dir: Path, host=None, username=None, ext
     LOG.debug(f'   host: {host}')
     LOG.debug(f'   username: {username}')
     LOG.debug(f'   extensions: {extensions}')
+    LOG.debug(f'   sync: {sync}')
+    LOG.debug(f'   cache: {cache}')
 
     with hpc_session(host=host,
                      username=username,
                      remote_dir=remote_dir) as hpc:
-        files = hpc.get_results(local_dir, extensions)
+        files = hpc.get_results(local_dir, extensions, callback=callback, sync=sync, cache=cache)
 
     return files
 
 
+def get_res_data(remote_dir: Path,
+                 components: List[str] = None,
+                 host=None,
+                 username=None) -> Dict[str, np.ndarray]:
+    """Read components from a job's .res file without downloading it to disk
+
+    Parameters
+    ----------
+    remote_dir : Path
+        The remote directory of the job
+    components : List[str], optional
+        The components to read (`<entity>.<component>` or `<entity>`), by default all
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        The values of each component for every step in the file
+    """
+    with hpc_session(host=host, username=username, remote_dir=remote_dir) as hpc:
+        data = concat_blocks(hpc.iter_res(components))
+
+    return data
+
+
+def extract_results(remote_dir: Path,
+                    channels: List[str] = None,
+                    host=None,
+                    username=None) -> Dict[str, np.ndarray]:
+    """Extract components from a job's .res file on the cluster and get only those
+
+    Parameters
+    ----------
+    remote_dir : Path
+        The remote directory of the job
+    channels : List[str], optional
+        The components to extract (`<entity>.<component>` or `<entity>`), by default all
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        The values of each component for every step in the file
+    """
+    with hpc_session(host=host, username=username, remote_dir=remote_dir) as hpc:
+        data = hpc.extract_results(channels)
+
+    return data
+
+
+def load_results(remote_dir: Path,
+                 extension: str = '.res',
+                 host=None,
+                 username=None) -> Dict[str, np.ndarray]:
+    """Load a parsed result file of a job, from the local result cache if it is up to date
+
+    Parameters
+    ----------
+    remote_dir : Path
+        The remote directory of the job
+    extension : str, optional
+        '.res', '.req' or '.gra', by default '.res'
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        The columns of the file (see `result_cache.parse_result_file`)
+    """
+    with hpc_session(host=host, username=username, remote_dir=remote_dir) as hpc:
+        data = hpc.load_results(extension)
+
+    return data
+
+
+def get_fixed_width_data(remote_dir: Path,
+                         extension: str = '.req',
+                         host=None,
+                         username=None) -> FixedWidthData:
+    """Read a job's .req or .gra file from the cluster without writing it to disk
+
+    Parameters
+    ----------
+    remote_dir : Path
+        The remote directory of the job
+    extension : str, optional
+        '.req' or '.gra', by default '.req'
+
+    Returns
+    -------
+    FixedWidthData
+        The time and values of each output step (see `fixed_width.read_fixed_width`)
+    """
+    with hpc_session(host=host, username=username, remote_dir=remote_dir) as hpc:
+        data = hpc.read_remote_file(extension)
+
+    return read_fixed_width(data)
+
+
 def get_job_table(host=None, username=None) -> pd.DataFrame:
     with hpc_session(host=host, username=username) as hpc:
         df = hpc.get_job_table()
@@ -586,6 +1578,11 @@ def get_job_table(host=None, username=None) -> pd.DataFrame:
     return df
 
 
+def query_jobs(**kwargs) -> pd.DataFrame:
+    """Find jobs in the local job index. See `JobIndex.query` for the arguments."""
+    return get_job_index().query(**kwargs)
+
+
 def get_job_messages(remote_dir: Path, host=None, username=None):
     with hpc_session(host=host, username=username, remote_dir=remote_dir) as hpc:
         msg = hpc.get_job_messages()
@@ -607,27 +1604,88 @@ def get_remote_dir_status(remote_dir: Path, host=None, username=None):
     return status
 
 
+def get_dirs_status(remote_dirs: List[Path], host=None, username=None) -> Dict[str, dict]:
+    with hpc_session(host=host, username=username) as hpc:
+        status = hpc.get_dirs_status(remote_dirs)
+
+    return status
+
+
 def resubmit_job(remote_dir: Path, host=None, username=None, **kwargs):
     with hpc_session(host=host, username=username) as hpc:
         hpc.resubmit_job(remote_dir, **kwargs)
         return hpc.remote_dir, hpc.job_name, hpc.job_id
 
 
-def check_if_finished(remote_dir: Path):
-    with TemporaryDirectory() as tmpdir:
-        try:
-            msg_file = next(f for f in get_results(remote_dir,
-                                                   Path(tmpdir),
-                                                   extensions=['.msg']))
-        except StopIteration:
-            finished = False
+def cancel_job(job_id: Union[int, str], host=None, username=None):
+    with hpc_session(host=host, username=username) as hpc:
+        hpc.cancel_job(job_id)
 
-        else:
-            finished = check_if_msg_finished(msg_file)
 
+def check_if_finished(remote_dir: Path, host=None, username=None):
+    finished, _ = check_if_finished_and_get_errors(remote_dir, host=host, username=username)
     return finished
 
 
+def check_if_finished_and_get_errors(remote_dir: Path,
+                                     ignore_static: bool = False,
+                                     ignore_parse: bool = False,
+                                     host=None,
+                                     username=None):
+    with hpc_session(host=host, username=username) as hpc:
+        finished, errors = hpc.check_if_finished_and_get_errors(Path(remote_dir),
+                                                                ignore_static=ignore_static,
+                                                                ignore_parse=ignore_parse)
+
+    return finished, errors
+
+
+def wait_for_jobs(remote_dirs: List[Path] = None,
+                  job_ids: List[Union[int, str]] = None,
+                  timeout: float = None,
+                  ignore_static: bool = False,
+                  ignore_parse: bool = False,
+                  callback: Callable[[WaitResult], None] = None,
+                  host=None,
+                  username=None) -> List[WaitResult]:
+    """Wait for several jobs to finish (see `waiter.Waiter`)
+
+    Parameters
+    ----------
+    remote_dirs : List[Path], optional
+        The remote directories of the jobs
+    job_ids : List[Union[int, str]], optional
+        The job IDs. If `remote_dirs` is also given, they must be in the same order.
+    timeout : float, optional
+        Give up after this many seconds, by default None (wait forever)
+    ignore_static : bool, optional
+        Ignore failed static equilibrium errors, by default False
+    ignore_parse : bool, optional
+        Ignore command parsing errors, by default False
+    callback : Callable[[WaitResult], None], optional
+        Called with each job as it finishes, by default None
+
+    Returns
+    -------
+    List[WaitResult]
+        The final state and errors of each job
+    """
+    if remote_dirs is not None and job_ids is not None and len(remote_dirs) != len(job_ids):
+        raise ValueError('The number of job IDs must match the number of remote directories')
+
+    n_jobs = len(remote_dirs if remote_dirs is not None else job_ids or [])
+    remote_dirs = remote_dirs if remote_dirs is not None else [None] * n_jobs
+    job_ids = job_ids if job_ids is not None else [None] * n_jobs
+
+    waiter = Waiter(lambda: hpc_session(host=host, username=username),
+                    ignore_static=ignore_static,
+                    ignore_parse=ignore_parse)
+    for remote_dir, job_id in zip(remote_dirs, job_ids):
+        waiter.add(remote_dir, job_id)
+
+    return waiter.wait(timeout=timeout, callback=callback)
+
+
 def excepthook(exc_type: Type[Exception], exc_value: Exception, exc_tb: List[str]):
     """Print traceback to stderr"""
     print(''.join(tb.format_exception(exc_type, exc_value, exc_tb)), file=sys.stderr)
@@ -700,6 +1758,23 @@ def main():
                                      help=('A self imposed maximum number of jobs this user can '
                                            'have running at once.'),
                                      default=None)
+    submit_multi_parser.add_argument('--array',
+                                     action='store_true',
+                                     help='Submit all jobs as a single slurm job array')
+    submit_multi_parser.add_argument('--array-throttle',
+                                     type=int,
+                                     help='The maximum number of array tasks that may run at once',
+                                     default=None)
+    submit_multi_parser.add_argument('--workers', '-w',
+                                     type=int,
+                                     help='The number of jobs to upload and submit concurrently',
+                                     default=None)
+    submit_multi_parser.add_argument('--no-resume',
+                                     dest='resume',
+                                     action='store_false',
+                                     help=('Submit every job even if an interrupted run of the same '
+                                           'batch already submitted some of them'),
+                                     default=None)
     submit_multi_parser.set_defaults(command='submit_multi')
 
     # ----------------------------------------------------------------------------------------------
@@ -721,6 +1796,12 @@ def main():
                                     type=str,
                                     help='The username to connect with',
                                     default=None)
+    get_results_parser.add_argument('--sync', '-s',
+                                    action='store_true',
+                                    help='Only fetch files that have changed since the last fetch')
+    get_results_parser.add_argument('--cache',
+                                    action='store_true',
+                                    help='Also parse the result files into the local result cache')
     get_results_parser.set_defaults(command='get_results')
 
     # ----------------------------------------------------------------------------------------------
@@ -741,6 +1822,26 @@ def main():
                                               default=None)
     get_remote_dir_status_parser.set_defaults(command='get_remote_dir_status')
 
+    # ----------------------------------------------------------------------------------------------
+    # Get Dirs Status
+    # ----------------------------------------------------------------------------------------------
+    get_dirs_status_parser = subparsers.add_parser(
+        'get_dirs_status',
+        help='Get the files, last update and completion of several job directories at once')
+    get_dirs_status_parser.add_argument('remote_dirs',
+                                        type=Path,
+                                        nargs='+',
+                                        help='The remote directories of the jobs')
+    get_dirs_status_parser.add_argument('--host', '-H',
+                                        type=str,
+                                        help='The host to connect to',
+                                        default=None)
+    get_dirs_status_parser.add_argument('--username', '-u',
+                                        type=str,
+                                        help='The username to connect with',
+                                        default=None)
+    get_dirs_status_parser.set_defaults(command='get_dirs_status')
+
     # ----------------------------------------------------------------------------------------------
     # Set Config
     # ----------------------------------------------------------------------------------------------
@@ -787,6 +1888,45 @@ def main():
                                                  help='Get the job table')
     get_job_table_parser.set_defaults(command='get_job_table')
 
+    # ----------------------------------------------------------------------------------------------
+    # Query Jobs
+    # ----------------------------------------------------------------------------------------------
+    query_jobs_parser = subparsers.add_parser('query_jobs',
+                                              help='Find jobs in the local job index')
+    query_jobs_parser.add_argument('--job_id', '-j',
+                                   type=str,
+                                   default=None,
+                                   help='The job ID')
+    query_jobs_parser.add_argument('--job_name', '-n',
+                                   type=str,
+                                   default=None,
+                                   help='A pattern the job name must match (%% matches anything)')
+    query_jobs_parser.add_argument('--state', '-s',
+                                   type=str,
+                                   default=None,
+                                   help='The state of the job (e.g. FAILED)')
+    query_jobs_parser.add_argument('--since',
+                                   type=str,
+                                   default=None,
+                                   help='Only jobs submitted at or after this date (e.g. 2024-06-01)')
+    query_jobs_parser.add_argument('--until',
+                                   type=str,
+                                   default=None,
+                                   help='Only jobs submitted before this date')
+    query_jobs_parser.add_argument('--input_hash',
+                                   type=str,
+                                   default=None,
+                                   help='The hash of the input files')
+    query_jobs_parser.add_argument('--remote_dir',
+                                   type=Path,
+                                   default=None,
+                                   help='The remote directory of the job')
+    query_jobs_parser.add_argument('--limit', '-l',
+                                   type=int,
+                                   default=None,
+                                   help='The maximum number of jobs to list')
+    query_jobs_parser.set_defaults(command='query_jobs')
+
     # ----------------------------------------------------------------------------------------------
     # Resubmit Job
     # ----------------------------------------------------------------------------------------------
@@ -797,6 +1937,217 @@ def main():
                                       type=Path,
                                       help='The remote directory of the job')
 
+    # ----------------------------------------------------------------------------------------------
+    # Extract Results
+    # ----------------------------------------------------------------------------------------------
+    extract_results_parser = subparsers.add_parser(
+        'extract_results',
+        help='Extract components from the .res file on the cluster and get only those')
+    extract_results_parser.add_argument('remote_dir',
+                                        type=Path,
+                                        help='The remote directory of the job')
+    extract_results_parser.add_argument('--channels', '-c',
+                                        type=str,
+                                        nargs='+',
+                                        default=None,
+                                        help='Components to extract (<entity>.<component> or <entity>)')
+    extract_results_parser.add_argument('--output', '-o',
+                                        type=Path,
+                                        default=None,
+                                        help='Write the components to this .npz file instead of stdout')
+    extract_results_parser.add_argument('--host', '-H',
+                                        type=str,
+                                        help='The host to connect to',
+                                        default=None)
+    extract_results_parser.add_argument('--username', '-u',
+                                        type=str,
+                                        help='The username to connect with',
+                                        default=None)
+    extract_results_parser.set_defaults(command='extract_results')
+
+    # ----------------------------------------------------------------------------------------------
+    # Load Results
+    # ----------------------------------------------------------------------------------------------
+    load_results_parser = subparsers.add_parser(
+        'load_results',
+        help='Load a parsed result file, from the local result cache if it is up to date')
+    load_results_parser.add_argument('remote_dir',
+                                     type=Path,
+                                     help='The remote directory of the job')
+    load_results_parser.add_argument('--extension', '-e',
+                                     type=str,
+                                     default='.res',
+                                     help='The result file to load (.res, .req or .gra)')
+    load_results_parser.add_argument('--output', '-o',
+                                     type=Path,
+                                     default=None,
+                                     help='Write the columns to this .npz file instead of stdout')
+    load_results_parser.add_argument('--host', '-H',
+                                     type=str,
+                                     help='The host to connect to',
+                                     default=None)
+    load_results_parser.add_argument('--username', '-u',
+                                     type=str,
+                                     help='The username to connect with',
+                                     default=None)
+    load_results_parser.set_defaults(command='load_results')
+
+    # ----------------------------------------------------------------------------------------------
+    # Check If Finished
+    # ----------------------------------------------------------------------------------------------
+    check_if_finished_parser = subparsers.add_parser(
+        'check_if_finished',
+        help='Check whether a job has finished and get the errors in its .msg file')
+    check_if_finished_parser.add_argument('remote_dir',
+                                          type=Path,
+                                          help='The remote directory of the job')
+    check_if_finished_parser.add_argument('--ignore_static',
+                                          action='store_true',
+                                          help='Ignore failed static equilibrium errors')
+    check_if_finished_parser.add_argument('--ignore_parse',
+                                          action='store_true',
+                                          help='Ignore command parsing errors')
+    check_if_finished_parser.add_argument('--host', '-H',
+                                          type=str,
+                                          help='The host to connect to',
+                                          default=None)
+    check_if_finished_parser.add_argument('--username', '-u',
+                                          type=str,
+                                          help='The username to connect with',
+                                          default=None)
+    check_if_finished_parser.set_defaults(command='check_if_finished')
+
+    # ----------------------------------------------------------------------------------------------
+    # Enqueue Submit
+    # ----------------------------------------------------------------------------------------------
+    enqueue_submit_parser = subparsers.add_parser(
+        'enqueue_submit',
+        help='Add an ACF file to the local submission queue and print its ticket')
+    enqueue_submit_parser.add_argument('acf_file', type=Path, help='The ACF file to submit')
+    enqueue_submit_parser.add_argument('--adm_file', type=Path, help='The ADM file to submit')
+    enqueue_submit_parser.add_argument('--aux_files', '-a',
+                                       type=Path,
+                                       nargs='+',
+                                       help='Auxiliary files to submit',
+                                       default=None)
+    enqueue_submit_parser.add_argument('--priority', '-p',
+                                       type=int,
+                                       default=0,
+                                       help='Submissions with a higher priority are released first')
+    enqueue_submit_parser.add_argument('--ncpus',
+                                       type=int,
+                                       default=None,
+                                       help='The number of CPUs the job will use')
+    enqueue_submit_parser.add_argument('--max-user-jobs', '-M',
+                                       type=int,
+                                       default=None,
+                                       help='Only submit while fewer jobs than this are active')
+    enqueue_submit_parser.add_argument('--max-cpus',
+                                       type=int,
+                                       default=None,
+                                       help='Only submit while the active jobs use fewer CPUs')
+    enqueue_submit_parser.add_argument('--run',
+                                       action='store_true',
+                                       help=('Then submit queued jobs in the foreground until the '
+                                             'queue is empty (see run_queue)'))
+    enqueue_submit_parser.set_defaults(command='enqueue_submit')
+
+    # ----------------------------------------------------------------------------------------------
+    # Get Ticket
+    # ----------------------------------------------------------------------------------------------
+    get_ticket_parser = subparsers.add_parser('get_ticket',
+                                              help='Get the state of a queued submission')
+    get_ticket_parser.add_argument('ticket', type=int, help='The ticket')
+    get_ticket_parser.set_defaults(command='get_ticket')
+
+    # ----------------------------------------------------------------------------------------------
+    # Cancel Ticket
+    # ----------------------------------------------------------------------------------------------
+    cancel_ticket_parser = subparsers.add_parser('cancel_ticket',
+                                                 help='Remove a submission from the queue')
+    cancel_ticket_parser.add_argument('ticket', type=int, help='The ticket')
+    cancel_ticket_parser.set_defaults(command='cancel_ticket')
+
+    # ----------------------------------------------------------------------------------------------
+    # Run Queue
+    # ----------------------------------------------------------------------------------------------
+    run_queue_parser = subparsers.add_parser(
+        'run_queue',
+        help='Submit queued jobs as the cluster frees up, until the queue is empty')
+    run_queue_parser.add_argument('--host', '-H',
+                                  type=str,
+                                  help='The host to connect to',
+                                  default=None)
+    run_queue_parser.add_argument('--username', '-u',
+                                  type=str,
+                                  help='The username to connect with',
+                                  default=None)
+    run_queue_parser.set_defaults(command='run_queue')
+
+    # ----------------------------------------------------------------------------------------------
+    # Cancel Job
+    # ----------------------------------------------------------------------------------------------
+    cancel_job_parser = subparsers.add_parser('cancel_job', help='Cancel a job on the cluster')
+    cancel_job_parser.add_argument('job_id', type=str, help='The ID of the job')
+    cancel_job_parser.add_argument('--host', '-H',
+                                   type=str,
+                                   help='The host to connect to',
+                                   default=None)
+    cancel_job_parser.add_argument('--username', '-u',
+                                   type=str,
+                                   help='The username to connect with',
+                                   default=None)
+    cancel_job_parser.set_defaults(command='cancel_job')
+
+    # ----------------------------------------------------------------------------------------------
+    # Wait For Jobs
+    # ----------------------------------------------------------------------------------------------
+    wait_for_jobs_parser = subparsers.add_parser('wait_for_jobs',
+                                                 help='Wait for several jobs to finish')
+    wait_for_jobs_parser.add_argument('--remote_dirs', '-r',
+                                      type=Path,
+                                      nargs='+',
+                                      default=None,
+                                      help='The remote directories of the jobs')
+    wait_for_jobs_parser.add_argument('--job_ids', '-j',
+                                      type=str,
+                                      nargs='+',
+                                      default=None,
+                                      help='The job IDs (in the same order as --remote_dirs)')
+    wait_for_jobs_parser.add_argument('--timeout', '-t',
+                                      type=float,
+                                      default=None,
+                                      help='Give up after this many seconds')
+    wait_for_jobs_parser.add_argument('--ignore_static',
+                                      action='store_true',
+                                      help='Ignore failed static equilibrium errors')
+    wait_for_jobs_parser.add_argument('--ignore_parse',
+                                      action='store_true',
+                                      help='Ignore command parsing errors')
+    wait_for_jobs_parser.add_argument('--host', '-H',
+                                      type=str,
+                                      help='The host to connect to',
+                                      default=None)
+    wait_for_jobs_parser.add_argument('--username', '-u',
+                                      type=str,
+                                      help='The username to connect with',
+                                      default=None)
+    wait_for_jobs_parser.set_defaults(command='wait_for_jobs')
+
+    # ----------------------------------------------------------------------------------------------
+    # Daemon
+    # ----------------------------------------------------------------------------------------------
+    daemon_parser = subparsers.add_parser('daemon',
+                                          help='Run a local service that keeps HPC sessions open')
+    daemon_parser.add_argument('--idle_timeout',
+                               type=float,
+                               default=None,
+                               help='Seconds of inactivity before the daemon shuts down')
+    daemon_parser.add_argument('--stop',
+                               action='store_true',
+                               help='Stop a running daemon')
+    daemon_parser.set_defaults(command='daemon')
+
     # ----------------------------------------------------------------------------------------------
     # Parse the arguments
     # ----------------------------------------------------------------------------------------------
@@ -856,6 +2207,12 @@ def main():
                    for k, v in status.items()} for status in STATUS]
         print(json.dumps(STATUS))
 
+    # ----------------------------------------------------------------------------------------------
+    # get_dirs_status()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'get_dirs_status':
+        print(json.dumps(get_dirs_status(**args)))
+
     # ----------------------------------------------------------------------------------------------
     # get_results()
     # ----------------------------------------------------------------------------------------------
@@ -906,6 +2263,17 @@ def main():
         # Print the dataframe as a csv
         print(df.to_csv(index=False))
 
+    # ----------------------------------------------------------------------------------------------
+    # query_jobs()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'query_jobs':
+        for key in ('since', 'until'):
+            if args[key] is not None:
+                args[key] = pd.Timestamp(args[key]).timestamp()
+
+        df = query_jobs(**args)
+        print(df.to_csv(index=False))
+
     # ----------------------------------------------------------------------------------------------
     # resubmit_job
     # ----------------------------------------------------------------------------------------------
@@ -916,6 +2284,88 @@ def main():
                           'job_name': JOB_NAME,
                           'job_id': JOB_ID}))
 
+    # ----------------------------------------------------------------------------------------------
+    # extract_results()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'extract_results':
+        output = args.pop('output')
+        DATA = extract_results(**args)
+        if output is not None:
+            np.savez(output, **DATA)
+            print(output)
+        else:
+            print(json.dumps({name: values.tolist() for name, values in DATA.items()}))
+
+    # ----------------------------------------------------------------------------------------------
+    # load_results()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'load_results':
+        output = args.pop('output')
+        DATA = load_results(**args)
+        if output is not None:
+            np.savez(output, **DATA)
+            print(output)
+        else:
+            print(json.dumps({name: values.tolist() for name, values in DATA.items()}))
+
+    # ----------------------------------------------------------------------------------------------
+    # check_if_finished_and_get_errors()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'check_if_finished':
+        FINISHED, ERRORS = check_if_finished_and_get_errors(**args)
+        print(json.dumps({'finished': FINISHED, 'errors': ERRORS}))
+
+    # ----------------------------------------------------------------------------------------------
+    # enqueue_submit()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'enqueue_submit':
+        run = args.pop('run')
+        TICKET = enqueue_submit(**args, start=False)
+        print(json.dumps({'ticket': TICKET}))
+        sys.stdout.flush()
+        if run:
+            run_queue()
+
+    # ----------------------------------------------------------------------------------------------
+    # get_ticket()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'get_ticket':
+        print(json.dumps(get_ticket(**args)))
+
+    # ----------------------------------------------------------------------------------------------
+    # cancel_ticket()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'cancel_ticket':
+        print(json.dumps({'cancelled': cancel_ticket(**args)}))
+
+    # ----------------------------------------------------------------------------------------------
+    # run_queue()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'run_queue':
+        run_queue(**args)
+
+    # ----------------------------------------------------------------------------------------------
+    # cancel_job()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'cancel_job':
+        cancel_job(**args)
+
+    # ----------------------------------------------------------------------------------------------
+    # wait_for_jobs()
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'wait_for_jobs':
+        RESULTS = wait_for_jobs(**args)
+        print(json.dumps([asdict(r) for r in RESULTS]))
+
+    # ----------------------------------------------------------------------------------------------
+    # daemon
+    # ----------------------------------------------------------------------------------------------
+    elif command == 'daemon':
+        if args['stop']:
+            daemon.stop()
+        else:
+            daemon.serve(idle_timeout=args['idle_timeout'])
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,330 @@
+"""A content addressed store of uploaded files on the cluster
+
+Files are stored under `<remote_tempdir>/.aview_hpc_store/<sha256>` and hard linked (or symlinked if
+hard linking fails) into each job directory. A local index maps content hashes to the remote store
+so that content that has been uploaded before is never sent again, even across sessions.
+
+Notes
+-----
+* The local index is only a hint. Store objects are verified on the cluster (existence and size)
+  before they are linked, so a stale index just causes a re-upload.
+* The number of hard links on a store object is used as its reference count when evicting. Only
+  objects that no job directory links to are evicted, since removing any other frees no space.
+  Objects that have ever been symlinked are never evicted, since symlinks don't show up in the link
+  count, and neither are objects used within the last `MIN_AGE` seconds (jobs may still be queued).
+* The index is shared by every process on the machine (Adams View, the daemon and the job monitor),
+  so it is read, modified and written while holding a lock file (see `_index_lock`).
+"""
+import hashlib
+import json
+import logging
+import os
+import shlex
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from paramiko import SSHClient
+
+from .config import DATA_DIR
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+LOG = logging.getLogger(__name__)
+INDEX_FILE = DATA_DIR / 'asset_store.json'
+STORE_DIR_NAME = '.aview_hpc_store'
+
+# Default maximum total size of the remote store (bytes)
+MAX_SIZE = 20 * 2**30
+
+# Default minimum size of a file (bytes) for it to go through the store
+MIN_SIZE = 2**20
+
+# Default time (seconds) after an object was last used before it may be evicted (the job table window)
+MIN_AGE = 7 * 24 * 3600
+
+_INDEX_LOCK = threading.Lock()
+
+
+class AssetStore():
+    """A content addressed store of files on the cluster
+
+    Parameters
+    ----------
+    ssh : SSHClient
+        A connected SSH client
+    key : str
+        Identifies the cluster in the local index (e.g. user@host)
+    remote_tempdir : Path
+        The remote directory that the store is created in
+    max_size : int, optional
+        The maximum total size of the store in bytes, by default `MAX_SIZE`
+    min_size : int, optional
+        Files smaller than this (bytes) are not stored, by default `MIN_SIZE`
+    min_age : float, optional
+        Objects used more recently than this (seconds) are not evicted, by default `MIN_AGE`
+    """
+
+    def __init__(self,
+                 ssh: SSHClient,
+                 key: str,
+                 remote_tempdir: Path,
+                 max_size: int = MAX_SIZE,
+                 min_size: int = MIN_SIZE,
+                 min_age: float = MIN_AGE):
+        self.ssh = ssh
+        self.key = key
+        self.store_dir = (Path(remote_tempdir) / STORE_DIR_NAME).as_posix()
+        self.max_size = max_size
+        self.min_size = min_size
+        self.min_age = min_age
+
+    def known(self, files: List[Path]) -> List[Path]:
+        """Get the files whose content is (according to the local index) already in the store
+
+        Parameters
+        ----------
+        files : List[Path]
+            Local files
+
+        Returns
+        -------
+        List[Path]
+            The files that are in the store
+        """
+        objects = _load_index().get('objects', {}).get(self.key, {})
+        return [f for f in files
+                if Path(f).stat().st_size >= self.min_size and file_hash(f) in objects]
+
+    def link_known(self, files: List[Tuple[Path, str]]) -> List[Tuple[Path, str]]:
+        """Link files whose content is already in the store into their remote destinations
+
+        Parameters
+        ----------
+        files : List[Tuple[Path, str]]
+            A list of (local file, remote posix path) pairs
+
+        Returns
+        -------
+        List[Tuple[Path, str]]
+            The pairs that were NOT linked and still need to be uploaded
+        """
+        objects = _load_index().get('objects', {}).get(self.key, {})
+
+        candidates = {i: sha for i, (local, _) in enumerate(files)
+                      if Path(local).stat().st_size >= self.min_size
+                      and (sha := file_hash(local)) in objects}
+        if not candidates:
+            return files
+
+        # Verify and link everything in a single round trip
+        lines = []
+        for i, sha in candidates.items():
+            obj = shlex.quote(objects[sha]['remote'])
+            dst = shlex.quote(files[i][1])
+            lines.append(f'if [ "$(stat -c %s {obj} 2>/dev/null)" = "{objects[sha]["size"]}" ]; then '
+                         f'if ln -f {obj} {dst} 2>/dev/null; then echo {i} hard; '
+                         f'elif ln -sf {obj} {dst}; then echo {i} sym; fi; fi')
+        _, stdout, _ = self.ssh.exec_command('\n'.join(lines))
+        linked = {int(i): kind == 'sym'
+                  for i, kind in (line.split() for line in stdout.read().decode().splitlines())}
+
+        for i in linked:
+            LOG.info(f' Linked from store: {Path(files[i][0]).name} --> {files[i][1]}')
+
+        self._update_index(lambda index: [_touch(index, self.key, candidates[i], symlinked)
+                                          for i, symlinked in linked.items()])
+
+        # Drop index entries whose objects no longer exist on the cluster
+        missing = {candidates[i] for i in candidates if i not in linked}
+        if missing:
+            self._update_index(lambda index: [index['objects'].get(self.key, {}).pop(sha, None)
+                                              for sha in missing])
+
+        return [pair for i, pair in enumerate(files) if i not in linked]
+
+    def add(self, files: List[Tuple[Path, str]]):
+        """Add files that have just been uploaded to the store
+
+        Parameters
+        ----------
+        files : List[Tuple[Path, str]]
+            A list of (local file, remote posix path) pairs that have been uploaded
+        """
+        new = {}
+        for local, remote in files:
+            size = Path(local).stat().st_size
+            if size >= self.min_size:
+                new[file_hash(local)] = (remote, size)
+
+        if not new:
+            return
+
+        lines = [f'mkdir -p {shlex.quote(self.store_dir)}']
+        for sha, (remote, _) in new.items():
+            obj = shlex.quote(f'{self.store_dir}/{sha}')
+            src = shlex.quote(remote)
+            lines.append(f'[ -e {obj} ] || ln {src} {obj} 2>/dev/null || cp {src} {obj}')
+        _, stdout, stderr = self.ssh.exec_command('\n'.join(lines))
+        if stdout.channel.recv_exit_status() != 0:
+            LOG.warning(f'Could not add files to the store: {stderr.read().decode()}')
+            return
+
+        def update(index: dict):
+            for sha, (_, size) in new.items():
+                index['objects'].setdefault(self.key, {})[sha] = {'remote': f'{self.store_dir}/{sha}',
+                                                                  'size': size,
+                                                                  'symlinked': False}
+                _touch(index, self.key, sha)
+        self._update_index(update)
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used objects until the store is smaller than `max_size`
+
+        Only objects that are not hard linked into any job directory are evicted. Objects that have
+        been symlinked or were used in the last `min_age` seconds are never evicted.
+        """
+        objects: Dict[str, dict] = _load_index().get('objects', {}).get(self.key, {})
+        total = sum(o['size'] for o in objects.values())
+        if total <= self.max_size:
+            return
+
+        cutoff = time.time() - self.min_age
+        candidates = [sha for sha, obj in objects.items()
+                      if not obj.get('symlinked', False) and obj['last_used'] < cutoff]
+        if not candidates:
+            LOG.warning(f'{self.store_dir} is larger than its maximum size, but every object in it '
+                        'may still be in use')
+            return
+
+        # The hard link count of each object is its live reference count (+1 for the store itself).
+        # Objects that are missing have already been removed.
+        _, stdout, _ = self.ssh.exec_command(
+            f'cd {shlex.quote(self.store_dir)} && stat -c "%h %n" {" ".join(candidates)} 2>/dev/null')
+        nlinks = {name: int(n)
+                  for n, name in (line.split() for line in stdout.read().decode().splitlines())}
+
+        unlinked = sorted((sha for sha in candidates if nlinks.get(sha, 1) <= 1),
+                          key=lambda sha: objects[sha]['last_used'])
+        evicted = []
+        for sha in unlinked:
+            if total <= self.max_size:
+                break
+            evicted.append(sha)
+            total -= objects[sha]['size']
+
+        if total > self.max_size:
+            LOG.warning(f'{self.store_dir} is larger than its maximum size, but the rest of its '
+                        'objects are still linked into job directories')
+
+        # Another process may have used an object since the index was read
+        def update(index: dict):
+            objects = index['objects'].get(self.key, {})
+            for sha in [sha for sha in evicted if sha in objects
+                        and (objects[sha].get('symlinked', False)
+                             or objects[sha]['last_used'] >= cutoff)]:
+                evicted.remove(sha)
+            for sha in evicted:
+                objects.pop(sha, None)
+        self._update_index(update)
+
+        if not evicted:
+            return
+
+        LOG.info(f'Evicting {len(evicted)} objects from {self.store_dir}')
+        self.ssh.exec_command(f'cd {shlex.quote(self.store_dir)} && rm -f {" ".join(evicted)}')
+
+    @staticmethod
+    def _update_index(func):
+        with _index_lock():
+            index = _load_index()
+            func(index)
+            _save_index(index)
+
+
+def file_hash(file: Path) -> str:
+    """Get the sha256 of a file, cached by path, size and modification time"""
+    file = Path(file).resolve()
+    stat = file.stat()
+    cached = _load_index().get('hashes', {}).get(str(file))
+    if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+        return cached['sha256']
+
+    sha = hashlib.sha256()
+    with open(file, 'rb') as fid:
+        while block := fid.read(2**20):
+            sha.update(block)
+
+    def update(index: dict):
+        index['hashes'][str(file)] = {'size': stat.st_size,
+                                      'mtime_ns': stat.st_mtime_ns,
+                                      'sha256': sha.hexdigest()}
+    AssetStore._update_index(update)
+
+    return sha.hexdigest()
+
+
+def _touch(index: dict, key: str, sha: str, symlinked: bool = False):
+    obj = index['objects'][key][sha]
+    obj['last_used'] = time.time()
+    obj['symlinked'] = obj.get('symlinked', False) or symlinked
+
+
+@contextmanager
+def _index_lock():
+    """Lock the index against other threads and other processes"""
+    with _INDEX_LOCK:
+        INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(INDEX_FILE.with_suffix('.lock'), 'a+b') as fid:
+            _lock_file(fid)
+            try:
+                yield
+            finally:
+                _unlock_file(fid)
+
+
+def _lock_file(fid):
+    fid.seek(0)
+    if os.name == 'nt':
+        while True:
+            try:
+                msvcrt.locking(fid.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after 10 seconds
+                continue
+    else:
+        fcntl.flock(fid.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(fid):
+    fid.seek(0)
+    if os.name == 'nt':
+        msvcrt.locking(fid.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fid.fileno(), fcntl.LOCK_UN)
+
+
+def _load_index() -> dict:
+    try:
+        index = json.loads(INDEX_FILE.read_text())
+    except (OSError, ValueError):
+        index = {}
+
+    index.setdefault('objects', {})
+    index.setdefault('hashes', {})
+    return index
+
+
+def _save_index(index: dict):
+    INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = INDEX_FILE.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_file.write_text(json.dumps(index))
+    os.replace(tmp_file, INDEX_FILE)
@@ -1,17 +1,42 @@
 import datetime
 from io import StringIO
 import json
+import logging
 import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Dict, List, Union
+from typing import Callable, Dict, List, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
-from adamspy.postprocess.msg import check_if_finished as check_if_msg_finished
-from adamspy.postprocess.msg import get_errors
+from . import daemon
+from .config import get_config, is_enabled
 from .get_binary import get_binary
 
+LOG = logging.getLogger(__name__)
+
+# Daemon methods that must not be run again with the binary if the daemon may already have run them
+NON_IDEMPOTENT_METHODS = ('submit', 'submit_multi', 'resubmit_job', 'enqueue_submit')
+
+# The states of a `JobHandle`
+QUEUED = 'queued'
+SUBMITTING = 'submitting'
+SUBMITTED = 'submitted'
+WAITING = 'waiting'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# Maximum number of `JobHandle`s (or `submit_multi_async` batches) waited on at once
+WAIT_WORKERS = 32
+
+_EXECUTOR: ThreadPoolExecutor = None
+_WAIT_EXECUTOR: ThreadPoolExecutor = None
+_EXECUTOR_LOCK = threading.Lock()
+
 
 def submit(acf_file: Path,
            adm_file: Path = None,
@@ -43,6 +68,451 @@ def submit(acf_file: Path,
     adm_file = Path(adm_file) if adm_file is not None else None
     aux_files = [Path(f) for f in aux_files] if aux_files is not None else None
 
+    output = _call_daemon('submit',
+                          acf_file=str(acf_file.absolute()),
+                          adm_file=(str((acf_file.parent / adm_file).absolute())
+                                    if adm_file is not None else None),
+                          aux_files=[str((acf_file.parent / f).absolute()) for f in aux_files or []],
+                          max_user_jobs=max_user_jobs,
+                          **{k: str(v) for k, v in kwargs.items()})
+
+    if output is None:
+        output = _submit_with_binary(acf_file, adm_file, aux_files, max_user_jobs, _log_level, **kwargs)
+
+    remote_dir = Path(output['remote_dir'])
+    job_name = output['job_name']
+    job_id = int(output['job_id'])
+
+    if wait_for_completion:
+        _wait_for_job(remote_dir, job_id)
+
+    return remote_dir, job_name, job_id
+
+
+class JobHandle():
+    """A job that is being submitted in the background (see `submit_async`)
+
+    The methods mirror `concurrent.futures.Future`. `state` is updated as the job goes through
+    the local queue (`QUEUED`), the upload and submit command (`SUBMITTING`), the cluster
+    (`SUBMITTED`, or `WAITING` if waiting for completion) and is finally `DONE`, `FAILED` or
+    `CANCELLED`.
+
+    Notes
+    -----
+    * Callbacks run on a background thread, not the thread that called `submit_async`.
+    * Jobs are uploaded and submitted by the `submit_workers` threads, but waited on by a separate
+      pool, so a job waiting for completion doesn't hold up the submissions queued behind it.
+    """
+
+    def __init__(self, acf_file: Path):
+        self.acf_file = Path(acf_file)
+        self.state = QUEUED
+        self.remote_dir: Path = None
+        self.job_name: str = None
+        self.job_id: int = None
+        self.wait_result: dict = None
+        """The result of `wait_for_jobs` if the job was submitted with `wait_for_completion`"""
+        self._future: Future = None
+        self._lock = threading.Lock()
+        self._cancel_requested = False
+        self._cancel_sent = False
+
+    def __repr__(self):
+        return f'JobHandle({self.acf_file.name}, state={self.state}, job_id={self.job_id})'
+
+    def done(self) -> bool:
+        """Whether the submission (and the wait, if requested) has finished, failed or been
+        cancelled"""
+        return self._future.done()
+
+    def result(self, timeout: float = None) -> Tuple[Path, str, int]:
+        """Wait for the submission and return (remote_dir, job_name, job_id) like `submit`
+
+        Raises the exception from the submission if it failed, or `TimeoutError` if it hasn't
+        finished within `timeout` seconds.
+        """
+        return self._future.result(timeout)
+
+    def exception(self, timeout: float = None) -> BaseException:
+        """Wait for the submission and return the exception it raised (None if it succeeded)"""
+        return self._future.exception(timeout)
+
+    def add_done_callback(self, fn: Callable[['JobHandle'], None]):
+        """Call `fn` with this handle once it is done (straight away if it already is)"""
+        self._future.add_done_callback(lambda _: fn(self))
+
+    def cancel(self) -> bool:
+        """Cancel the job
+
+        A job still in the local queue is never submitted. A job that is being uploaded is cancelled
+        on the cluster as soon as it has been submitted, and a job that has been submitted is
+        cancelled on the cluster straight away (`cancel_job`).
+
+        Returns
+        -------
+        bool
+            False if the job had already finished
+        """
+        if self._future.cancel():
+            self.state = CANCELLED
+            return True
+
+        with self._lock:
+            if self.state in (DONE, FAILED, CANCELLED):
+                return False
+
+            self._cancel_requested = True
+            if self.job_id is not None:
+                self._send_cancel()
+
+        return True
+
+    def _send_cancel(self):
+        """Cancel the job on the cluster, once (call with `_lock` held)"""
+        if not self._cancel_sent:
+            self._cancel_sent = True
+            cancel_job(self.job_id)
+        self.state = CANCELLED
+
+    def _submitted(self, remote_dir: Path, job_name: str, job_id: Union[int, str]) -> bool:
+        """Record the submitted job. Returns False if it was cancelled in the meantime."""
+        with self._lock:
+            self.remote_dir, self.job_name, self.job_id = remote_dir, job_name, job_id
+            self.state = SUBMITTED
+            if self._cancel_requested:
+                self._send_cancel()
+
+            return self.state != CANCELLED
+
+    def _finished(self, wait_result: dict):
+        with self._lock:
+            self.wait_result = wait_result
+            if self.state != CANCELLED:
+                self.state = DONE
+
+    def _fail(self, err: BaseException):
+        self.state = FAILED
+        self._future.set_exception(err)
+
+    def _resolve(self):
+        self._future.set_result((self.remote_dir, self.job_name, self.job_id))
+
+    def _run(self, wait_for_completion: bool, submit_fn: Callable, **kwargs):
+        if not self._future.set_running_or_notify_cancel():
+            return
+
+        self.state = SUBMITTING
+        try:
+            submitted = self._submitted(*submit_fn(**kwargs))
+        except BaseException as err:  # noqa: BLE001
+            self._fail(err)
+            return
+
+        if submitted and wait_for_completion:
+            self.state = WAITING
+            _get_wait_executor().submit(_wait_for_handles, [self])
+        else:
+            self._resolve()
+
+
+def submit_async(acf_file: Path,
+                 adm_file: Path = None,
+                 aux_files: List[Path] = None,
+                 wait_for_completion: bool = False,
+                 max_user_jobs: int = None,
+                 **kwargs) -> JobHandle:
+    """Submit an ACF file to the cluster in the background
+
+    Returns straight away, so Adams View stays responsive while the files are uploaded and the job
+    is submitted. See `submit` for the parameters.
+
+    Returns
+    -------
+    JobHandle
+        Tracks the submission. `JobHandle.result()` returns (remote_dir, job_name, job_id).
+    """
+    handle = JobHandle(acf_file)
+    handle._future = Future()
+    _get_executor().submit(handle._run,
+                           wait_for_completion,
+                           submit,
+                           acf_file=acf_file,
+                           adm_file=adm_file,
+                           aux_files=aux_files,
+                           max_user_jobs=max_user_jobs,
+                           **kwargs)
+    return handle
+
+
+def submit_multi_async(acf_files: List[Path],
+                       adm_files: List[Path],
+                       aux_files: List[List[Path]] = None,
+                       wait_for_completion: bool = False,
+                       max_user_jobs: int = None,
+                       **kwargs) -> List[JobHandle]:
+    """Submit multiple ACF files to the cluster in the background
+
+    The whole batch is submitted with one `submit_multi` call on a background thread, so it gets the
+    same job array, journal and pacing options. Each job gets its own `JobHandle`. Jobs cancelled
+    before the batch starts are left out of it. See `submit_multi` for the parameters.
+
+    Returns
+    -------
+    List[JobHandle]
+        A handle for each job, in the same order as `acf_files`
+    """
+    if not len(adm_files) == len(acf_files):
+        raise ValueError('The number of ADM files must match the number of ACF files')
+
+    if aux_files is None:
+        aux_files = [[]] * len(acf_files)
+
+    handles = [JobHandle(acf_file) for acf_file in acf_files]
+    for handle in handles:
+        handle._future = Future()
+
+    _get_executor().submit(_run_batch, handles, wait_for_completion, adm_files, aux_files,
+                           max_user_jobs=max_user_jobs, **kwargs)
+    return handles
+
+
+def _run_batch(handles: List[JobHandle],
+               wait_for_completion: bool,
+               adm_files: List[Path],
+               aux_files: List[List[Path]],
+               **kwargs):
+    """Submit the jobs of `submit_multi_async` with `submit_multi` and resolve their handles"""
+    active = [i for i, handle in enumerate(handles)
+              if handle._future.set_running_or_notify_cancel()]
+    if not active:
+        return
+
+    for i in active:
+        handles[i].state = SUBMITTING
+
+    try:
+        results = list(zip(*submit_multi([handles[i].acf_file for i in active],
+                                         [adm_files[i] for i in active],
+                                         [aux_files[i] for i in active],
+                                         **kwargs)))
+    except BaseException as err:  # noqa: BLE001
+        for i in active:
+            handles[i]._fail(err)
+        return
+
+    waiting = []
+    for i, (remote_dir, job_name, job_id) in zip(active, results):
+        if handles[i]._submitted(remote_dir, job_name, job_id) and wait_for_completion:
+            handles[i].state = WAITING
+            waiting.append(handles[i])
+        else:
+            handles[i]._resolve()
+
+    if waiting:
+        _get_wait_executor().submit(_wait_for_handles, waiting)
+
+
+def _wait_for_handles(handles: List[JobHandle]):
+    """Wait for the jobs of submitted handles to finish and resolve the handles"""
+    try:
+        if len(handles) == 1:
+            wait_results = [_wait_for_job(handles[0].remote_dir, handles[0].job_id)]
+        else:
+            wait_results = wait_for_jobs([h.remote_dir for h in handles],
+                                         [h.job_id for h in handles])
+    except BaseException as err:  # noqa: BLE001
+        for handle in handles:
+            handle._fail(err)
+        return
+
+    for handle, wait_result in zip(handles, wait_results):
+        handle._finished(wait_result)
+        handle._resolve()
+
+
+def enqueue_submit(acf_file: Path,
+                   adm_file: Path = None,
+                   aux_files: List[Path] = None,
+                   priority: int = 0,
+                   ncpus: int = None,
+                   max_user_jobs: int = None,
+                   max_cpus: int = None,
+                   **kwargs) -> int:
+    """Queue a submission locally and return a ticket straight away
+
+    The queue is shared by every process on this machine. Queued jobs are submitted, highest
+    priority first, as soon as the user's active jobs on the cluster leave room under the limits.
+    Use `get_ticket` to follow a submission.
+
+    Parameters
+    ----------
+    acf_file : Path
+        The path to the ACF file to submit
+    adm_file : Path, optional
+        The path to the ADM file to submit, by default None
+    aux_files : List[Path], optional
+        A list of auxiliary files to submit, by default None
+    priority : int, optional
+        Submissions with a higher priority are released first, by default 0
+    ncpus : int, optional
+        The number of CPUs the job will use, by default the `nthreads` in the ACF file or 1
+    max_user_jobs : int, optional
+        Only submit while the user has fewer active jobs than this, by default the
+        `queue_max_jobs` config setting (no limit if that isn't set)
+    max_cpus : int, optional
+        Only submit if the user's active jobs and this one use no more CPUs than this, by default
+        the `queue_max_cpus` config setting (no limit if that isn't set)
+
+    Returns
+    -------
+    int
+        The ticket
+    """
+    acf_file = Path(acf_file).absolute()
+    adm_file = (acf_file.parent / adm_file).absolute() if adm_file is not None else None
+    aux_files = [(acf_file.parent / f).absolute() for f in aux_files or []]
+    options = {'priority': priority, 'ncpus': ncpus, 'max_user_jobs': max_user_jobs,
+               'max_cpus': max_cpus}
+
+    ticket = _call_daemon('enqueue_submit',
+                          acf_file=str(acf_file),
+                          adm_file=str(adm_file) if adm_file is not None else None,
+                          aux_files=[str(f) for f in aux_files],
+                          **options,
+                          **{k: str(v) for k, v in kwargs.items()})
+    if ticket is not None:
+        return ticket
+
+    cmd = [f'"{get_binary()}"', 'enqueue_submit', f'"{acf_file}"']
+    if adm_file is not None:
+        cmd += ['--adm_file', f'"{adm_file}"']
+    if aux_files:
+        cmd += ['--aux_files', *[f'"{f}"' for f in aux_files]]
+    flags = {'priority': '--priority', 'ncpus': '--ncpus', 'max_user_jobs': '--max-user-jobs',
+             'max_cpus': '--max-cpus'}
+    for option, value in options.items():
+        if value is not None:
+            cmd += [flags[option], str(value)]
+    for k, v in kwargs.items():
+        cmd += [f'--{k}', str(v)]
+
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    with subprocess.Popen(' '.join(cmd),
+                          startupinfo=startupinfo,
+                          shell=True,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          text=True) as proc:
+        out, err = proc.communicate()
+
+    if err and 'UserWarning' not in err:
+        raise RuntimeError(err)
+
+    # Release the queue from a background process
+    subprocess.Popen(f'"{get_binary()}" run_queue',
+                     startupinfo=startupinfo,
+                     shell=True,
+                     stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL,
+                     creationflags=subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS)
+
+    return json.loads(out)['ticket']
+
+
+def get_ticket(ticket: int) -> dict:
+    """Get the state of a queued submission
+
+    Returns
+    -------
+    dict
+        `state` (pending, submitting, submitted, failed or cancelled), `priority`, `created`, and
+        once it has been submitted, `remote_dir`, `job_name` and `job_id` (or `error` if it failed)
+    """
+    info = _call_daemon('get_ticket', ticket=ticket)
+    if info is not None:
+        return info
+
+    return json.loads(_run_binary('get_ticket', str(ticket)))
+
+
+def cancel_ticket(ticket: int) -> bool:
+    """Remove a submission from the queue. Returns False if it had already been released."""
+    cancelled = _call_daemon('cancel_ticket', ticket=ticket)
+    if cancelled is not None:
+        return cancelled
+
+    return json.loads(_run_binary('cancel_ticket', str(ticket)))['cancelled']
+
+
+def _run_binary(*args: str) -> str:
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    with subprocess.Popen([str(get_binary()), *args],
+                          startupinfo=startupinfo,
+                          shell=True,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          text=True) as proc:
+        out, err = proc.communicate()
+
+    if err and 'UserWarning' not in err:
+        raise RuntimeError(err)
+
+    return out
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            workers = max(int(get_config().get('submit_workers', 1)), 1)
+            _EXECUTOR = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='aview_hpc_submit')
+
+    return _EXECUTOR
+
+
+def _get_wait_executor() -> ThreadPoolExecutor:
+    global _WAIT_EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _WAIT_EXECUTOR is None:
+            _WAIT_EXECUTOR = ThreadPoolExecutor(max_workers=WAIT_WORKERS,
+                                                thread_name_prefix='aview_hpc_wait')
+
+    return _WAIT_EXECUTOR
+
+
+def cancel_job(job_id: Union[int, str]):
+    """Cancel a job on the cluster (`scancel`)"""
+    if _call_daemon('cancel_job', job_id=str(job_id)) is not None:
+        return
+
+    cmd = [str(get_binary()), 'cancel_job', str(job_id)]
+
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    with subprocess.Popen(cmd,
+                          startupinfo=startupinfo,
+                          shell=True,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          text=True) as proc:
+        _, err = proc.communicate()
+
+    if err and 'UserWarning' not in err:
+        raise RuntimeError(err)
+
+
+def _submit_with_binary(acf_file: Path,
+                        adm_file: Path,
+                        aux_files: List[Path],
+                        max_user_jobs: int,
+                        _log_level,
+                        **kwargs):
     cmd = [f'"{get_binary()}"']
 
     if _log_level:
@@ -76,23 +546,16 @@ def submit(acf_file: Path,
     if err and 'UserWarning' not in err:
         raise RuntimeError(err)
 
-    output = json.loads(out)
-
-    remote_dir = Path(output['remote_dir'])
-    job_name = output['job_name']
-    job_id = int(output['job_id'])
-
-    if wait_for_completion:
-        while True:
-            check_if_finished(remote_dir)
-
-    return remote_dir, job_name, job_id
+    return json.loads(out)
 
 
 def submit_multi(acf_files: List[Path],
                  adm_files: List[Path],
                  aux_files: List[List[Path]] = None,
                  max_user_jobs: int = None,
+                 array: bool = False,
+                 array_throttle: int = None,
+                 workers: int = None,
                  _log_level=None,
                  **kwargs):
     """Submit multiple ACF files to the cluster
@@ -105,11 +568,20 @@ def submit_multi(acf_files: List[Path],
         A list of ADM files to submit, by default None
     aux_files : List[List[Path]], optional
         A list of lists of auxiliary files to submit, by default None
+    array : bool, optional
+        If True, submit all jobs as a single slurm job array. The submit command must support the
+        `--array` option (see `hpc_scripts/slurm.py`). By default False.
+    array_throttle : int, optional
+        The maximum number of array tasks that may run at once, by default None
+    workers : int, optional
+        The number of jobs to upload and submit concurrently, by default the `submit_workers` config
+        setting or 1
 
     Returns
     -------
     Tuple[List[Path], List[str], List[int]]
-        A list of tuples of remote directories, job names, and job IDs
+        A list of tuples of remote directories, job names, and job IDs. If `array` is True, the job
+        IDs are strings of the form `<array job id>_<task id>`.
     """
     if not len(adm_files) == len(acf_files):
         raise ValueError('The number of ADM files must match the number of ACF files')
@@ -117,6 +589,36 @@ def submit_multi(acf_files: List[Path],
     if aux_files is None:
         aux_files = [[]] * len(acf_files)
 
+    output = _call_daemon('submit_multi',
+                          acf_files=[str(Path(f).absolute()) for f in acf_files],
+                          adm_files=[str(Path(f).absolute()) for f in adm_files],
+                          aux_files=[[str(Path(f).absolute()) for f in files] for files in aux_files],
+                          max_user_jobs=max_user_jobs,
+                          array=array,
+                          array_throttle=array_throttle,
+                          workers=workers,
+                          **{k: str(v) for k, v in kwargs.items()})
+
+    if output is None:
+        output = _submit_multi_with_binary(acf_files, adm_files, aux_files, max_user_jobs, array,
+                                           array_throttle, workers, _log_level, **kwargs)
+
+    remote_dirs = [Path(d) for d in output['remote_dirs']]
+    job_names = output['job_names']
+    job_ids = [int(i) if str(i).isdigit() else i for i in output['job_ids']]
+
+    return remote_dirs, job_names, job_ids
+
+
+def _submit_multi_with_binary(acf_files: List[Path],
+                              adm_files: List[Path],
+                              aux_files: List[List[Path]],
+                              max_user_jobs: int,
+                              array: bool,
+                              array_throttle: int,
+                              workers: int,
+                              _log_level,
+                              **kwargs):
     cmd = [f'"{get_binary()}"']
 
     if _log_level:
@@ -139,6 +641,15 @@ def submit_multi(acf_files: List[Path],
         if max_user_jobs:
             cmd += ['--max-user-jobs', str(max_user_jobs)]
 
+        if array:
+            cmd += ['--array']
+
+        if array_throttle:
+            cmd += ['--array-throttle', str(array_throttle)]
+
+        if workers:
+            cmd += ['--workers', str(workers)]
+
         startupinfo = subprocess.STARTUPINFO()
         startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
 
@@ -156,13 +667,7 @@ def submit_multi(acf_files: List[Path],
         if err and 'UserWarning' not in err:
             raise RuntimeError(err)
 
-        output = json.loads(out)
-
-        remote_dirs = [Path(d) for d in output['remote_dirs']]
-        job_names = output['job_names']
-        job_ids = [int(i) for i in output['job_ids']]
-
-    return remote_dirs, job_names, job_ids
+    return json.loads(out)
 
 
 def _get_python_cmd(exe: Path):
@@ -178,49 +683,38 @@ def _get_python_cmd(exe: Path):
 
 
 def check_if_finished(remote_dir: Path):
-    with TemporaryDirectory() as tmpdir:
-        try:
-            msg_file = next(f for f in get_results(remote_dir,
-                                                   Path(tmpdir),
-                                                   extensions=['.msg']))
-        except StopIteration:
-            finished = False
-
-        else:
-            finished = check_if_msg_finished(msg_file)
+    finished = _call_daemon('check_if_finished', remote_dir=Path(remote_dir).as_posix())
+    if finished is not None:
+        return finished
 
+    finished, _ = _check_if_finished_with_binary(Path(remote_dir))
     return finished
 
 
 def check_if_finished_and_get_errors(remote_dir: Path,
                                      ignore_static: bool = False,
                                      ignore_parse: bool = False):
-    with TemporaryDirectory() as tmpdir:
-        try:
-            msg_file = next(f for f in get_results(Path(remote_dir),
-                                                   Path(tmpdir),
-                                                   extensions=['.msg']))
-        except StopIteration:
-            finished = False
-            errors = []
-
-        else:
-            finished = check_if_msg_finished(msg_file)
-            errors: List[str] = get_errors(msg_file)
+    output = _call_daemon('check_if_finished_and_get_errors',
+                          remote_dir=Path(remote_dir).as_posix(),
+                          ignore_static=ignore_static,
+                          ignore_parse=ignore_parse)
+    if output is not None:
+        finished, errors = output
+        return finished, errors
 
-            if ignore_static:
-                errors = [e for e in errors
-                          if 'static equilibrium analysis has not been successful' not in e.lower()]
+    return _check_if_finished_with_binary(Path(remote_dir), ignore_static, ignore_parse)
 
-            if ignore_parse:
-                errors = [e for e in errors
-                          if 'errors found parsing command. command ignored.' not in e.lower()]
 
-    return finished, errors
+def _check_if_finished_with_binary(remote_dir: Path,
+                                   ignore_static: bool = False,
+                                   ignore_parse: bool = False):
+    cmd = [str(get_binary()), 'check_if_finished', remote_dir.as_posix()]
 
+    if ignore_static:
+        cmd.append('--ignore_static')
 
-def get_remote_dir_status(remote_dir: Path) -> List[Dict[str, Union[str, int, Path]]]:
-    cmd = [str(get_binary()), 'get_remote_dir_status', remote_dir.as_posix()]
+    if ignore_parse:
+        cmd.append('--ignore_parse')
 
     startupinfo = subprocess.STARTUPINFO()
     startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
@@ -239,7 +733,94 @@ def get_remote_dir_status(remote_dir: Path) -> List[Dict[str, Union[str, int, Pa
     if err and 'UserWarning' not in err:
         raise RuntimeError(err)
 
-    status = json.loads(out)
+    output = json.loads(out)
+    return output['finished'], output['errors']
+
+
+def wait_for_jobs(remote_dirs: List[Path] = None,
+                  job_ids: List[Union[int, str]] = None,
+                  timeout: float = None,
+                  ignore_static: bool = False,
+                  ignore_parse: bool = False) -> List[dict]:
+    """Wait for several jobs to finish
+
+    The cluster is queried once per polling cycle for all the jobs together, so waiting on many
+    jobs costs about the same as waiting on one.
+
+    Parameters
+    ----------
+    remote_dirs : List[Path], optional
+        The remote directories of the jobs
+    job_ids : List[Union[int, str]], optional
+        The job IDs. If `remote_dirs` is also given, they must be in the same order.
+    timeout : float, optional
+        Give up after this many seconds, by default None (wait forever)
+    ignore_static : bool, optional
+        Ignore failed static equilibrium errors, by default False
+    ignore_parse : bool, optional
+        Ignore command parsing errors, by default False
+
+    Returns
+    -------
+    List[dict]
+        For each job: `remote_dir`, `job_id`, `state` (the final Slurm state), `finished` (whether
+        the .msg file has the completion marker) and `errors`
+    """
+    remote_dirs = [Path(d).as_posix() for d in remote_dirs] if remote_dirs is not None else None
+    job_ids = [str(j) for j in job_ids] if job_ids is not None else None
+
+    results = _call_daemon('wait_for_jobs',
+                           remote_dirs=remote_dirs,
+                           job_ids=job_ids,
+                           timeout=timeout,
+                           ignore_static=ignore_static,
+                           ignore_parse=ignore_parse)
+    if results is not None:
+        return results
+
+    cmd = [str(get_binary()), 'wait_for_jobs']
+    if remote_dirs is not None:
+        cmd += ['--remote_dirs', *remote_dirs]
+    if job_ids is not None:
+        cmd += ['--job_ids', *job_ids]
+    if timeout is not None:
+        cmd += ['--timeout', str(timeout)]
+    if ignore_static:
+        cmd.append('--ignore_static')
+    if ignore_parse:
+        cmd.append('--ignore_parse')
+
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    with subprocess.Popen(cmd,
+                          startupinfo=startupinfo,
+                          shell=True,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          text=True) as proc:
+        out, err = proc.communicate()
+
+    if err and 'UserWarning' not in err:
+        raise RuntimeError(err)
+
+    return json.loads(out)
+
+
+def _wait_for_job(remote_dir: Path, job_id: int):
+    result, = wait_for_jobs([remote_dir], [job_id])
+    LOG.info(f'Job {job_id} finished with state {result["state"]}')
+    for error in result['errors']:
+        LOG.warning(f'Job {job_id}: {error}')
+
+    return result
+
+
+def get_remote_dir_status(remote_dir: Path) -> List[Dict[str, Union[str, int, Path]]]:
+    status = _call_daemon('get_remote_dir_status', remote_dir=Path(remote_dir).as_posix())
+
+    if status is None:
+        status = _get_remote_dir_status_with_binary(Path(remote_dir))
 
     # convert types
     for s in status:
@@ -250,7 +831,76 @@ def get_remote_dir_status(remote_dir: Path) -> List[Dict[str, Union[str, int, Pa
     return status
 
 
-def get_results(remote_dir: Path, local_dir: Path, extensions=None, _log_level=None):
+def _get_remote_dir_status_with_binary(remote_dir: Path):
+    cmd = [str(get_binary()), 'get_remote_dir_status', remote_dir.as_posix()]
+
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    with subprocess.Popen(cmd,
+                          startupinfo=startupinfo,
+                          shell=True,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          text=True) as proc:
+        out, err = proc.communicate()
+
+        # Wait for the process to finish
+        proc.wait()
+
+    if err and 'UserWarning' not in err:
+        raise RuntimeError(err)
+
+    return json.loads(out)
+
+
+def get_dirs_status(remote_dirs: List[Path]) -> Dict[str, dict]:
+    """Get the status of several job directories with a single query to the cluster
+
+    Parameters
+    ----------
+    remote_dirs : List[Path]
+        The remote directories of the jobs
+
+    Returns
+    -------
+    Dict[str, dict]
+        For each directory (keyed by its posix path): `files` (name, size and mtime of each file),
+        `last_update` and `last_file` (the most recently modified file), `finished` and `n_errors`
+    """
+    remote_dirs = [Path(d).as_posix() for d in remote_dirs]
+    status = _call_daemon('get_dirs_status', remote_dirs=remote_dirs)
+    if status is not None:
+        return status
+
+    cmd = [str(get_binary()), 'get_dirs_status', *remote_dirs]
+
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    with subprocess.Popen(cmd,
+                          startupinfo=startupinfo,
+                          shell=True,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          text=True) as proc:
+        out, err = proc.communicate()
+
+        # Wait for the process to finish
+        proc.wait()
+
+    if err and 'UserWarning' not in err:
+        raise RuntimeError(err)
+
+    return json.loads(out)
+
+
+def get_results(remote_dir: Path,
+                local_dir: Path,
+                extensions=None,
+                sync=False,
+                cache=False,
+                _log_level=None):
     """Get the results files from the cluster
 
     Parameters
@@ -263,12 +913,27 @@ def get_results(remote_dir: Path, local_dir: Path, extensions=None, _log_level=N
         Local path to place files
     extensions : List[str], optional
         A list of file extensionsto get (including the leading '.'), by default `RES_EXTS`
+    sync : bool, optional
+        If True, only fetch files (or the tails of files) that have changed since they were last
+        fetched into `local_dir`, by default False
+    cache : bool, optional
+        If True, also parse the .res, .req and .gra files into the local result cache (see
+        `load_results`), by default False
 
     Returns
     -------
     List[Path]
         A list of paths to the downloaded files
     """
+    files = _call_daemon('get_results',
+                         remote_dir=Path(remote_dir).as_posix(),
+                         local_dir=str(Path(local_dir).absolute()),
+                         extensions=list(extensions) if extensions is not None else None,
+                         sync=sync,
+                         cache=cache)
+    if files is not None:
+        return [Path(p) for p in files]
+
     cmd = [str(get_binary())]
 
     if _log_level:
@@ -279,6 +944,12 @@ def get_results(remote_dir: Path, local_dir: Path, extensions=None, _log_level=N
     if extensions is not None:
         cmd.extend(['--extensions', ' '.join(extensions)])
 
+    if sync:
+        cmd.append('--sync')
+
+    if cache:
+        cmd.append('--cache')
+
     startupinfo = subprocess.STARTUPINFO()
     startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
 
@@ -301,6 +972,34 @@ def get_results(remote_dir: Path, local_dir: Path, extensions=None, _log_level=N
     return [Path(p) for p in output if p.strip()]
 
 
+def load_results(remote_dir: Path, extension: str = '.res') -> Dict[str, np.ndarray]:
+    """Load a parsed result file of a job, from the local result cache if it is up to date
+
+    Parameters
+    ----------
+    remote_dir : Path
+        The remote directory of the job
+    extension : str, optional
+        '.res', '.req' or '.gra', by default '.res'
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        The columns of the file (see `result_cache.parse_result_file`)
+    """
+    data = _call_daemon('load_results', remote_dir=Path(remote_dir).as_posix(), extension=extension)
+    if data is not None:
+        return {name: np.asarray(values) for name, values in data.items()}
+
+    with TemporaryDirectory() as tmpdir:
+        output = Path(tmpdir) / 'results.npz'
+        _run_binary('load_results', Path(remote_dir).as_posix(),
+                    '--extension', extension,
+                    '--output', str(output))
+        with np.load(output) as npz:
+            return {name: npz[name] for name in npz.files}
+
+
 def get_binary_version():
     cmd = [f'"{get_binary(print_=False)}"', 'version']
 
@@ -322,6 +1021,10 @@ def get_binary_version():
 
 
 def get_job_table():
+    out = _call_daemon('get_job_table')
+    if out is not None:
+        return pd.read_csv(StringIO(out))
+
     cmd = [str(get_binary()), 'get_job_table']
 
     startupinfo = subprocess.STARTUPINFO()
@@ -343,6 +1046,24 @@ def get_job_table():
 
 
 def resubmit_job(remote_dir: Path, wait_for_completion: bool = False, **kwargs):
+    output = _call_daemon('resubmit_job',
+                          remote_dir=Path(remote_dir).as_posix(),
+                          **{k: str(v) for k, v in kwargs.items()})
+
+    if output is None:
+        output = _resubmit_job_with_binary(Path(remote_dir), **kwargs)
+
+    remote_dir_ = Path(output['remote_dir'])
+    job_name = output['job_name']
+    job_id = int(output['job_id'])
+
+    if wait_for_completion:
+        _wait_for_job(remote_dir_, job_id)
+
+    return remote_dir_, job_name, job_id
+
+
+def _resubmit_job_with_binary(remote_dir: Path, **kwargs):
     cmd = [str(get_binary()), 'resubmit_job', remote_dir.as_posix()]
 
     for k, v in kwargs.items():
@@ -362,14 +1083,28 @@ def resubmit_job(remote_dir: Path, wait_for_completion: bool = False, **kwargs):
     if err and 'UserWarning' not in err:
         raise RuntimeError(err)
 
-    output = json.loads(out)
+    return json.loads(out)
 
-    remote_dir_ = Path(output['remote_dir'])
-    job_name = output['job_name']
-    job_id = int(output['job_id'])
 
-    if wait_for_completion:
-        while True:
-            check_if_finished(remote_dir_)
+def _call_daemon(method: str, **params):
+    """Call `method` on the local aview_hpc daemon (see `aview_hpc.daemon`)
 
-    return remote_dir_, job_name, job_id
+    Returns None if the daemon is disabled with the `use_daemon` config setting or can't be
+    started, in which case the caller should fall back to running the binary. If the connection is
+    lost after the request was sent, methods in `NON_IDEMPOTENT_METHODS` raise instead, since the
+    daemon may already have run them.
+    """
+    if not is_enabled(get_config(), 'use_daemon'):
+        return None
+
+    try:
+        return daemon.call(method, **params)
+    except daemon.DaemonUnavailable as err:
+        LOG.warning(f'{err}. Falling back to the aview_hpc binary.')
+        return None
+    except daemon.DaemonConnectionLost as err:
+        if method in NON_IDEMPOTENT_METHODS:
+            raise RuntimeError(f'{err}. The request may have been carried out, so it was not '
+                               'retried. Check the job table before trying again.') from err
+        LOG.warning(f'{err}. Falling back to the aview_hpc binary.')
+        return None
@@ -5,6 +5,9 @@ import keyring
 
 CONFIG_FILE = Path.home() / '.aview_hpc'
 
+# Directory for local state (indexes, caches, journals)
+DATA_DIR = Path.home() / '.aview_hpc_data'
+
 
 def get_config():
     """Get the configuration for the HPC cluster"""
@@ -18,6 +21,11 @@ def get_config():
     return config
 
 
+def is_enabled(config: dict, key: str, default: bool = True) -> bool:
+    """Interpret a config setting as a boolean (settings set from the command line are strings)"""
+    return str(config.get(key, default)).lower() not in ('0', 'false', 'no', 'off', 'none')
+
+
 def set_config(host=None, username=None, password=None, **kwargs):
     """Set the configuration for the HPC cluster"""
     config = get_config()
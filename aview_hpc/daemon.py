@@ -0,0 +1,420 @@
+"""A long-lived local service that keeps warm HPC sessions and serves requests over JSON-RPC
+
+The daemon is the `daemon` subcommand of the aview_hpc binary. It binds to a random port on
+localhost and writes the port and a random token to `STATE_FILE`. Clients (see `call`) read that
+file, start the daemon if it isn't running, and send one newline-delimited JSON-RPC 2.0 request per
+connection. The daemon shuts itself down after it has been idle for `IDLE_TIMEOUT` seconds.
+
+Notes
+-----
+* This module is imported by `aview_hpc.aview_hpc`, so only the standard library may be imported at
+  module level. The server side imports `._cli` lazily.
+"""
+import json
+import logging
+import os
+import secrets
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from tempfile import gettempdir
+from typing import Any, Callable, Dict
+
+from .version import version as PKG_VERSION
+
+LOG = logging.getLogger(__name__)
+STATE_FILE = Path(gettempdir()) / 'aview_hpc_daemon.json'
+
+# Seconds of inactivity after which the daemon shuts down
+IDLE_TIMEOUT = 1800
+
+# Seconds to wait for a newly started daemon to come up
+STARTUP_TIMEOUT = 30
+
+
+class DaemonUnavailable(Exception):
+    """Raised when the daemon can't be reached or started (the request was not sent)"""
+
+
+class DaemonConnectionLost(RuntimeError):
+    """Raised when the connection to the daemon is lost after the request was sent, so the method
+    may or may not have run"""
+
+
+# --------------------------------------------------------------------------------------------------
+# Client
+# --------------------------------------------------------------------------------------------------
+def call(method: str, _socket_timeout: float = None, **params) -> Any:
+    """Call a method on the daemon, starting it if necessary
+
+    Parameters
+    ----------
+    method : str
+        The name of the method to call (see `_methods`)
+    _socket_timeout : float, optional
+        Socket timeout in seconds, by default None (wait forever). Named so that it can't clash with
+        a `timeout` parameter of the method.
+    **params
+        Keyword arguments passed to the method. Must be JSON serializable.
+
+    Returns
+    -------
+    Any
+        The result of the method
+
+    Raises
+    ------
+    DaemonUnavailable
+        If the daemon could not be reached or started
+    DaemonConnectionLost
+        If the connection was lost (or timed out) after the request was sent
+    RuntimeError
+        If the method raised an error in the daemon
+    """
+    state = _read_state()
+    if state is None or not _ping(state):
+        state = start()
+
+    return _request(state, method, params, timeout=_socket_timeout)
+
+
+def start() -> Dict[str, Any]:
+    """Start the daemon in the background and wait for it to come up
+
+    Returns
+    -------
+    Dict[str, Any]
+        The contents of the state file written by the daemon
+    """
+    # Imported here because it pulls in `requests`
+    from .get_binary import get_binary
+
+    LOG.info('Starting the aview_hpc daemon...')
+    STATE_FILE.unlink(missing_ok=True)
+
+    creationflags = (getattr(subprocess, 'DETACHED_PROCESS', 0)
+                     | getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0)
+                     | getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    try:
+        subprocess.Popen([str(get_binary()), 'daemon'],
+                         cwd=gettempdir(),
+                         stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL,
+                         creationflags=creationflags,
+                         close_fds=True)
+    except OSError as err:
+        raise DaemonUnavailable(f'Could not start the aview_hpc daemon: {err}') from err
+
+    t_start = time.monotonic()
+    while time.monotonic() - t_start < STARTUP_TIMEOUT:
+        state = _read_state()
+        if state is not None and _ping(state):
+            return state
+        time.sleep(0.2)
+
+    raise DaemonUnavailable(f'The aview_hpc daemon did not start within {STARTUP_TIMEOUT} seconds')
+
+
+def stop():
+    """Ask a running daemon to shut down"""
+    state = _read_state()
+    if state is not None:
+        try:
+            _request(state, 'shutdown', {}, timeout=5)
+        except (DaemonUnavailable, DaemonConnectionLost):
+            pass
+
+
+def _read_state():
+    try:
+        return json.loads(STATE_FILE.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _ping(state: Dict[str, Any]) -> bool:
+    try:
+        result = _request(state, 'ping', {}, timeout=5)
+    except (DaemonUnavailable, RuntimeError):
+        return False
+
+    if result['version'] != PKG_VERSION:
+        LOG.info(f'Daemon version mismatch: {result["version"]} (expected: {PKG_VERSION})')
+        try:
+            _request(state, 'shutdown', {}, timeout=5)
+        except (DaemonUnavailable, RuntimeError):
+            pass
+        return False
+
+    return True
+
+
+def _request(state: Dict[str, Any], method: str, params: dict, timeout: float = None):
+    request = {'jsonrpc': '2.0',
+               'id': secrets.randbits(32),
+               'method': method,
+               'params': params,
+               'token': state['token']}
+    try:
+        sock = socket.create_connection(('127.0.0.1', state['port']), timeout=5)
+    except OSError as err:
+        raise DaemonUnavailable(f'Could not reach the aview_hpc daemon: {err}') from err
+
+    with sock:
+        try:
+            sock.sendall(json.dumps(request).encode() + b'\n')
+        except OSError as err:
+            raise DaemonUnavailable(f'Could not send the request to the aview_hpc daemon: {err}'
+                                    ) from err
+
+        # From here on the daemon may have started running the method
+        try:
+            sock.settimeout(timeout)
+            with sock.makefile('rb') as fid:
+                line = fid.readline()
+        except OSError as err:
+            raise DaemonConnectionLost(f'Lost the connection to the aview_hpc daemon during '
+                                       f'{method}: {err}') from err
+
+    if not line:
+        raise DaemonConnectionLost(f'The aview_hpc daemon closed the connection during {method}')
+
+    response = json.loads(line)
+    if 'error' in response:
+        raise RuntimeError(response['error']['message'])
+
+    return response['result']
+
+
+# --------------------------------------------------------------------------------------------------
+# Server
+# --------------------------------------------------------------------------------------------------
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = False
+
+    def __init__(self, methods: Dict[str, Callable], idle_timeout: float):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.methods = methods
+        self.idle_timeout = idle_timeout
+        self.token = secrets.token_hex(16)
+        self.last_activity = time.monotonic()
+        self.active = 0
+        self.lock = threading.Lock()
+        self.busy: Callable[[], bool] = lambda: False
+
+    def watch_idle(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 10))
+            with self.lock:
+                idle = self.active == 0 and time.monotonic() - self.last_activity > self.idle_timeout
+
+            # e.g. queued submissions still to be released
+            if idle and self.busy():
+                idle = False
+                with self.lock:
+                    self.last_activity = time.monotonic()
+
+            if idle:
+                LOG.info(f'Idle for {self.idle_timeout} seconds. Shutting down...')
+                self.shutdown()
+                return
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: _Server
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            with self.server.lock:
+                self.server.active += 1
+            try:
+                response = self._dispatch(line)
+            finally:
+                with self.server.lock:
+                    self.server.active -= 1
+                    self.server.last_activity = time.monotonic()
+
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+    def _dispatch(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+        except ValueError as err:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': str(err)}}
+
+        req_id = request.get('id')
+        if not secrets.compare_digest(str(request.get('token', '')), self.server.token):
+            return {'jsonrpc': '2.0', 'id': req_id, 'error': {'code': -32001, 'message': 'Bad token'}}
+
+        method = self.server.methods.get(request.get('method'))
+        if method is None:
+            return {'jsonrpc': '2.0',
+                    'id': req_id,
+                    'error': {'code': -32601, 'message': f'Unknown method: {request.get("method")}'}}
+
+        LOG.info(f'Daemon request: {request["method"]}')
+        try:
+            result = method(**request.get('params', {}))
+        except Exception as err:  # noqa: BLE001
+            LOG.exception(f'Error in daemon method {request["method"]}')
+            return {'jsonrpc': '2.0',
+                    'id': req_id,
+                    'error': {'code': -32000, 'message': f'{type(err).__name__}: {err}'}}
+
+        return {'jsonrpc': '2.0', 'id': req_id, 'result': result}
+
+
+def serve(idle_timeout: float = None):
+    """Run the daemon in the foreground until it has been idle for `idle_timeout` seconds
+
+    Parameters
+    ----------
+    idle_timeout : float, optional
+        Seconds of inactivity before shutting down, by default the `daemon_idle_timeout` config
+        setting or `IDLE_TIMEOUT`
+    """
+    from .config import get_config
+
+    state = _read_state()
+    if state is not None and _ping(state):
+        LOG.info(f'The aview_hpc daemon is already running on port {state["port"]}')
+        return
+
+    if idle_timeout is None:
+        idle_timeout = float(get_config().get('daemon_idle_timeout', IDLE_TIMEOUT))
+
+    from .scheduler import is_busy
+
+    server = _Server(_methods(), idle_timeout)
+    server.busy = is_busy
+    server.methods['shutdown'] = lambda: threading.Thread(target=server.shutdown).start()
+
+    port = server.server_address[1]
+    STATE_FILE.write_text(json.dumps({'port': port,
+                                      'token': server.token,
+                                      'pid': os.getpid(),
+                                      'version': PKG_VERSION}))
+    LOG.info(f'aview_hpc daemon listening on port {port}')
+
+    threading.Thread(target=server.watch_idle, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if (_read_state() or {}).get('pid') == os.getpid():
+            STATE_FILE.unlink(missing_ok=True)
+        LOG.info('aview_hpc daemon stopped')
+
+
+def _methods() -> Dict[str, Callable]:
+    """The methods served by the daemon. Results match the JSON printed by the CLI."""
+    from . import _cli
+
+    def submit(acf_file: str, adm_file: str = None, aux_files: list = None, **kwargs):
+        remote_dir, job_name, job_id = _cli.submit(
+            acf_file=Path(acf_file),
+            adm_file=Path(adm_file) if adm_file is not None else None,
+            aux_files=[Path(f) for f in aux_files] if aux_files else None,
+            **kwargs)
+        return {'remote_dir': remote_dir.as_posix(), 'job_name': job_name, 'job_id': job_id}
+
+    def submit_multi(acf_files: list, adm_files: list, aux_files: list = None, **kwargs):
+        remote_dirs, job_names, job_ids = _cli.submit_multi(
+            acf_files=[Path(f) for f in acf_files],
+            adm_files=[Path(f) for f in adm_files],
+            aux_files=[[Path(f) for f in files] for files in aux_files] if aux_files else None,
+            **kwargs)
+        return {'remote_dirs': [d.as_posix() for d in remote_dirs],
+                'job_names': job_names,
+                'job_ids': job_ids}
+
+    def get_results(remote_dir: str, local_dir: str, extensions: list = None, sync: bool = False,
+                    cache: bool = False):
+        files = _cli.get_results(Path(remote_dir), Path(local_dir), extensions=extensions, sync=sync,
+                                 cache=cache)
+        return [str(f) for f in files]
+
+    def load_results(remote_dir: str, extension: str = '.res'):
+        data = _cli.load_results(Path(remote_dir), extension=extension)
+        return {name: values.tolist() for name, values in data.items()}
+
+    def check_if_finished(remote_dir: str):
+        return _cli.check_if_finished(Path(remote_dir))
+
+    def check_if_finished_and_get_errors(remote_dir: str,
+                                         ignore_static: bool = False,
+                                         ignore_parse: bool = False):
+        return _cli.check_if_finished_and_get_errors(Path(remote_dir),
+                                                     ignore_static=ignore_static,
+                                                     ignore_parse=ignore_parse)
+
+    def extract_results(remote_dir: str, channels: list = None):
+        data = _cli.extract_results(Path(remote_dir), channels=channels)
+        return {name: values.tolist() for name, values in data.items()}
+
+    def get_remote_dir_status(remote_dir: str):
+        return [{k: v.strftime('%G-%m-%dT%H:%M:%S') if hasattr(v, 'strftime') else v
+                 for k, v in status.items()}
+                for status in _cli.get_remote_dir_status(Path(remote_dir))]
+
+    def get_dirs_status(remote_dirs: list):
+        return _cli.get_dirs_status([Path(d) for d in remote_dirs])
+
+    def wait_for_jobs(remote_dirs: list = None, job_ids: list = None, timeout: float = None,
+                      ignore_static: bool = False, ignore_parse: bool = False):
+        results = _cli.wait_for_jobs(remote_dirs=remote_dirs, job_ids=job_ids, timeout=timeout,
+                                     ignore_static=ignore_static, ignore_parse=ignore_parse)
+        return [asdict(r) for r in results]
+
+    def enqueue_submit(acf_file: str, adm_file: str = None, aux_files: list = None, **kwargs):
+        return _cli.enqueue_submit(Path(acf_file),
+                                   Path(adm_file) if adm_file is not None else None,
+                                   [Path(f) for f in aux_files or []],
+                                   **kwargs)
+
+    def get_ticket(ticket: int):
+        return _cli.get_ticket(ticket)
+
+    def cancel_ticket(ticket: int):
+        return _cli.cancel_ticket(ticket)
+
+    def cancel_job(job_id: str):
+        _cli.cancel_job(job_id)
+        return True
+
+    def get_job_table():
+        return _cli.get_job_table().to_csv(index=False)
+
+    def resubmit_job(remote_dir: str, **kwargs):
+        remote_dir_, job_name, job_id = _cli.resubmit_job(Path(remote_dir), **kwargs)
+        return {'remote_dir': remote_dir_.as_posix(), 'job_name': job_name, 'job_id': job_id}
+
+    def ping():
+        return {'version': PKG_VERSION, 'pid': os.getpid(), 'pool': _cli.get_pool().stats}
+
+    return {'submit': submit,
+            'submit_multi': submit_multi,
+            'get_results': get_results,
+            'check_if_finished': check_if_finished,
+            'check_if_finished_and_get_errors': check_if_finished_and_get_errors,
+            'extract_results': extract_results,
+            'get_remote_dir_status': get_remote_dir_status,
+            'get_dirs_status': get_dirs_status,
+            'wait_for_jobs': wait_for_jobs,
+            'cancel_job': cancel_job,
+            'enqueue_submit': enqueue_submit,
+            'get_ticket': get_ticket,
+            'cancel_ticket': cancel_ticket,
+            'get_job_table': get_job_table,
+            'resubmit_job': resubmit_job,
+            'ping': ping}
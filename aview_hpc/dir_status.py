@@ -0,0 +1,96 @@
+"""The status of many remote job directories in a single round trip
+
+`status_command` builds one shell command that lists the files in every directory (`find -printf`,
+with sub-second modification times) and greps each .msg file for the completion marker and error
+blocks. `parse_status_output` turns its output into one status per directory:
+
+* `files`: The name, size and modification time (seconds since the epoch) of each file
+* `last_update`, `last_file`: The most recently modified file (None if the directory is empty or
+  doesn't exist)
+* `finished`: Whether the .msg file contains the completion marker
+* `n_errors`: The number of error blocks in the .msg file
+"""
+import shlex
+from pathlib import PurePosixPath
+from typing import Dict, List
+
+# The sections of the output of `status_command`
+FILES_MARKER = '==FILES=='
+FINISHED_MARKER = '==FINISHED=='
+ERRORS_MARKER = '==ERRORS=='
+
+# The same markers `msg.MsgTail` looks for
+FINISH_REGEX = '^Finished -----[[:space:]]*$'
+START_ERROR = '---- START: ERROR ----'
+
+
+def status_command(remote_dirs: List[str]) -> str:
+    """Get the shell command that reports the status of `remote_dirs`
+
+    Parameters
+    ----------
+    remote_dirs : List[str]
+        The posix paths of the remote directories
+    """
+    dirs = [shlex.quote(PurePosixPath(d).as_posix()) for d in remote_dirs]
+    msg_files = ' '.join(f'{d}/*.msg' for d in dirs)
+    return '; '.join([
+        f'echo {FILES_MARKER}',
+        f'find {" ".join(dirs)} -maxdepth 1 -type f -printf "%h\\t%f\\t%s\\t%T@\\n" 2>/dev/null',
+        f'echo {FINISHED_MARKER}',
+        f'grep -H -c -E {shlex.quote(FINISH_REGEX)} {msg_files} 2>/dev/null',
+        f'echo {ERRORS_MARKER}',
+        f'grep -H -c -F -- {shlex.quote(START_ERROR)} {msg_files} 2>/dev/null',
+        'true'])
+
+
+def parse_status_output(output: str, remote_dirs: List[str]) -> Dict[str, dict]:
+    """Parse the output of `status_command`
+
+    Parameters
+    ----------
+    output : str
+        The output of `status_command`
+    remote_dirs : List[str]
+        The remote directories passed to `status_command`
+
+    Returns
+    -------
+    Dict[str, dict]
+        The status of each directory, keyed by its posix path
+    """
+    status = {PurePosixPath(d).as_posix(): {'files': [],
+                                            'last_update': None,
+                                            'last_file': None,
+                                            'finished': False,
+                                            'n_errors': 0}
+              for d in remote_dirs}
+
+    section = None
+    for line in output.splitlines():
+        if line in (FILES_MARKER, FINISHED_MARKER, ERRORS_MARKER):
+            section = line
+
+        elif section == FILES_MARKER and line.count('\t') == 3:
+            directory, name, size, mtime = line.split('\t')
+            if directory in status:
+                status[directory]['files'].append({'name': name,
+                                                   'size': int(size),
+                                                   'mtime': float(mtime)})
+
+        elif section in (FINISHED_MARKER, ERRORS_MARKER) and ':' in line:
+            path, count = line.rsplit(':', 1)
+            directory = PurePosixPath(path).parent.as_posix()
+            if directory not in status or not count.isdigit():
+                continue
+            if section == FINISHED_MARKER:
+                status[directory]['finished'] |= int(count) > 0
+            else:
+                status[directory]['n_errors'] += int(count)
+
+    for dir_status in status.values():
+        if dir_status['files']:
+            last = max(dir_status['files'], key=lambda f: f['mtime'])
+            dir_status['last_update'], dir_status['last_file'] = last['mtime'], last['name']
+
+    return status
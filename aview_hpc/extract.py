@@ -0,0 +1,115 @@
+"""Extract selected result components on the cluster so only they cross the network
+
+`HELPER_SCRIPT` is a small, standard library only, Python script that is run over SSH next to the
+data. It parses a .res file incrementally and writes the requested components to stdout in a compact
+binary format:
+
+* One line of JSON: `{"columns": [<entity>.<component>, ...]}`
+* One row of little endian float64 values per step, one value per column
+
+If the StepMap changes part way through the file, later steps are mapped to the original columns by
+name (components that are no longer present are NaN).
+"""
+import json
+import shlex
+from io import BufferedIOBase
+from typing import Dict, List
+
+import numpy as np
+
+# Default command used to run the helper on the cluster
+REMOTE_PYTHON = 'python3'
+
+HELPER_SCRIPT = r'''
+import json
+import sys
+from array import array
+from xml.etree.ElementTree import iterparse
+
+NS = '{http://www.mscsoftware.com/:xrf10}'
+res_file, wanted = sys.argv[1], json.loads(sys.argv[2])
+out = sys.stdout.buffer
+columns, indices, stack = None, None, []
+swap = sys.byteorder != 'little'
+
+
+def select(step_map):
+    found = {}
+    for entity in step_map.iter(NS + 'Entity'):
+        for comp in entity.iter(NS + 'Component'):
+            name = entity.get('name') + '.' + comp.get('name')
+            if wanted is None or name in wanted or entity.get('name') in wanted:
+                found[name] = int(comp.get('id')) - 1
+    return found
+
+
+for event, elem in iterparse(res_file, events=('start', 'end')):
+    if event == 'start':
+        stack.append(elem)
+        continue
+
+    stack.pop()
+    tag = elem.tag.replace(NS, '')
+    if tag == 'StepMap':
+        found = select(elem)
+        if columns is None:
+            missing = [w for w in wanted or []
+                       if w not in found and not any(n.startswith(w + '.') for n in found)]
+            if missing:
+                sys.exit('Components not found in %s: %s' % (res_file, missing))
+            columns = list(found)
+            out.write(json.dumps({'columns': columns}).encode() + b'\n')
+        indices = [found.get(name) for name in columns]
+
+    elif tag == 'Step':
+        values = elem.text.split()
+        row = array('d', [float(values[i]) if i is not None else float('nan') for i in indices])
+        if swap:
+            row.byteswap()
+        out.write(row.tobytes())
+
+    if tag in ('Step', 'Data', 'StepMap') and stack:
+        stack[-1].remove(elem)
+
+out.flush()
+'''
+
+
+def helper_command(res_file: str, channels: List[str] = None, python: str = REMOTE_PYTHON) -> str:
+    """Get the shell command that runs `HELPER_SCRIPT` on `res_file`
+
+    Parameters
+    ----------
+    res_file : str
+        The posix path of the .res file on the cluster
+    channels : List[str], optional
+        The components to extract (`<entity>.<component>` or `<entity>`), by default all
+    python : str, optional
+        The python command on the cluster, by default `REMOTE_PYTHON`
+    """
+    return ' '.join([python,
+                     '-c', shlex.quote(HELPER_SCRIPT),
+                     shlex.quote(res_file),
+                     shlex.quote(json.dumps(list(channels) if channels is not None else None))])
+
+
+def read_helper_output(stream: BufferedIOBase) -> Dict[str, np.ndarray]:
+    """Read the output of `HELPER_SCRIPT` into an array per component
+
+    Parameters
+    ----------
+    stream : BufferedIOBase
+        The stdout of the helper
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        The values of each component for every step in the file
+    """
+    header = stream.readline()
+    if not header:
+        return {}
+
+    columns = json.loads(header)['columns']
+    values = np.frombuffer(stream.read(), dtype='<f8').reshape(-1, len(columns))
+    return {name: values[:, i] for i, name in enumerate(columns)}
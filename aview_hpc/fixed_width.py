@@ -0,0 +1,158 @@
+"""Vectorized readers for the fixed width Adams result files (.req and .gra)
+
+Both files have a short header followed by one block ("frame") per output step: a line holding the
+time (a single E13.5 field) followed by a fixed number of lines of E13.5 values. Every frame has the
+same byte layout, so the layout is worked out once from the first frame and the rest of the file is
+decoded in bulk with `np.frombuffer` and a structured dtype. Files can be memory mapped, so they are
+never read into Python strings line by line.
+
+Notes
+-----
+* The header of a .gra file ends with the first frame, whose time is the sentinel -9.99999E+05 (the
+  model input configuration).
+* If the frames don't all have the same layout (or a value can't be parsed, e.g. a three digit
+  exponent written without the `E`), the file is decoded with a slower token based fallback.
+"""
+import logging
+import mmap
+import re
+from pathlib import Path
+from typing import NamedTuple, Union
+
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+
+# Width of a value field (Fortran E13.5)
+FIELD_WIDTH = 13
+
+# Number of header lines before the frames can start
+HEADER_LINES = 3
+
+# A line holding only a time value (the first line of each frame)
+TIME_LINE_PATTERN = re.compile(rb'^ *-?\d\.\d+E[+-]\d+ *\r?$', flags=re.MULTILINE)
+
+# A three digit exponent written without the E (e.g. 1.00000-100)
+BARE_EXPONENT_PATTERN = re.compile(rb'(\d)([+-]\d{3})\b')
+
+
+class FixedWidthData(NamedTuple):
+    """The frames of a .req or .gra file"""
+    times: np.ndarray
+    """The time of each frame (n_frames,)"""
+    values: np.ndarray
+    """The values of each frame (n_frames, n_lines, n_fields) if every value line has the same
+    number of fields, otherwise (n_frames, n_values)"""
+
+
+def read_fixed_width(source: Union[Path, bytes]) -> FixedWidthData:
+    """Read the frames of a .req or .gra file
+
+    Parameters
+    ----------
+    source : Union[Path, bytes]
+        The file (which is memory mapped) or its content
+
+    Returns
+    -------
+    FixedWidthData
+        The time and values of each frame
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as fid:
+            if Path(source).stat().st_size == 0:
+                return FixedWidthData(np.empty(0), np.empty((0, 0)))
+            with mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _decode(data)
+
+    return _decode(bytes(source))
+
+
+read_req = read_fixed_width
+read_gra = read_fixed_width
+
+
+def _decode(data: Union[bytes, mmap.mmap]) -> FixedWidthData:
+    start = 0
+    for _ in range(HEADER_LINES):
+        start = data.find(b'\n', start) + 1
+
+    first = TIME_LINE_PATTERN.search(data, start) if start > 0 else None
+    if first is None:
+        return FixedWidthData(np.empty(0), np.empty((0, 0)))
+    start = first.start()
+
+    # Ignore trailing blank lines
+    end = len(data)
+    while end > start and data[end - 1:end] in (b'\n', b'\r', b' '):
+        end -= 1
+
+    second = TIME_LINE_PATTERN.search(data, first.end())
+    frame_size = (second.start() if second is not None else end + 1) - start
+
+    lines = bytes(data[start:start + frame_size]).splitlines(keepends=True)
+    n_fields = [len(line.split()) for line in lines[1:]]
+    end = min(end + len(lines[-1]) - len(lines[-1].rstrip(b'\r\n')), len(data))
+
+    try:
+        dtype = _frame_dtype(lines)
+    except ValueError:
+        dtype = None
+
+    n_frames, remainder = divmod(end - start, frame_size)
+    if dtype is not None and remainder == 0:
+        try:
+            frames = np.frombuffer(data, dtype=dtype, count=n_frames, offset=start)
+            times = frames['t'].astype(np.float64)
+            values = np.empty((n_frames, 0))
+            if sum(n_fields) > 0:
+                values = np.stack([frames[f'v{i}'] for i in range(sum(n_fields))], axis=-1)
+                values = values.astype(np.float64)
+        except ValueError:
+            LOG.debug('Could not decode the frames in bulk. Falling back to tokenizing.')
+        else:
+            return FixedWidthData(times, _shape(values, n_fields))
+
+    return _decode_tokens(bytes(data[start:end]), n_fields)
+
+
+def _frame_dtype(lines: list) -> np.dtype:
+    """Build a structured dtype matching the byte layout of a frame"""
+    fields, i_value = [], 0
+    for i_line, line in enumerate(lines):
+        content = line.rstrip(b'\r\n')
+        newline = len(line) - len(content)
+        n_fields = len(content.split())
+
+        if i_line == 0:
+            fields.append(('t', f'S{len(content)}'))
+        else:
+            pad = len(content) - n_fields * FIELD_WIDTH
+            if pad < 0:
+                raise ValueError(f'Line {i_line} of the frame is not fixed width')
+            if pad > 0:
+                fields.append((f'pad{i_line}', f'S{pad}'))
+            for _ in range(n_fields):
+                fields.append((f'v{i_value}', f'S{FIELD_WIDTH}'))
+                i_value += 1
+
+        if newline:
+            fields.append((f'nl{i_line}', f'S{newline}'))
+
+    return np.dtype(fields)
+
+
+def _decode_tokens(data: bytes, n_fields: list) -> FixedWidthData:
+    """Decode frames by splitting on whitespace (for files that aren't strictly fixed width)"""
+    tokens = BARE_EXPONENT_PATTERN.sub(rb'\1E\2', data).split()
+    per_frame = 1 + sum(n_fields)
+    n_frames = len(tokens) // per_frame
+    values = np.array(tokens[:n_frames * per_frame], dtype=np.float64).reshape(n_frames, per_frame)
+    return FixedWidthData(values[:, 0], _shape(values[:, 1:], n_fields))
+
+
+def _shape(values: np.ndarray, n_fields: list) -> np.ndarray:
+    if n_fields and len(set(n_fields)) == 1:
+        return values.reshape(len(values), len(n_fields), n_fields[0])
+
+    return values
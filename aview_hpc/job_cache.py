@@ -0,0 +1,137 @@
+"""A local cache of the Slurm job table that is refreshed incrementally
+
+The first refresh loads the whole window (`sacct -S now-<days>days`). Later refreshes only ask
+sacct for the jobs that were active since the previous poll (`sacct -S now-<seconds>seconds`, plus a
+small overlap), which is every job that changed state in that time. Those rows replace the cached
+ones. Jobs that ended before the window are dropped, so the cache holds the same rows as a full
+query would.
+
+Notes
+-----
+* Elapsed times are measured with the local monotonic clock and passed to sacct relative to `now`,
+  so the cache doesn't depend on the local and cluster clocks agreeing.
+* A full reload is done every `FULL_REFRESH` seconds in case rows disappear from the accounting
+  database.
+* JobIDs are kept as strings (array tasks look like `123_4`) and sorted numerically by job then task
+  (see `sort_by_job_id`), so the last row of a job directory is its most recent job.
+"""
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+LOG = logging.getLogger(__name__)
+
+# Seconds added to each incremental window so changes made during the previous query aren't missed
+OVERLAP = 30
+
+# Seconds between full reloads
+FULL_REFRESH = 6 * 3600
+
+_CACHES: Dict[Tuple[str, float], 'JobTableCache'] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+class JobTableCache():
+    """The job table of one user on one cluster
+
+    Parameters
+    ----------
+    days : float, optional
+        The number of days of history to keep, by default 7
+    """
+
+    def __init__(self, days: float = 7):
+        self.days = days
+        self.table: pd.DataFrame = None
+        self.lock = threading.Lock()
+        self._last_poll = None
+        self._last_full = None
+
+    def refresh(self, query: Callable[[str], pd.DataFrame], full: bool = False) -> pd.DataFrame:
+        """Bring the cached table up to date and return a copy of it
+
+        Parameters
+        ----------
+        query : Callable[[str], pd.DataFrame]
+            Runs sacct from the given start time (e.g. `now-7days`) and returns the parsed table
+        full : bool, optional
+            Reload the whole window instead of just the changes, by default False
+
+        Returns
+        -------
+        pd.DataFrame
+            The job table, sorted by JobID
+        """
+        with self.lock:
+            started = time.monotonic()
+            if (full or self.table is None or started - self._last_full > FULL_REFRESH):
+                LOG.debug(f'Loading the last {self.days} days of jobs')
+                self.table = _str_job_ids(query(f'now-{self.days:.0f}days'))
+                self._last_full = started
+
+            else:
+                seconds = math.ceil(started - self._last_poll + OVERLAP)
+                delta = _str_job_ids(query(f'now-{seconds}seconds'))
+                LOG.debug(f'{len(delta)} jobs changed in the last {seconds} seconds')
+                self.table = self._merge(delta)
+
+            self._last_poll = started
+            return sort_by_job_id(self.table).reset_index(drop=True)
+
+    def _merge(self, delta: pd.DataFrame) -> pd.DataFrame:
+        """Replace the cached rows of the jobs in `delta` and drop jobs that ended before the
+        window"""
+        table = self.table[~self.table['JobID'].isin(delta['JobID'])]
+        if len(delta):
+            table = pd.concat([table, delta], ignore_index=True)
+
+        cutoff = datetime.now() - timedelta(days=self.days)
+        ended = pd.to_datetime(table['End'], errors='coerce')
+        return table[~(ended < cutoff)]
+
+
+def sort_by_job_id(table: pd.DataFrame) -> pd.DataFrame:
+    """Sort a job table by JobID, numerically by job and then by array task
+
+    Parameters
+    ----------
+    table : pd.DataFrame
+        A job table. JobIDs may be ints or strings such as `123`, `123_4` or `123_[5-9]`.
+
+    Returns
+    -------
+    pd.DataFrame
+        The sorted table
+    """
+    parts = table['JobID'].astype(str).str.extract(r'^(\d+)(?:_\[?(\d+))?')
+    job = pd.to_numeric(parts[0], errors='coerce').to_numpy(dtype=float)
+    task = pd.to_numeric(parts[1], errors='coerce').fillna(-1).to_numpy(dtype=float)
+    return table.iloc[np.lexsort((task, job))]
+
+
+def _str_job_ids(table: pd.DataFrame) -> pd.DataFrame:
+    return table.assign(JobID=table['JobID'].astype(str))
+
+
+def get_job_cache(key: str, days: float = 7) -> JobTableCache:
+    """Get the process-wide job table cache of a cluster, creating it if necessary
+
+    Parameters
+    ----------
+    key : str
+        Identifies the cluster and user (e.g. user@host)
+    days : float, optional
+        The number of days of history, by default 7
+    """
+    with _CACHES_LOCK:
+        cache = _CACHES.get((key, days))
+        if cache is None:
+            cache = _CACHES[(key, days)] = JobTableCache(days)
+
+    return cache
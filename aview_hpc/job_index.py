@@ -0,0 +1,269 @@
+"""A persistent local index of every job submitted from this machine
+
+Slurm's accounting database only remembers recent jobs, and knows nothing about the local input
+files. The index is a SQLite database that links each job ID to its job name, remote directory, ACF
+file and a hash of the content of its input files. It is written when jobs are submitted or
+resubmitted and whenever the job table is refreshed (`HPCSession.get_job_table`). Every change of
+state is also recorded, so the history of a job is still there after sacct has forgotten it.
+
+Notes
+-----
+* The database is opened in WAL mode, so several processes (Adams View, the daemon, the job
+  monitor) can use it at the same time.
+* Jobs seen in the job table that weren't submitted through `aview_hpc` are added too, without an
+  ACF file or input hash.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Union
+
+import pandas as pd
+
+from .config import DATA_DIR, get_config
+
+LOG = logging.getLogger(__name__)
+DB_FILE = DATA_DIR / 'job_index.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    host TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    job_name TEXT,
+    remote_dir TEXT,
+    acf_file TEXT,
+    input_hash TEXT,
+    state TEXT,
+    submit_time REAL,
+    update_time REAL,
+    PRIMARY KEY (host, job_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_job_id ON jobs (job_id);
+CREATE INDEX IF NOT EXISTS jobs_job_name ON jobs (job_name);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE INDEX IF NOT EXISTS jobs_submit_time ON jobs (submit_time);
+CREATE INDEX IF NOT EXISTS jobs_input_hash ON jobs (input_hash);
+CREATE INDEX IF NOT EXISTS jobs_remote_dir ON jobs (remote_dir);
+
+CREATE TABLE IF NOT EXISTS transitions (
+    host TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_job ON transitions (host, job_id);
+'''
+
+SUBMITTED = 'SUBMITTED'
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+class JobIndex():
+    """The job index database
+
+    Parameters
+    ----------
+    db_file : Path, optional
+        The SQLite database, by default `DB_FILE`
+    """
+
+    def __init__(self, db_file: Path = DB_FILE):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+
+    def record_submission(self,
+                          host: str,
+                          job_id: Union[int, str],
+                          job_name: str,
+                          remote_dir: Path,
+                          acf_file: Path = None,
+                          input_files: List[Path] = None):
+        """Record that a job was submitted (or resubmitted)
+
+        Parameters
+        ----------
+        host : str
+            Identifies the cluster (e.g. user@host)
+        job_id : Union[int, str]
+            The job ID
+        job_name : str
+            The name of the job
+        remote_dir : Path
+            The remote directory of the job
+        acf_file : Path, optional
+            The local ACF file, by default None
+        input_files : List[Path], optional
+            The local input files, which are hashed to `input_hash`. If not given (e.g. when a job
+            is resubmitted), the ACF file and hash of the last job in `remote_dir` are used.
+        """
+        remote_dir = Path(remote_dir).as_posix()
+        input_hash = hash_files(input_files) if input_files else None
+        now = time.time()
+
+        with self._lock, self._db:
+            if input_hash is None:
+                previous = self._db.execute(
+                    'SELECT acf_file, input_hash FROM jobs WHERE host=? AND remote_dir=? '
+                    'ORDER BY submit_time DESC LIMIT 1', (host, remote_dir)).fetchone()
+                if previous is not None:
+                    acf_file, input_hash = acf_file or previous[0], previous[1]
+
+            self._db.execute(
+                'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (host, str(job_id), job_name, remote_dir,
+                 Path(acf_file).as_posix() if acf_file is not None else None,
+                 input_hash, SUBMITTED, now, now))
+            self._db.execute('INSERT INTO transitions VALUES (?, ?, ?, ?)',
+                             (host, str(job_id), SUBMITTED, now))
+
+    def record_states(self, host: str, job_table: pd.DataFrame):
+        """Record the states of the jobs in a job table (from `HPCSession.get_job_table`)
+
+        Only jobs whose state has changed are written.
+        """
+        if len(job_table) == 0:
+            return
+
+        job_ids = job_table['JobID'].astype(str).tolist()
+        states = job_table['State'].astype(str).str.split().str[0].tolist()
+        now = time.time()
+
+        with self._lock, self._db:
+            known = dict(self._db.execute(
+                'SELECT job_id, state FROM jobs WHERE host=? AND job_id IN '
+                '(SELECT value FROM json_each(?))', (host, json.dumps(job_ids))))
+
+            changed = [i for i, (job_id, state) in enumerate(zip(job_ids, states))
+                       if known.get(job_id) != state]
+            for i in changed:
+                row = job_table.iloc[i]
+                if job_ids[i] in known:
+                    self._db.execute('UPDATE jobs SET state=?, update_time=? '
+                                     'WHERE host=? AND job_id=?',
+                                     (states[i], now, host, job_ids[i]))
+                else:
+                    start = pd.to_datetime(row.get('Start'), errors='coerce')
+                    self._db.execute(
+                        'INSERT INTO jobs VALUES (?, ?, ?, ?, NULL, NULL, ?, ?, ?)',
+                        (host, job_ids[i], row.get('JobName'), row.get('WorkDir'), states[i],
+                         start.timestamp() if not pd.isna(start) else now, now))
+
+                self._db.execute('INSERT INTO transitions VALUES (?, ?, ?, ?)',
+                                 (host, job_ids[i], states[i], now))
+
+        if changed:
+            LOG.debug(f'Recorded {len(changed)} job state changes')
+
+    def query(self,
+              host: str = None,
+              job_id: Union[int, str] = None,
+              job_name: str = None,
+              state: str = None,
+              since: float = None,
+              until: float = None,
+              input_hash: str = None,
+              remote_dir: Path = None,
+              limit: int = None) -> pd.DataFrame:
+        """Find jobs in the index
+
+        Parameters
+        ----------
+        host : str, optional
+            Only jobs on this cluster (e.g. user@host)
+        job_id : Union[int, str], optional
+            Only the job with this ID
+        job_name : str, optional
+            Only jobs whose name matches this SQL LIKE pattern (e.g. `model_x%`)
+        state : str, optional
+            Only jobs in this state (e.g. FAILED)
+        since : float, optional
+            Only jobs submitted at or after this time (seconds since the epoch)
+        until : float, optional
+            Only jobs submitted before this time (seconds since the epoch)
+        input_hash : str, optional
+            Only jobs with these input files (see `hash_files`)
+        remote_dir : Path, optional
+            Only jobs in this remote directory
+        limit : int, optional
+            The maximum number of jobs to return (most recent first)
+
+        Returns
+        -------
+        pd.DataFrame
+            The matching jobs, most recently submitted first
+        """
+        where, params = [], []
+        for clause, value in [('host = ?', host),
+                              ('job_id = ?', str(job_id) if job_id is not None else None),
+                              ('job_name LIKE ?', job_name),
+                              ('state = ?', state.upper() if state is not None else None),
+                              ('submit_time >= ?', since),
+                              ('submit_time < ?', until),
+                              ('input_hash = ?', input_hash),
+                              ('remote_dir = ?', Path(remote_dir).as_posix()
+                               if remote_dir is not None else None)]:
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+
+        sql = 'SELECT * FROM jobs'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY submit_time DESC'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+
+        with self._lock:
+            return pd.read_sql_query(sql, self._db, params=params)
+
+    def history(self, job_id: Union[int, str], host: str = None) -> pd.DataFrame:
+        """Get the state transitions of a job, oldest first"""
+        sql = 'SELECT * FROM transitions WHERE job_id = ?'
+        params = [str(job_id)]
+        if host is not None:
+            sql += ' AND host = ?'
+            params.append(host)
+
+        with self._lock:
+            return pd.read_sql_query(sql + ' ORDER BY time', self._db, params=params)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def get_job_index() -> JobIndex:
+    """Get the process-wide job index (in the `job_index_file` config setting or `DB_FILE`)"""
+    db_file = Path(get_config().get('job_index_file', DB_FILE))
+    with _INDEXES_LOCK:
+        if db_file not in _INDEXES:
+            _INDEXES[db_file] = JobIndex(db_file)
+
+        return _INDEXES[db_file]
+
+
+def hash_files(files: List[Path]) -> str:
+    """Hash the names and content of a set of input files
+
+    The order of the files doesn't matter, and neither do their directories, so copies of the same
+    inputs get the same hash.
+    """
+    digest = hashlib.sha256()
+    for file in sorted((Path(f) for f in files if f is not None), key=lambda f: f.name):
+        digest.update(file.name.encode() + b'\0')
+        with open(file, 'rb') as fid:
+            for block in iter(lambda: fid.read(2**20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+
+    return digest.hexdigest()
@@ -0,0 +1,151 @@
+"""An on-disk journal of the progress of a `submit_multi` batch
+
+Each job's state (uploaded, submitting, submitted) is appended to a JSON lines file named after a hash of the
+batch (the input files and submit options). If a batch is interrupted, running the same batch again
+picks up the journal and skips the work that was already done. The journal is deleted once every job
+in the batch has been submitted.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+from .config import DATA_DIR
+
+LOG = logging.getLogger(__name__)
+JOURNAL_DIR = DATA_DIR / 'journals'
+
+UPLOADED = 'uploaded'
+# The submit command was about to run. The job may or may not have been submitted.
+SUBMITTING = 'submitting'
+SUBMITTED = 'submitted'
+
+
+class Journal():
+    """The journal of a single batch
+
+    Parameters
+    ----------
+    file : Path
+        The journal file
+    fingerprints : List[list]
+        A fingerprint of the input files of each job. Entries recorded with a different fingerprint
+        (i.e. the input files have changed since) are ignored.
+    """
+
+    def __init__(self, file: Path, fingerprints: List[list]):
+        self.file = Path(file)
+        self.fingerprints = fingerprints
+        self._lock = threading.Lock()
+        self.entries: Dict[int, dict] = self._load()
+
+        if self.entries:
+            n_submitted = sum(e['state'] == SUBMITTED for e in self.entries.values())
+            LOG.info(f'Resuming batch from {self.file}: {n_submitted} of {len(fingerprints)} jobs '
+                     f'already submitted, {len(self.entries) - n_submitted} uploaded')
+
+    @classmethod
+    def for_batch(cls,
+                  acf_files: List[Path],
+                  adm_files: List[Path],
+                  aux_files: List[List[Path]],
+                  **kwargs) -> 'Journal':
+        """Get the journal of a batch
+
+        Parameters
+        ----------
+        acf_files : List[Path]
+            The ACF files in the batch
+        adm_files : List[Path]
+            The ADM files in the batch
+        aux_files : List[List[Path]]
+            The auxiliary files of each job in the batch
+        **kwargs
+            Any options that change what is submitted (e.g. the arguments to the submit command)
+        """
+        batch = {'acf_files': [Path(f).absolute().as_posix() for f in acf_files],
+                 'adm_files': [Path(f).absolute().as_posix() for f in adm_files],
+                 'aux_files': [[Path(f).absolute().as_posix() for f in files] for files in aux_files],
+                 'kwargs': {k: str(v) for k, v in sorted(kwargs.items())}}
+        key = hashlib.sha256(json.dumps(batch).encode()).hexdigest()[:16]
+
+        fingerprints = [_fingerprint([acf, adm, *aux])
+                        for acf, adm, aux in zip(acf_files, adm_files, aux_files)]
+
+        return cls(JOURNAL_DIR / f'{key}.jsonl', fingerprints)
+
+    def record(self, index: int, state: str, **data):
+        """Record the state of a job
+
+        Parameters
+        ----------
+        index : int
+            The index of the job in the batch
+        state : str
+            `UPLOADED`, `SUBMITTING` or `SUBMITTED`
+        **data
+            JSON serializable data to store with the state (e.g. remote_dir, job_id)
+        """
+        self.record_many({index: data}, state)
+
+    def record_many(self, data: Dict[int, dict], state: str):
+        """Record the same state for several jobs with a single write
+
+        Parameters
+        ----------
+        data : Dict[int, dict]
+            The data to store with the state of each job, keyed by its index in the batch
+        state : str
+            `UPLOADED`, `SUBMITTING` or `SUBMITTED`
+        """
+        entries = {index: {'index': index,
+                           'state': state,
+                           'fingerprint': self.fingerprints[index],
+                           **values}
+                   for index, values in data.items()}
+        with self._lock:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file, 'a') as fid:
+                fid.write(''.join(json.dumps(entry) + '\n' for entry in entries.values()))
+                fid.flush()
+                os.fsync(fid.fileno())
+            self.entries.update(entries)
+
+    def complete(self):
+        """Delete the journal once every job in the batch has been submitted"""
+        with self._lock:
+            self.file.unlink(missing_ok=True)
+
+    def _load(self) -> Dict[int, dict]:
+        entries = {}
+        if not self.file.exists():
+            return entries
+
+        for line in self.file.read_text().splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A partially written line
+                continue
+
+            index = entry['index']
+            if index < len(self.fingerprints) and entry['fingerprint'] == self.fingerprints[index]:
+                entries[index] = entry
+
+        return entries
+
+
+def _fingerprint(files: List[Path]) -> list:
+    fingerprint = []
+    for file in files:
+        try:
+            stat = Path(file).stat()
+        except OSError:
+            fingerprint.append([Path(file).as_posix(), None, None])
+        else:
+            fingerprint.append([Path(file).as_posix(), stat.st_size, stat.st_mtime_ns])
+
+    return fingerprint
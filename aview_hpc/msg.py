@@ -0,0 +1,176 @@
+"""Incremental parsing of Adams message (.msg) files on the cluster
+
+A `MsgTail` remembers how far into a job's .msg file it has read. Each `update` fetches only the
+bytes appended since the last one (a stat and a ranged read over SFTP) and scans them for the
+completion marker and error blocks in memory. Nothing is written to local disk.
+
+Notes
+-----
+* The patterns are the ones used by `adamspy.postprocess.msg`, so the results match
+  `check_if_finished` and `get_errors` on the full file.
+* Tails are cached per remote directory in `_TAILS`, so a long-lived process (e.g. the daemon) only
+  ever reads each byte of a .msg file once.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List
+
+from adamspy.postprocess.msg import (CXX_PATTERN, FINISH_PATTERN, FULL_ERROR_PATTERN,
+                                     FULL_FORTRAN_ERROR_PATTERN)
+from paramiko import SFTPClient
+
+LOG = logging.getLogger(__name__)
+
+START_ERROR = '---- START: ERROR ----'
+END_ERROR = '---- END: ERROR ----'
+
+# Maximum number of tails kept in `_TAILS`
+MAX_TAILS = 2000
+
+_TAILS: 'OrderedDict[tuple, MsgTail]' = OrderedDict()
+_TAILS_LOCK = threading.Lock()
+
+
+class MsgTail():
+    """The incrementally parsed state of the .msg file in a remote job directory
+
+    Parameters
+    ----------
+    remote_dir : Path
+        The remote directory of the job
+    keep_text : bool, optional
+        Keep the bytes read so far so `text` is the whole file (e.g. for a viewer), by default False
+    """
+
+    def __init__(self, remote_dir: Path, keep_text: bool = False):
+        self.remote_dir = Path(remote_dir)
+        self.keep_text = keep_text
+        self.msg_file: str = None
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.finished = False
+        self.cxx = False
+        self._partial = b''
+        self._carry = ''
+        self._data = bytearray()
+        self._errors: List[str] = []
+        self._fortran_errors: List[str] = []
+
+    @property
+    def errors(self) -> List[str]:
+        """The errors found so far (C++ or Fortran solver format as appropriate)"""
+        return list(self._errors if self.cxx else self._fortran_errors)
+
+    @property
+    def text(self) -> str:
+        """The .msg file as read so far (empty unless `keep_text`)"""
+        return self._data.decode(errors='replace')
+
+    def update(self, ftp: SFTPClient) -> 'MsgTail':
+        """Fetch and parse anything appended to the .msg file since the last update
+
+        Parameters
+        ----------
+        ftp : SFTPClient
+            An open SFTP client
+
+        Returns
+        -------
+        MsgTail
+            self
+        """
+        with self.lock:
+            if self.msg_file is None:
+                self.msg_file = self._find_msg_file(ftp)
+                if self.msg_file is None:
+                    return self
+
+            try:
+                size = ftp.stat(self.msg_file).st_size
+            except FileNotFoundError:
+                self.msg_file = None
+                self._reset()
+                return self
+
+            if size < self.offset:
+                LOG.debug(f'{self.msg_file} was truncated. Reading it again from the start.')
+                self._reset()
+
+            if size > self.offset:
+                with ftp.open(self.msg_file, 'rb') as fid:
+                    data = b''.join(fid.readv([(self.offset, size - self.offset)]))
+                self.offset += len(data)
+                if self.keep_text:
+                    self._data += data
+                self._parse(data)
+
+        return self
+
+    def _find_msg_file(self, ftp: SFTPClient) -> str:
+        try:
+            names = ftp.listdir(self.remote_dir.as_posix())
+        except FileNotFoundError:
+            return None
+
+        name = next((n for n in names if n.endswith('.msg')), None)
+        return (self.remote_dir / name).as_posix() if name is not None else None
+
+    def _parse(self, data: bytes):
+        """Scan newly read bytes. Only complete lines are parsed; the rest waits for the next read."""
+        data = self._partial + data
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+
+        text = self._carry + data[:end].decode(errors='replace')
+
+        if not self.cxx and CXX_PATTERN.search(text):
+            self.cxx = True
+
+        # The last line may not have a newline yet
+        if FINISH_PATTERN.search(text + self._partial.decode(errors='replace')):
+            self.finished = True
+
+        # Error blocks that may not be complete yet are carried over to the next read
+        carry_from = len(text)
+
+        start = text.rfind(START_ERROR)
+        if start >= 0 and text.find(END_ERROR, start) < 0:
+            carry_from = start
+
+        fortran_matches = list(FULL_FORTRAN_ERROR_PATTERN.finditer(text))
+        if fortran_matches and fortran_matches[-1].end() == len(text) and not self.finished:
+            carry_from = min(carry_from, fortran_matches[-1].start())
+
+        # Anything starting in the carried over text is matched again on the next read
+        self._errors += [m.group() for m in FULL_ERROR_PATTERN.finditer(text, 0, carry_from)]
+        self._fortran_errors += [m.group() for m in fortran_matches if m.start() < carry_from]
+
+        self._carry = text[carry_from:]
+
+
+def get_tail(remote_dir: Path, key: str = '') -> MsgTail:
+    """Get the cached `MsgTail` of a remote job directory, creating it if necessary
+
+    Parameters
+    ----------
+    remote_dir : Path
+        The remote directory of the job
+    key : str, optional
+        Identifies the cluster (e.g. user@host), by default ''
+    """
+    cache_key = (key, Path(remote_dir).as_posix())
+    with _TAILS_LOCK:
+        tail = _TAILS.get(cache_key)
+        if tail is None:
+            tail = _TAILS[cache_key] = MsgTail(remote_dir)
+        _TAILS.move_to_end(cache_key)
+
+        while len(_TAILS) > MAX_TAILS:
+            _TAILS.popitem(last=False)
+
+    return tail
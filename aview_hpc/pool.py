@@ -0,0 +1,223 @@
+"""A process-wide pool of authenticated SSH/SFTP connections to the HPC cluster
+
+Opening a connection costs a TCP + SSH handshake, a keyring lookup and an SFTP channel. Sessions
+created through `hpc_session` check connections out of the pool and hand them back when they are
+closed, so repeated calls from the same process reuse a warm transport.
+"""
+import atexit
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+from paramiko import SFTPClient, SSHClient
+
+LOG = logging.getLogger(__name__)
+
+# Default maximum number of idle connections kept per (host, username)
+MAX_SIZE = 4
+
+# Default number of seconds an idle connection is kept before it is closed
+MAX_IDLE = 300
+
+# Connections that have been idle longer than this (seconds) get a round trip health check
+HEALTH_CHECK_AFTER = 30
+
+
+@dataclass
+class PooledConnection():
+    """An SSH client and its SFTP channel"""
+    ssh: SSHClient
+    ftp: SFTPClient
+    last_used: float = field(default_factory=time.monotonic)
+
+    def is_healthy(self, probe: bool = False) -> bool:
+        """Check that the connection is still usable
+
+        Parameters
+        ----------
+        probe : bool, optional
+            If True, do a round trip to the server in addition to checking the transport state, by
+            default False
+        """
+        transport = self.ssh.get_transport()
+        if transport is None or not transport.is_active() or not transport.is_authenticated():
+            return False
+
+        if self.ftp.sock.closed:
+            return False
+
+        if probe:
+            try:
+                self.ftp.normalize('.')
+            except (OSError, EOFError) as err:
+                LOG.debug(f'Health check failed: {err}')
+                return False
+
+        return True
+
+    def close(self):
+        for obj in (self.ftp, self.ssh):
+            try:
+                obj.close()
+            except Exception as err:  # noqa: BLE001
+                LOG.debug(f'Error while closing {obj}: {err}')
+
+
+class ConnectionPool():
+    """A thread safe pool of idle connections keyed by (host, username)
+
+    Parameters
+    ----------
+    max_size : int, optional
+        The maximum number of idle connections kept per (host, username), by default `MAX_SIZE`
+    max_idle : float, optional
+        Idle connections older than this many seconds are evicted, by default `MAX_IDLE`
+    """
+
+    def __init__(self, max_size: int = MAX_SIZE, max_idle: float = MAX_IDLE):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self._idle: Dict[Tuple[str, str], List[PooledConnection]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.discards = 0
+
+    def acquire(self,
+                host: str,
+                username: str,
+                connect: Callable[[], Tuple[SSHClient, SFTPClient]]) -> PooledConnection:
+        """Check out a connection, creating a new one with `connect` if none are available
+
+        Parameters
+        ----------
+        host : str
+            The host to connect to
+        username : str
+            The username to connect with
+        connect : Callable[[], Tuple[SSHClient, SFTPClient]]
+            Called to open a new connection on a pool miss
+
+        Returns
+        -------
+        PooledConnection
+            A connection that is exclusively owned by the caller until it is released
+        """
+        self.evict_idle()
+
+        while True:
+            with self._lock:
+                idle = self._idle.get((host, username), [])
+                conn = idle.pop() if idle else None
+
+            if conn is None:
+                break
+
+            probe = time.monotonic() - conn.last_used > HEALTH_CHECK_AFTER
+            if conn.is_healthy(probe=probe):
+                with self._lock:
+                    self.hits += 1
+                LOG.debug(f'Reusing pooled connection to {username}@{host} ({self.stats})')
+                return conn
+
+            LOG.debug(f'Discarding unhealthy pooled connection to {username}@{host}')
+            conn.close()
+            with self._lock:
+                self.discards += 1
+
+        with self._lock:
+            self.misses += 1
+        LOG.debug(f'Opening new connection to {username}@{host} ({self.stats})')
+        ssh, ftp = connect()
+        return PooledConnection(ssh, ftp)
+
+    def release(self, host: str, username: str, conn: PooledConnection, discard: bool = False):
+        """Return a connection to the pool
+
+        Parameters
+        ----------
+        host : str
+            The host the connection belongs to
+        username : str
+            The username the connection belongs to
+        conn : PooledConnection
+            The connection to return
+        discard : bool, optional
+            If True, close the connection instead of returning it (e.g. after a transport
+            error), by default False
+        """
+        if discard or not conn.is_healthy():
+            conn.close()
+            with self._lock:
+                self.discards += 1
+            return
+
+        conn.last_used = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault((host, username), [])
+            if len(idle) < self.max_size:
+                idle.append(conn)
+                return
+
+        # The pool is full
+        conn.close()
+        with self._lock:
+            self.evictions += 1
+
+    def evict_idle(self):
+        """Close connections that have been idle longer than `max_idle`"""
+        now = time.monotonic()
+        expired: List[PooledConnection] = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                expired.extend(c for c in idle if now - c.last_used > self.max_idle)
+                self._idle[key] = [c for c in idle if now - c.last_used <= self.max_idle]
+            self.evictions += len(expired)
+
+        for conn in expired:
+            conn.close()
+
+    def close_all(self):
+        """Close all idle connections"""
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+
+        for conn in conns:
+            conn.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Counters describing how much connection setup the pool has saved"""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'discards': self.discards,
+                'idle': sum(len(idle) for idle in self._idle.values())}
+
+
+_POOL: ConnectionPool = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Get the process-wide connection pool, creating it from the config on first use"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            from .config import get_config
+            config = get_config()
+            _POOL = ConnectionPool(max_size=int(config.get('pool_max_size', MAX_SIZE)),
+                                   max_idle=float(config.get('pool_max_idle', MAX_IDLE)))
+            atexit.register(_close_pool)
+
+    return _POOL
+
+
+def _close_pool():
+    if _POOL is not None:
+        LOG.debug(f'Connection pool stats: {_POOL.stats}')
+        _POOL.close_all()
@@ -0,0 +1,193 @@
+"""Streaming reader for Adams results (.res) files
+
+.res files are XML (the `xrf10` schema). A `<StepMap>` assigns every result component an id, and
+each `<Step>` in a `<Data>` section lists the values of all components, whitespace separated and in
+id order (id 1 is time). `iter_res` parses the XML incrementally with `XMLPullParser`, so it can
+consume bytes as they arrive over SFTP. Steps are copied into a preallocated NumPy buffer and
+discarded from the XML tree straight away, so memory use doesn't depend on the size of the file.
+
+Components are named `<entity>.<component>` (e.g. `PART_2_XFORM.X`, `time.TIME`). An entity name on
+its own selects all of its components.
+"""
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple
+from xml.etree.ElementTree import Element, XMLPullParser
+
+import numpy as np
+from paramiko import SFTPClient
+
+LOG = logging.getLogger(__name__)
+
+NAMESPACE = '{http://www.mscsoftware.com/:xrf10}'
+
+# Default number of steps held in the buffer before a block is yielded
+STEPS_PER_BLOCK = 1024
+
+# Size of the ranges read from the remote file
+CHUNK_SIZE = 8 * 2**20
+
+
+class ResBlock(NamedTuple):
+    """A block of consecutive steps from one `<Data>` section of a .res file"""
+    data: str
+    """The name of the `<Data>` section (e.g. dynamic_001)"""
+    step_type: str
+    """The type of the steps (e.g. dynamic, static, input)"""
+    columns: List[str]
+    """The names of the components in each column of `values`"""
+    values: np.ndarray
+    """A (steps, columns) array. This is a view of a buffer that is reused for the next block, so
+    copy it if it needs to outlive the iteration."""
+
+
+def iter_res(chunks: Iterable[bytes],
+             components: List[str] = None,
+             steps_per_block: int = STEPS_PER_BLOCK) -> Iterator[ResBlock]:
+    """Parse a .res file incrementally and yield blocks of steps
+
+    Parameters
+    ----------
+    chunks : Iterable[bytes]
+        The content of the .res file (e.g. `iter_remote_chunks` or an open binary file)
+    components : List[str], optional
+        The components to read (`<entity>.<component>` or `<entity>`), by default all
+    steps_per_block : int, optional
+        The maximum number of steps in each block, by default `STEPS_PER_BLOCK`
+
+    Yields
+    ------
+    ResBlock
+        Blocks of up to `steps_per_block` steps
+    """
+    parser = XMLPullParser(events=('start', 'end'))
+    stack: List[Element] = []
+    columns: List[str] = []
+    indices = np.empty(0, dtype=int)
+    buffer = np.empty((0, 0))
+    n_steps = 0
+    data_name, step_type = None, None
+
+    def flush():
+        nonlocal n_steps
+        block = ResBlock(data_name, step_type, columns, buffer[:n_steps])
+        n_steps = 0
+        return block
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            tag = elem.tag.replace(NAMESPACE, '')
+
+            if event == 'start':
+                stack.append(elem)
+                if tag == 'Data':
+                    data_name, step_type = elem.get('name'), None
+                continue
+
+            stack.pop()
+            if tag == 'StepMap':
+                columns, indices = _select(elem, components)
+                buffer = np.empty((steps_per_block, len(columns)))
+                LOG.debug(f'Reading {len(columns)} components from {elem.get("name")}')
+
+            elif tag == 'Step':
+                if step_type != elem.get('type') and n_steps:
+                    yield flush()
+                step_type = elem.get('type')
+
+                values = np.array(elem.text.split(), dtype=np.float64)
+                buffer[n_steps] = values[indices]
+                n_steps += 1
+                if n_steps == steps_per_block:
+                    yield flush()
+
+            elif tag == 'Data' and n_steps:
+                yield flush()
+
+            # Discard everything that has been read so the tree doesn't grow
+            if tag in ('Step', 'Data', 'StepMap') and stack:
+                stack[-1].remove(elem)
+
+    parser.close()
+
+
+def read_res(chunks: Iterable[bytes], components: List[str] = None) -> Dict[str, np.ndarray]:
+    """Read the selected components of a .res file into arrays
+
+    Parameters
+    ----------
+    chunks : Iterable[bytes]
+        The content of the .res file (e.g. `iter_remote_chunks` or an open binary file)
+    components : List[str], optional
+        The components to read (`<entity>.<component>` or `<entity>`), by default all
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        The values of each component (the keys are `<entity>.<component>`) for every step in
+        every `<Data>` section, in order
+    """
+    return concat_blocks(iter_res(chunks, components))
+
+
+def concat_blocks(blocks: Iterable[ResBlock]) -> Dict[str, np.ndarray]:
+    """Concatenate blocks from `iter_res` into one array per component
+
+    If the StepMap changes part way through the file, the blocks are merged by column name. Steps
+    from blocks that don't have a component are NaN (as in `extract`).
+    """
+    blocks = [(block.columns, block.values.copy()) for block in blocks]
+    names = list(dict.fromkeys(name for columns, _ in blocks for name in columns))
+    n_steps = sum(len(values) for _, values in blocks)
+
+    data = {name: np.full(n_steps, np.nan) for name in names}
+    start = 0
+    for columns, values in blocks:
+        for i, name in enumerate(columns):
+            data[name][start:start + len(values)] = values[:, i]
+        start += len(values)
+
+    return data
+
+
+def iter_remote_chunks(ftp: SFTPClient, remote_file: str, chunk_size: int = CHUNK_SIZE):
+    """Read a remote file in chunks, with the reads for each chunk pipelined
+
+    Parameters
+    ----------
+    ftp : SFTPClient
+        An open SFTP client
+    remote_file : str
+        The posix path of the remote file
+    chunk_size : int, optional
+        The size of each chunk (bytes), by default `CHUNK_SIZE`
+
+    Yields
+    ------
+    bytes
+        Consecutive chunks of the file
+    """
+    with ftp.open(Path(remote_file).as_posix(), 'rb') as fid:
+        size = fid.stat().st_size
+        for offset in range(0, size, chunk_size):
+            yield b''.join(fid.readv([(offset, min(chunk_size, size - offset))]))
+
+
+def _select(step_map: Element, components: List[str] = None):
+    """Get the names and step value indices of the selected components in a StepMap"""
+    ids, names = [], []
+    for entity in step_map.iter(f'{NAMESPACE}Entity'):
+        for component in entity.iter(f'{NAMESPACE}Component'):
+            name = f'{entity.get("name")}.{component.get("name")}'
+            if components is None or name in components or entity.get('name') in components:
+                ids.append(int(component.get('id')))
+                names.append(name)
+
+    if components is not None:
+        missing = [c for c in components
+                   if c not in names and not any(n.startswith(f'{c}.') for n in names)]
+        if missing:
+            raise RuntimeError(f'Components not found in {step_map.get("name")}: {missing}')
+
+    return names, np.array(ids, dtype=int) - 1
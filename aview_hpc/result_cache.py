@@ -0,0 +1,181 @@
+"""A local, columnar cache of parsed result files
+
+Parsed results are stored per remote file, keyed by the cluster, the remote path and the remote size
+and modification time, so a file that changes on the cluster is never served stale. Each entry is a
+directory holding one `.npy` file per column (memory mapped on load) or, if compression is enabled,
+a single compressed `.npz`. The least recently used entries are evicted once the cache is bigger
+than its maximum size.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from .config import DATA_DIR, get_config, is_enabled
+from .fixed_width import read_fixed_width
+from .res import CHUNK_SIZE, read_res
+
+LOG = logging.getLogger(__name__)
+CACHE_DIR = DATA_DIR / 'result_cache'
+
+# Default maximum total size of the cache (bytes)
+MAX_SIZE = 5 * 2**30
+
+# Result files that can be cached
+CACHE_EXTS = ('.res', '.req', '.gra')
+
+META_FILE = 'meta.json'
+
+_LOCK = threading.Lock()
+
+
+class ResultCache():
+    """A local cache of parsed result files
+
+    Parameters
+    ----------
+    key : str
+        Identifies the cluster (e.g. user@host)
+    cache_dir : Path, optional
+        The directory of the cache, by default `CACHE_DIR`
+    max_size : int, optional
+        The maximum total size of the cache (bytes), by default `MAX_SIZE`
+    compress : bool, optional
+        Store entries as compressed .npz files instead of memory mappable .npy files, by default
+        False
+    """
+
+    def __init__(self,
+                 key: str,
+                 cache_dir: Path = CACHE_DIR,
+                 max_size: int = MAX_SIZE,
+                 compress: bool = False):
+        self.key = key
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.compress = compress
+
+    def entry_dir(self, remote_file: str, size: int, mtime: int) -> Path:
+        """The directory of the cache entry of a version of a remote file"""
+        name = hashlib.sha256(f'{self.key}:{remote_file}:{size}:{mtime}'.encode()).hexdigest()
+        return self.cache_dir / name[:32]
+
+    def get(self, remote_file: str, size: int, mtime: int) -> Optional[Dict[str, np.ndarray]]:
+        """Get the cached columns of a remote file (None if it isn't cached)
+
+        Parameters
+        ----------
+        remote_file : str
+            The posix path of the remote file
+        size : int
+            The size of the remote file (bytes)
+        mtime : int
+            The modification time of the remote file
+
+        Returns
+        -------
+        Optional[Dict[str, np.ndarray]]
+            The columns (memory mapped unless the entry is compressed)
+        """
+        entry_dir = self.entry_dir(remote_file, size, mtime)
+        try:
+            meta = json.loads((entry_dir / META_FILE).read_text())
+            if meta['compressed']:
+                with np.load(entry_dir / 'data.npz') as npz:
+                    data = {name: npz[f'c{i}'] for i, name in enumerate(meta['columns'])}
+            else:
+                data = {name: np.load(entry_dir / f'{i}.npy', mmap_mode='r')
+                        for i, name in enumerate(meta['columns'])}
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # The modification time of the meta file is the last time the entry was used
+        os.utime(entry_dir / META_FILE)
+        LOG.debug(f'Result cache hit: {remote_file}')
+        return data
+
+    def put(self, remote_file: str, size: int, mtime: int, data: Dict[str, np.ndarray]):
+        """Add the columns of a remote file to the cache
+
+        Parameters
+        ----------
+        remote_file : str
+            The posix path of the remote file
+        size : int
+            The size of the remote file (bytes)
+        mtime : int
+            The modification time of the remote file
+        data : Dict[str, np.ndarray]
+            The columns
+        """
+        entry_dir = self.entry_dir(remote_file, size, mtime)
+        tmp_dir = entry_dir.with_name(f'{entry_dir.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.compress:
+            np.savez_compressed(tmp_dir / 'data.npz',
+                                **{f'c{i}': values for i, values in enumerate(data.values())})
+        else:
+            for i, values in enumerate(data.values()):
+                np.save(tmp_dir / f'{i}.npy', np.ascontiguousarray(values))
+
+        (tmp_dir / META_FILE).write_text(json.dumps({'remote_file': remote_file,
+                                                     'size': size,
+                                                     'mtime': mtime,
+                                                     'columns': list(data),
+                                                     'compressed': self.compress}))
+
+        with _LOCK:
+            if entry_dir.exists():
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            else:
+                os.replace(tmp_dir, entry_dir)
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is smaller than `max_size`"""
+        with _LOCK:
+            entries = []
+            for entry_dir in (d for d in self.cache_dir.glob('*') if (d / META_FILE).exists()):
+                size = sum(f.stat().st_size for f in entry_dir.iterdir())
+                entries.append(((entry_dir / META_FILE).stat().st_mtime, size, entry_dir))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_size:
+                    break
+                LOG.debug(f'Evicting {entry_dir} from the result cache')
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+
+
+def get_result_cache(key: str) -> ResultCache:
+    """Get the result cache configured by the `result_cache_dir`, `result_cache_max_size` and
+    `result_cache_compress` config settings"""
+    config = get_config()
+    return ResultCache(key,
+                       cache_dir=Path(config.get('result_cache_dir', CACHE_DIR)),
+                       max_size=int(config.get('result_cache_max_size', MAX_SIZE)),
+                       compress=is_enabled(config, 'result_cache_compress', default=False))
+
+
+def parse_result_file(file: Path) -> Dict[str, np.ndarray]:
+    """Parse a local result file into columns
+
+    .res files give one column per component (`<entity>.<component>`). .req and .gra files give a
+    `time` column and a `values` column (see `fixed_width.read_fixed_width`).
+    """
+    file = Path(file)
+    if file.suffix == '.res':
+        with open(file, 'rb') as fid:
+            return read_res(iter(lambda: fid.read(CHUNK_SIZE), b''))
+
+    times, values = read_fixed_width(file)
+    return {'time': times, 'values': values}
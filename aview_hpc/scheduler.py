@@ -0,0 +1,397 @@
+"""A local submission queue shared by every process on the machine
+
+Instead of blocking until the user has fewer than `max_user_jobs` jobs on the cluster, callers
+`enqueue` a submission and get a ticket back straight away. The queue is a SQLite database, so
+pending submissions from every Adams View instance (and the daemon) on the machine are in one
+place. A `Scheduler` thread releases them, highest priority first (then oldest first), whenever the
+jobs active on the cluster leave room under the ticket's limits:
+
+* `max_jobs`: The number of RUNNING and PENDING jobs
+* `max_cpus`: The sum of their NCPUS, including the CPUs of the ticket itself
+
+Tickets are claimed with an immediate transaction, so several schedulers (e.g. in different
+processes) never submit the same ticket twice. The scheduler that claimed a ticket updates its
+`heartbeat` every `HEARTBEAT_INTERVAL` seconds until it is submitted, so tickets left `SUBMITTING` by
+a process that died are marked `FAILED` once their heartbeat is `STALE_AFTER` seconds old rather
+than resubmitted. A slow upload by a live process never expires.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import AbstractContextManager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+from paramiko import SSHException
+
+from .config import DATA_DIR, get_config
+
+LOG = logging.getLogger(__name__)
+QUEUE_FILE = DATA_DIR / 'submit_queue.sqlite'
+
+# The states of a ticket
+PENDING = 'pending'
+SUBMITTING = 'submitting'
+SUBMITTED = 'submitted'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# Slurm states that count towards the limits
+ACTIVE_STATES = ('RUNNING', 'PENDING', 'CONFIGURING', 'COMPLETING', 'REQUEUED', 'RESIZING',
+                 'SUSPENDED')
+
+# Default seconds between checks of the cluster while tickets are pending
+POLL_INTERVAL = 60
+
+# Seconds between heartbeats of the tickets a scheduler is submitting
+HEARTBEAT_INTERVAL = 60
+
+# Seconds without a heartbeat after which a `SUBMITTING` ticket is assumed to have been interrupted
+STALE_AFTER = 600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT NOT NULL,
+    state TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    ncpus INTEGER NOT NULL DEFAULT 1,
+    max_jobs INTEGER,
+    max_cpus INTEGER,
+    request TEXT NOT NULL,
+    remote_dir TEXT,
+    job_name TEXT,
+    job_id TEXT,
+    error TEXT,
+    owner TEXT,
+    heartbeat REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tickets_pending ON tickets (host, state, priority, created);
+'''
+
+# Columns added since the first version of the schema
+MIGRATIONS = {'owner': 'TEXT', 'heartbeat': 'REAL'}
+
+# Identifies the process that claimed a ticket
+OWNER = f'{socket.gethostname()}:{os.getpid()}'
+
+_SCHEDULERS: Dict[str, 'Scheduler'] = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+class SubmitQueue():
+    """The queue of pending submissions
+
+    Parameters
+    ----------
+    db_file : Path, optional
+        The SQLite database, by default `QUEUE_FILE`
+    """
+
+    def __init__(self, db_file: Path = QUEUE_FILE):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        self._migrate()
+
+    def enqueue(self,
+                host: str,
+                request: dict,
+                priority: int = 0,
+                ncpus: int = 1,
+                max_jobs: int = None,
+                max_cpus: int = None) -> int:
+        """Add a submission to the queue
+
+        Parameters
+        ----------
+        host : str
+            Identifies the cluster (e.g. user@host)
+        request : dict
+            JSON serializable keyword arguments for the submit function
+        priority : int, optional
+            Tickets with a higher priority are released first, by default 0
+        ncpus : int, optional
+            The number of CPUs the job will use, by default 1
+        max_jobs : int, optional
+            Only release the ticket while fewer jobs than this are active, by default no limit
+        max_cpus : int, optional
+            Only release the ticket if the active jobs plus this one use no more CPUs than this, by
+            default no limit
+
+        Returns
+        -------
+        int
+            The ticket
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO tickets (host, state, priority, ncpus, max_jobs, max_cpus, request, '
+                'created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (host, PENDING, priority, ncpus, max_jobs, max_cpus, json.dumps(request), now, now))
+            return cursor.lastrowid
+
+    def get(self, ticket: int) -> Optional[dict]:
+        """Get a ticket (None if there is no such ticket)"""
+        with self._lock:
+            row = self._db.execute('SELECT * FROM tickets WHERE ticket=?', (ticket,)).fetchone()
+
+        return _to_dict(row) if row is not None else None
+
+    def pending(self, host: str) -> List[dict]:
+        """The pending tickets of a cluster, in the order they will be released"""
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM tickets WHERE host=? AND state=? '
+                                    'ORDER BY priority DESC, created, ticket',
+                                    (host, PENDING)).fetchall()
+
+        return [_to_dict(row) for row in rows]
+
+    def submitting(self, host: str) -> List[dict]:
+        """The tickets of a cluster that have been claimed but not submitted yet"""
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM tickets WHERE host=? AND state=?',
+                                    (host, SUBMITTING)).fetchall()
+
+        return [_to_dict(row) for row in rows]
+
+    def claim(self, ticket: int) -> bool:
+        """Move a ticket from `PENDING` to `SUBMITTING`. Returns False if it isn't pending any
+        more (e.g. another scheduler claimed it or it was cancelled)."""
+        return self._transition(ticket, PENDING, SUBMITTING, owner=OWNER, heartbeat=time.time())
+
+    def beat(self, tickets: List[int]):
+        """Update the heartbeat of tickets that are still `SUBMITTING`"""
+        if not tickets:
+            return
+
+        placeholders = ', '.join('?' * len(tickets))
+        with self._lock:
+            self._db.execute(f'UPDATE tickets SET heartbeat=? WHERE state=? '
+                             f'AND ticket IN ({placeholders})',
+                             (time.time(), SUBMITTING, *tickets))
+
+    def cancel(self, ticket: int) -> bool:
+        """Cancel a ticket that hasn't been released yet"""
+        return self._transition(ticket, PENDING, CANCELLED)
+
+    def complete(self, ticket: int, remote_dir: str, job_name: str, job_id) -> bool:
+        """Record the job a ticket was submitted as. Returns False if the ticket isn't
+        `SUBMITTING` any more (e.g. it was expired)."""
+        return self._transition(ticket, SUBMITTING, SUBMITTED, remote_dir=remote_dir,
+                                job_name=job_name, job_id=str(job_id))
+
+    def fail(self, ticket: int, error: str) -> bool:
+        """Record that a ticket could not be submitted"""
+        return self._transition(ticket, SUBMITTING, FAILED, error=error)
+
+    def expire(self, host: str, stale_after: float = STALE_AFTER):
+        """Fail the `SUBMITTING` tickets that have had no heartbeat for `stale_after` seconds"""
+        for ticket in self.submitting(host):
+            last_seen = ticket['heartbeat'] or ticket['updated']
+            if time.time() - last_seen > stale_after:
+                LOG.warning(f'Ticket {ticket["ticket"]} was interrupted while being submitted by '
+                            f'{ticket["owner"]}')
+                self.fail(ticket['ticket'], 'Interrupted while being submitted')
+
+    def _migrate(self):
+        columns = {row['name'] for row in self._db.execute('PRAGMA table_info(tickets)')}
+        for column, column_type in MIGRATIONS.items():
+            if column not in columns:
+                try:
+                    self._db.execute(f'ALTER TABLE tickets ADD COLUMN {column} {column_type}')
+                except sqlite3.OperationalError:
+                    # Another process added it first
+                    pass
+
+    def _transition(self, ticket: int, from_state: str, to_state: str, **values) -> bool:
+        columns = ''.join(f', {k}=?' for k in values)
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._db.execute(
+                    f'UPDATE tickets SET state=?, updated=?{columns} WHERE ticket=? AND state=?',
+                    (to_state, time.time(), *values.values(), ticket, from_state))
+                self._db.execute('COMMIT')
+            except sqlite3.Error:
+                self._db.execute('ROLLBACK')
+                raise
+
+        return cursor.rowcount == 1
+
+
+class Scheduler():
+    """Releases the pending tickets of one cluster as room frees up on it
+
+    Parameters
+    ----------
+    queue : SubmitQueue
+        The queue
+    host : str
+        Identifies the cluster (e.g. user@host)
+    session : Callable[[], AbstractContextManager]
+        Opens an `HPCSession` to check the job table with
+    submit_fn : Callable
+        Submits a job given the `request` of a ticket, returning (remote_dir, job_name, job_id)
+    poll_interval : float, optional
+        Seconds between checks of the cluster, by default `POLL_INTERVAL`
+    """
+
+    def __init__(self,
+                 queue: SubmitQueue,
+                 host: str,
+                 session: Callable[[], AbstractContextManager],
+                 submit_fn: Callable,
+                 poll_interval: float = POLL_INTERVAL):
+        self.queue = queue
+        self.host = host
+        self.session = session
+        self.submit_fn = submit_fn
+        self.poll_interval = poll_interval
+        self._thread: threading.Thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Run the scheduler on a background thread until the queue is empty"""
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run,
+                                            name=f'aview_hpc_scheduler_{self.host}',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Release tickets until there are none pending"""
+        self.queue.expire(self.host)
+        while not self._stop.is_set() and self.queue.pending(self.host):
+            try:
+                with self.session() as hpc:
+                    self.release(hpc.get_job_table())
+            except (SSHException, ConnectionResetError, EOFError, OSError) as err:
+                # This may happen if the VPN disconnects
+                LOG.warning(f'Could not check the cluster for free slots: {err}')
+
+            if self.queue.pending(self.host):
+                self._stop.wait(self.poll_interval)
+
+    def release(self, job_table: pd.DataFrame) -> List[dict]:
+        """Submit as many pending tickets as the limits allow
+
+        Parameters
+        ----------
+        job_table : pd.DataFrame
+            The current job table (see `HPCSession.get_job_table`)
+
+        Returns
+        -------
+        List[dict]
+            The tickets that were released
+        """
+        states = job_table['State'].astype(str).str.split().str[0]
+        active = job_table[states.isin(ACTIVE_STATES)]
+        submitting = self.queue.submitting(self.host)
+        n_jobs = len(active) + len(submitting)
+        n_cpus = (int(pd.to_numeric(active['NCPUS'], errors='coerce').fillna(0).sum())
+                  + sum(t['ncpus'] for t in submitting))
+
+        config = get_config()
+        claimed = []
+        for ticket in self.queue.pending(self.host):
+            max_jobs = ticket['max_jobs'] or _int_or_none(config.get('queue_max_jobs'))
+            max_cpus = ticket['max_cpus'] or _int_or_none(config.get('queue_max_cpus'))
+
+            # Strict priority order: a ticket that doesn't fit holds back the ones behind it
+            if max_jobs is not None and n_jobs >= max_jobs:
+                break
+            if max_cpus is not None and n_cpus > 0 and n_cpus + ticket['ncpus'] > max_cpus:
+                break
+
+            if self.queue.claim(ticket['ticket']):
+                n_jobs += 1
+                n_cpus += ticket['ncpus']
+                claimed.append(ticket)
+
+        done = threading.Event()
+        if claimed:
+            threading.Thread(target=self._heartbeat,
+                             args=([t['ticket'] for t in claimed], done),
+                             daemon=True).start()
+
+        try:
+            for ticket in claimed:
+                self._submit(ticket)
+        finally:
+            done.set()
+
+        return claimed
+
+    def _submit(self, ticket: dict):
+        try:
+            remote_dir, job_name, job_id = self.submit_fn(**ticket['request'])
+        except Exception as err:  # noqa: BLE001
+            LOG.error(f'Could not submit ticket {ticket["ticket"]}: {err}')
+            self.queue.fail(ticket['ticket'], f'{type(err).__name__}: {err}')
+            return
+
+        LOG.info(f'Ticket {ticket["ticket"]} submitted as job {job_id}')
+        if not self.queue.complete(ticket['ticket'], Path(remote_dir).as_posix(), job_name,
+                                   job_id):
+            state = (self.queue.get(ticket['ticket']) or {}).get('state')
+            LOG.error(f'Ticket {ticket["ticket"]} was submitted as job {job_id} ({remote_dir}) '
+                      f'but is already {state} in the queue')
+
+    def _heartbeat(self, tickets: List[int], done: threading.Event):
+        while not done.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.queue.beat(tickets)
+            except sqlite3.Error as err:
+                LOG.warning(f'Could not update the heartbeat of tickets {tickets}: {err}')
+
+
+def get_scheduler(queue: SubmitQueue,
+                  host: str,
+                  session: Callable[[], AbstractContextManager],
+                  submit_fn: Callable) -> Scheduler:
+    """Get the scheduler of a cluster in this process, creating it if necessary"""
+    with _SCHEDULERS_LOCK:
+        if host not in _SCHEDULERS:
+            poll_interval = float(get_config().get('queue_poll_interval', POLL_INTERVAL))
+            _SCHEDULERS[host] = Scheduler(queue, host, session, submit_fn, poll_interval)
+
+        return _SCHEDULERS[host]
+
+
+def is_busy() -> bool:
+    """Whether any scheduler in this process is still releasing tickets"""
+    with _SCHEDULERS_LOCK:
+        return any(s.running for s in _SCHEDULERS.values())
+
+
+def _to_dict(row: sqlite3.Row) -> dict:
+    ticket = dict(row)
+    ticket['request'] = json.loads(ticket['request'])
+    return ticket
+
+
+def _int_or_none(value) -> Optional[int]:
+    return int(value) if value not in (None, '', 'None') else None
@@ -0,0 +1,414 @@
+"""Parallel SFTP transfers
+
+Files are transferred over several SFTP channels on the same SSH transport. Files larger than
+`SPLIT_SIZE` are split into ranges that are written concurrently, so a single large file (e.g. a
+Parasolid .x_t or a multi GB .res) isn't limited by the request/response latency of one channel.
+
+Downloads are written to `<file>.part` and renamed when complete. The progress of each range is
+checkpointed to `<file>.part.json` so an interrupted download resumes where it left off, provided
+the remote file hasn't changed since.
+
+`sync_files` keeps a manifest of the remote size and modification time of each file it downloads so
+that unchanged files are skipped and files that have only grown (e.g. the .msg of a running job)
+have just their new tail appended.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from paramiko import SFTPAttributes, SFTPClient, Transport
+
+LOG = logging.getLogger(__name__)
+
+# Default number of concurrent SFTP channels
+CONCURRENCY = 4
+
+# Files larger than this (bytes) are split into ranges of this size
+SPLIT_SIZE = 32 * 2**20
+
+# Size of the blocks read from the local file and written to the remote file
+BLOCK_SIZE = 2**20
+
+# Download progress is checkpointed every time this many bytes (per range) have been written
+CHECKPOINT_SIZE = 8 * 2**20
+
+PART_SUFFIX = '.part'
+
+MANIFEST_NAME = '.aview_hpc_manifest.json'
+
+# Files that Adams only ever appends to, so a grown file can be synced by fetching its tail
+APPEND_SUFFIXES = ('.msg', '.req', '.out')
+
+
+@dataclass
+class _FileTransfer():
+    """Progress of a single file transfer"""
+    local: Path
+    remote: str
+    size: int
+    n_parts: int
+    t_start: float = None
+    parts_done: int = 0
+    transferred: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def part_started(self):
+        with self.lock:
+            if self.t_start is None:
+                self.t_start = time.perf_counter()
+
+    def part_done(self) -> bool:
+        """Record a finished part. Returns True if this was the last part."""
+        with self.lock:
+            self.parts_done += 1
+            return self.parts_done == self.n_parts
+
+    def add_transferred(self, n_bytes: int) -> int:
+        """Record `n_bytes` more bytes transferred. Returns the total so far."""
+        with self.lock:
+            self.transferred += n_bytes
+            return self.transferred
+
+
+@dataclass
+class _Download(_FileTransfer):
+    """Progress of a single (resumable) file download"""
+    mtime: int = None
+    start: int = 0
+    done: Dict[int, int] = field(default_factory=dict)
+    callback: Callable[[Path, int, int], None] = None
+
+    @property
+    def part_file(self) -> Path:
+        """The file being written. Appends are written to the local file directly."""
+        return self.local if self.start > 0 else self.local.with_name(self.local.name + PART_SUFFIX)
+
+    @property
+    def progress_file(self) -> Path:
+        return self.local.with_name(self.local.name + PART_SUFFIX + '.json')
+
+    def load_progress(self):
+        """Load the progress of a previous, interrupted download of the same remote file"""
+        try:
+            progress = json.loads(self.progress_file.read_text())
+        except (OSError, ValueError):
+            return
+
+        if (progress.get('size') == self.size and progress.get('mtime') == self.mtime
+                and progress.get('start', 0) == self.start and self.part_file.exists()):
+            self.done = {int(offset): n for offset, n in progress['done'].items()}
+
+        self.transferred = self.start + sum(self.done.values())
+
+    def checkpoint(self, offset: int, n_bytes: int):
+        """Record that the first `n_bytes` of the range starting at `offset` are on disk"""
+        with self.lock:
+            self.done[offset] = n_bytes
+            tmp_file = self.progress_file.with_suffix(f'.{threading.get_ident()}.tmp')
+            tmp_file.write_text(json.dumps({'size': self.size,
+                                            'mtime': self.mtime,
+                                            'start': self.start,
+                                            'done': self.done}))
+            os.replace(tmp_file, self.progress_file)
+
+    def report(self, n_bytes: int):
+        transferred = self.add_transferred(n_bytes)
+        if self.callback is not None:
+            self.callback(self.local, transferred, self.size)
+
+
+def upload_files(transport: Transport,
+                 files: List[Tuple[Path, str]],
+                 concurrency: int = CONCURRENCY,
+                 split_size: int = SPLIT_SIZE,
+                 ftp: SFTPClient = None):
+    """Upload files over several SFTP channels on the same transport
+
+    Parameters
+    ----------
+    transport : Transport
+        An authenticated SSH transport
+    files : List[Tuple[Path, str]]
+        A list of (local file, remote posix path) pairs
+    concurrency : int, optional
+        The number of SFTP channels to use, by default `CONCURRENCY`
+    split_size : int, optional
+        Files larger than this (bytes) are split into concurrently written ranges of this size, by
+        default `SPLIT_SIZE`
+    ftp : SFTPClient, optional
+        An already open SFTP client to use as one of the channels, by default None
+    """
+    transfers = [_FileTransfer(Path(local), remote, Path(local).stat().st_size, 1)
+                 for local, remote in files]
+    tasks: 'queue.Queue[Tuple[_FileTransfer, int, int]]' = queue.Queue()
+
+    for transfer in transfers:
+        if transfer.size > split_size and concurrency > 1:
+            offsets = range(0, transfer.size, split_size)
+            transfer.n_parts = len(offsets)
+            for offset in offsets:
+                tasks.put((transfer, offset, min(split_size, transfer.size - offset)))
+        else:
+            tasks.put((transfer, 0, None))
+
+    n_workers = max(1, min(concurrency, tasks.qsize()))
+    if n_workers > 1:
+        LOG.debug(f'Uploading {len(transfers)} files ({tasks.qsize()} parts) '
+                  f'over {n_workers} SFTP channels')
+
+    # Create the split files up front so that ranges can be written in any order
+    ftp_ = ftp or SFTPClient.from_transport(transport)
+    for transfer in (t for t in transfers if t.n_parts > 1):
+        with ftp_.open(transfer.remote, 'wb'):
+            pass
+
+    _run_workers(transport, tasks, n_workers, _upload_part, ftp_, close_first=ftp is None)
+
+
+def _upload_part(ftp: SFTPClient, transfer: _FileTransfer, offset: int, length: int):
+    transfer.part_started()
+
+    if length is None:
+        ftp.put(transfer.local.as_posix(), transfer.remote)
+
+    else:
+        with open(transfer.local, 'rb') as src, ftp.open(transfer.remote, 'r+b') as dst:
+            dst.set_pipelined(True)
+            src.seek(offset)
+            dst.seek(offset)
+            remaining = length
+            while remaining > 0:
+                block = src.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                dst.write(block)
+                remaining -= len(block)
+
+    if transfer.part_done():
+        _log_throughput('Uploaded', transfer)
+
+
+def download_files(transport: Transport,
+                   files: List[Tuple[str, Path]],
+                   concurrency: int = CONCURRENCY,
+                   split_size: int = SPLIT_SIZE,
+                   ftp: SFTPClient = None,
+                   attrs: List[SFTPAttributes] = None,
+                   callback: Callable[[Path, int, int], None] = None,
+                   starts: List[int] = None):
+    """Download files over several SFTP channels on the same transport
+
+    Large files are split into ranges that are downloaded concurrently, and each range is read with
+    pipelined (read-ahead) requests. Interrupted downloads are resumed.
+
+    Parameters
+    ----------
+    transport : Transport
+        An authenticated SSH transport
+    files : List[Tuple[str, Path]]
+        A list of (remote posix path, local file) pairs
+    concurrency : int, optional
+        The number of SFTP channels to use, by default `CONCURRENCY`
+    split_size : int, optional
+        Files larger than this (bytes) are split into concurrently downloaded ranges of this size,
+        by default `SPLIT_SIZE`
+    ftp : SFTPClient, optional
+        An already open SFTP client to use as one of the channels, by default None
+    attrs : List[SFTPAttributes], optional
+        The attributes of the remote files (e.g. from `listdir_attr`). If not given, each remote
+        file is stat'ed.
+    callback : Callable[[Path, int, int], None], optional
+        Called with (local file, bytes transferred, total bytes) as each file progresses. May be
+        called from several threads at once.
+    starts : List[int], optional
+        For each file, the offset to start downloading from. If greater than 0, the bytes from that
+        offset on are written into the existing local file (i.e. only the tail is fetched). By
+        default every file is downloaded in full.
+    """
+    ftp_ = ftp or SFTPClient.from_transport(transport)
+    if attrs is None:
+        attrs = [ftp_.stat(remote) for remote, _ in files]
+    if starts is None:
+        starts = [0] * len(files)
+
+    downloads: List[_Download] = []
+    tasks: 'queue.Queue[Tuple[_Download, int, int]]' = queue.Queue()
+    for (remote, local), attr, start in zip(files, attrs, starts):
+        download = _Download(Path(local), remote, attr.st_size, 1, mtime=attr.st_mtime,
+                             start=start, callback=callback)
+        download.load_progress()
+        download.local.parent.mkdir(parents=True, exist_ok=True)
+        if not download.done and start == 0:
+            # Create (or truncate) the part file up front so ranges can be written in any order
+            open(download.part_file, 'wb').close()
+
+        step = split_size if concurrency > 1 else max(download.size - start, 1)
+        offsets = range(start, max(download.size, start + 1), step)
+        download.n_parts = len(offsets)
+        for offset in offsets:
+            tasks.put((download, offset, max(min(step, download.size - offset), 0)))
+        downloads.append(download)
+
+    n_workers = max(1, min(concurrency, tasks.qsize()))
+    if n_workers > 1:
+        LOG.debug(f'Downloading {len(downloads)} files ({tasks.qsize()} parts) '
+                  f'over {n_workers} SFTP channels')
+
+    _run_workers(transport, tasks, n_workers, _download_part, ftp_, close_first=ftp is None)
+
+
+def _download_part(ftp: SFTPClient, download: _Download, offset: int, length: int):
+    download.part_started()
+
+    start = download.done.get(offset, 0)
+    if start > 0 and download.callback is not None:
+        download.callback(download.local, download.transferred, download.size)
+
+    if start < length:
+        with ftp.open(download.remote, 'rb') as src, open(download.part_file, 'r+b') as dst:
+            dst.seek(offset + start)
+            chunks = [(pos, min(BLOCK_SIZE, offset + length - pos))
+                      for pos in range(offset + start, offset + length, BLOCK_SIZE)]
+
+            # `readv` pipelines the read requests for all the chunks (read-ahead)
+            written = start
+            last_checkpoint = start
+            for block in src.readv(chunks):
+                dst.write(block)
+                written += len(block)
+                download.report(len(block))
+                if written - last_checkpoint >= CHECKPOINT_SIZE:
+                    dst.flush()
+                    download.checkpoint(offset, written)
+                    last_checkpoint = written
+
+        download.checkpoint(offset, written)
+
+    if download.part_done():
+        if download.part_file != download.local:
+            os.replace(download.part_file, download.local)
+        download.progress_file.unlink(missing_ok=True)
+        _log_throughput('Downloaded' if download.start == 0 else 'Appended', download)
+
+
+def sync_files(transport: Transport,
+               files: List[Tuple[str, Path]],
+               attrs: List[SFTPAttributes],
+               manifest_file: Path,
+               append_suffixes: Tuple[str, ...] = APPEND_SUFFIXES,
+               **kwargs) -> List[Path]:
+    """Download only the files that have changed since they were last synced
+
+    A file is skipped if its remote size and modification time match the manifest and the local
+    copy is intact. A file with a suffix in `append_suffixes` that has grown since it was last
+    synced has just its new bytes appended. Anything else is downloaded in full.
+
+    Parameters
+    ----------
+    transport : Transport
+        An authenticated SSH transport
+    files : List[Tuple[str, Path]]
+        A list of (remote posix path, local file) pairs
+    attrs : List[SFTPAttributes]
+        The attributes of the remote files (e.g. from `listdir_attr`)
+    manifest_file : Path
+        The manifest of previously synced files
+    append_suffixes : Tuple[str, ...], optional
+        Suffixes of files that are only ever appended to, by default `APPEND_SUFFIXES`
+    **kwargs
+        Passed to `download_files`
+
+    Returns
+    -------
+    List[Path]
+        The local files that were transferred (in full or in part)
+    """
+    manifest_file = Path(manifest_file)
+    try:
+        manifest: Dict[str, dict] = json.loads(manifest_file.read_text())
+    except (OSError, ValueError):
+        manifest = {}
+
+    to_get, to_get_attrs, starts = [], [], []
+    for (remote, local), attr in zip(files, attrs):
+        local = Path(local)
+        entry = manifest.get(remote)
+        local_size = local.stat().st_size if local.exists() else None
+
+        if entry is None or local_size != entry['size']:
+            start = 0
+        elif attr.st_size == entry['size'] and attr.st_mtime == entry['mtime']:
+            LOG.debug(f'Unchanged: {local.name}')
+            continue
+        elif attr.st_size > entry['size'] and local.suffix in append_suffixes:
+            start = entry['size']
+        else:
+            start = 0
+
+        to_get.append((remote, local))
+        to_get_attrs.append(attr)
+        starts.append(start)
+
+    if to_get:
+        download_files(transport, to_get, attrs=to_get_attrs, starts=starts, **kwargs)
+
+    for (remote, local), attr in zip(to_get, to_get_attrs):
+        manifest[remote] = {'size': attr.st_size, 'mtime': attr.st_mtime}
+
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = manifest_file.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_file.write_text(json.dumps(manifest))
+    os.replace(tmp_file, manifest_file)
+
+    LOG.info(f'Synced {len(to_get)} of {len(files)} files ({len(files) - len(to_get)} unchanged)')
+    return [local for _, local in to_get]
+
+
+def _run_workers(transport: Transport,
+                 tasks: queue.Queue,
+                 n_workers: int,
+                 func,
+                 ftp: SFTPClient,
+                 close_first: bool):
+    """Run `func(ftp, *task)` for every task in `tasks` on `n_workers` SFTP channels"""
+    errors = []
+
+    def worker(ftp_: SFTPClient, close: bool):
+        try:
+            while not errors:
+                try:
+                    task = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                func(ftp_, *task)
+        except Exception as err:  # noqa: BLE001
+            errors.append(err)
+        finally:
+            if close:
+                ftp_.close()
+
+    threads = [threading.Thread(target=worker, args=(ftp, close_first))]
+    for _ in range(n_workers - 1):
+        threads.append(threading.Thread(target=worker,
+                                        args=(SFTPClient.from_transport(transport), True)))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def _log_throughput(action: str, transfer: _FileTransfer):
+    elapsed = max(time.perf_counter() - transfer.t_start, 1e-6)
+    LOG.info(f' {action}: {transfer.local.name} '
+             f'({transfer.size*1e-6:.1f} MB in {elapsed:.1f} s, '
+             f'{transfer.size*1e-6/elapsed:.1f} MB/s)')
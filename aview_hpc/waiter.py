@@ -0,0 +1,225 @@
+"""Wait for any number of jobs to finish with a fixed amount of work per polling cycle
+
+Each cycle a `Waiter` makes one sacct query for the states of all the jobs it is still waiting on
+(`sacct -j <id>,<id>,...`) and one status probe of all their remote directories
+(`HPCSession.get_dirs_status`). A job is resolved once Slurm reports a terminal state or its .msg
+file has the completion marker. The errors in its .msg file are only read if the probe found any.
+Jobs added by their remote directory only are looked up in the job table (by WorkDir) until their
+job ID is found, so a job that dies without writing the completion marker is still resolved.
+The time between cycles grows while nothing changes and drops back as soon as something does.
+"""
+import logging
+import time
+from contextlib import AbstractContextManager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from paramiko import SSHException
+
+LOG = logging.getLogger(__name__)
+
+# Slurm job states after which a job will not run any more
+TERMINAL_STATES = ('BOOT_FAIL', 'CANCELLED', 'COMPLETED', 'DEADLINE', 'FAILED', 'NODE_FAIL',
+                   'OUT_OF_MEMORY', 'PREEMPTED', 'REVOKED', 'TIMEOUT')
+
+# Default shortest and longest time between polling cycles (seconds)
+MIN_INTERVAL = 10
+MAX_INTERVAL = 300
+
+# The time between cycles is multiplied by this each time nothing changes
+BACKOFF = 1.5
+
+
+@dataclass
+class WaitResult():
+    """A job being waited on"""
+    remote_dir: Optional[str] = None
+    """The posix path of the remote directory of the job"""
+    job_id: Optional[str] = None
+    """The job ID"""
+    state: Optional[str] = None
+    """The last state reported by Slurm (None if it isn't known)"""
+    finished: bool = False
+    """Whether the .msg file has the completion marker"""
+    errors: List[str] = field(default_factory=list)
+    """The errors in the .msg file (read once the job is done)"""
+    done: bool = False
+    """Whether the job has been resolved"""
+
+
+class Waiter():
+    """Waits for many jobs at once
+
+    Parameters
+    ----------
+    session : Callable[[], AbstractContextManager]
+        Opens an `HPCSession` for a polling cycle (e.g. `lambda: hpc_session(host, username)`).
+        Sessions are pooled, so this is cheap, and a dropped connection only costs a cycle.
+    min_interval : float, optional
+        The shortest time between cycles (seconds), by default `MIN_INTERVAL`
+    max_interval : float, optional
+        The longest time between cycles (seconds), by default `MAX_INTERVAL`
+    ignore_static : bool, optional
+        Ignore failed static equilibrium errors, by default False
+    ignore_parse : bool, optional
+        Ignore command parsing errors, by default False
+    """
+
+    def __init__(self,
+                 session: Callable[[], AbstractContextManager],
+                 min_interval: float = MIN_INTERVAL,
+                 max_interval: float = MAX_INTERVAL,
+                 ignore_static: bool = False,
+                 ignore_parse: bool = False):
+        self.session = session
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.ignore_static = ignore_static
+        self.ignore_parse = ignore_parse
+        self.results: List[WaitResult] = []
+
+    @property
+    def pending(self) -> List[WaitResult]:
+        """The jobs that haven't been resolved yet"""
+        return [r for r in self.results if not r.done]
+
+    def add(self, remote_dir: Path = None, job_id: Union[int, str] = None) -> WaitResult:
+        """Start waiting on a job, given its remote directory, its job ID or both"""
+        if remote_dir is None and job_id is None:
+            raise ValueError('Either a remote directory or a job ID is needed')
+
+        result = WaitResult(Path(remote_dir).as_posix() if remote_dir is not None else None,
+                            str(job_id) if job_id is not None else None)
+        self.results.append(result)
+        return result
+
+    def poll(self) -> List[WaitResult]:
+        """Run one polling cycle
+
+        Returns
+        -------
+        List[WaitResult]
+            The jobs that were resolved in this cycle
+        """
+        pending = self.pending
+        if not pending:
+            return []
+
+        with self.session() as hpc:
+            unknown = [r for r in pending if r.job_id is None]
+            if unknown:
+                found = self._find_job_ids(hpc, [r.remote_dir for r in unknown])
+                for result in unknown:
+                    result.job_id = found.get(result.remote_dir)
+
+            states = self._query_states(hpc, [r.job_id for r in pending if r.job_id is not None])
+            for result in pending:
+                if result.job_id in states:
+                    result.state, remote_dir = states[result.job_id]
+                    result.remote_dir = result.remote_dir or remote_dir
+
+            dirs = [r.remote_dir for r in pending if r.remote_dir is not None]
+            status = hpc.get_dirs_status(dirs) if dirs else {}
+
+            resolved = []
+            for result in pending:
+                dir_status = status.get(result.remote_dir)
+                if dir_status is not None:
+                    result.finished = dir_status['finished']
+
+                if not (result.finished or result.state in TERMINAL_STATES):
+                    continue
+
+                if dir_status is not None and dir_status['n_errors'] > 0:
+                    _, result.errors = hpc.check_if_finished_and_get_errors(
+                        Path(result.remote_dir),
+                        ignore_static=self.ignore_static,
+                        ignore_parse=self.ignore_parse)
+
+                result.done = True
+                resolved.append(result)
+
+        return resolved
+
+    def wait(self,
+             timeout: float = None,
+             callback: Callable[[WaitResult], None] = None) -> List[WaitResult]:
+        """Poll until every job is resolved
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Give up after this many seconds, by default None (wait forever)
+        callback : Callable[[WaitResult], None], optional
+            Called with each job as it is resolved, by default None
+
+        Returns
+        -------
+        List[WaitResult]
+            Every job, in the order they were added
+
+        Raises
+        ------
+        TimeoutError
+            If the jobs aren't all resolved within `timeout` seconds
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        interval = self.min_interval
+
+        while self.pending:
+            before = [(r.state, r.finished) for r in self.pending]
+            try:
+                resolved = self.poll()
+            except (SSHException, ConnectionResetError, EOFError, OSError) as err:
+                # This may happen if the VPN disconnects
+                LOG.warning(f'Could not check the status of the jobs: {err}')
+                resolved = []
+
+            for result in resolved:
+                LOG.info(f'Job {result.job_id or result.remote_dir} is done '
+                         f'(state: {result.state}, errors: {len(result.errors)})')
+                if callback is not None:
+                    callback(result)
+
+            if not self.pending:
+                break
+
+            changed = resolved or before != [(r.state, r.finished) for r in self.pending]
+            interval = self.min_interval if changed else min(interval * BACKOFF, self.max_interval)
+
+            if deadline is not None and time.monotonic() + interval > deadline:
+                raise TimeoutError(f'{len(self.pending)} of {len(self.results)} jobs did not '
+                                   f'finish within {timeout} seconds')
+
+            LOG.debug(f'Waiting on {len(self.pending)} jobs. Checking again in {interval:.0f} '
+                      'seconds...')
+            time.sleep(interval)
+
+        return self.results
+
+    @staticmethod
+    def _find_job_ids(hpc, remote_dirs: List[str]) -> Dict[str, str]:
+        """Get the ID of the most recent job that ran in each remote directory (see
+        `HPCSession.find_job_id`)"""
+        df = hpc.get_job_table()
+        matches = df[df['WorkDir'].isin(remote_dirs)]
+        return dict(zip(matches['WorkDir'], matches['JobID'].astype(str)))
+
+    @staticmethod
+    def _query_states(hpc, job_ids: List[str]) -> Dict[str, tuple]:
+        """Get the state and working directory of several jobs with one sacct call"""
+        if not job_ids:
+            return {}
+
+        cmd = f'sacct -X -P -n --delimiter=, -o jobid,state,workdir -j {",".join(job_ids)}'
+        _, stdout, _ = hpc.ssh.exec_command(cmd)
+
+        states = {}
+        for line in stdout.read().decode().splitlines():
+            if line.count(',') < 2:
+                continue
+            job_id, state, workdir = line.split(',', 2)
+            states[job_id] = (state.split()[0] if state.strip() else None, workdir or None)
+
+        return states
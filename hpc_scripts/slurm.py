@@ -2,6 +2,7 @@
 '''Submit an ACF file to the cluster using SLURM
 
 usage: asub.py <acf_file> [options]
+       asub.py --array <task_file> [--throttle N] [options]
 
 positional arguments:
   acf_file              Path to the ACF file
@@ -9,6 +10,9 @@ positional arguments:
 optional arguments:
   -h, --help            show this help message and exit
   --mins MINS           Number of minutes for job execution (default: 120)
+  --array TASK_FILE     Submit a job array. TASK_FILE lists one ACF file per line. Task i runs the
+                        ACF file on line i + 1, in the directory of that file and with its name.
+  --throttle N          Maximum number of array tasks running at once
   
 note:
   This will recognize the following:
@@ -19,6 +23,7 @@ note:
 from contextlib import contextmanager
 import os
 import re
+import subprocess
 from pathlib import Path
 import argparse
 import sys
@@ -40,6 +45,28 @@ export MSC_LICENSE_FILE=1700@10.20.0.10
 /opt/hexagon/adams/2023_3/mdi -c ru-s i {acf_file} exit
 """
 
+# The output paths are relative to the working directory and use the name of the task (%x), both of
+# which are set for each task after submission (see `submit_array`)
+SLURM_ARRAY_SCRIPT = """#!/bin/bash
+#SBATCH -J {job_name}
+#SBATCH -o %x.log
+#SBATCH -e %x.err
+#SBATCH --time 7200
+#SBATCH --mem 32G
+
+export LC_ALL=C
+export MSC_OS_PREF=rhe79
+export LD_LIBRARY_PATH=/opt/hexagon/Adams/2022_1_875404/lib64
+export MSC_LICENSE_FILE=1700@10.20.0.10
+
+ACF_FILE=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" {task_file})
+cd "$(dirname "$ACF_FILE")"
+
+#Add command and option to run target software
+/opt/hexagon/adams/2023_3/mdi -c ru-s i "$(basename "$ACF_FILE")" exit
+"""
+
+RE_SUBMITTED = re.compile(r'submitted batch job (\d+)', flags=re.I)
 RE_MODEL = re.compile(r'file/.*model[ \t]*=[ \t]*(.+)[ \t]*(?:,|$)', flags=re.I|re.MULTILINE)
 RE_NTHREADS = re.compile(r'nthreads[ \t]*=[ \t]*(\d+)\b', flags=re.I)
 
@@ -104,6 +131,61 @@ def submit(acf_file: Path, mins:int=120, args: list =None):
         print(f'Running: {cmd}')
         os.system(cmd)
 
+def submit_array(task_file: Path, mins: int = 120, throttle: int = None, args: list = None):
+    acf_files = [Path(line.strip()) for line in task_file.read_text().splitlines() if line.strip()]
+    if not acf_files:
+        raise ValueError(f'{task_file} has no contents!')
+
+    job_name = acf_files[0].stem
+    n_cpus = max(get_n_cpus(get_adm_from_acf(acf_file)) for acf_file in acf_files)
+    script = SLURM_ARRAY_SCRIPT.format(job_name=job_name, task_file=task_file)
+
+    script_file = get_unique_file_name(task_file.parent / f'{job_name}.slurm')
+    script_file.write_text(script)
+
+    # The array is submitted held so that each task can be given its own name and working
+    # directory (which splits it into its own job record) before any of them start. The comment
+    # lets an interrupted batch find the array by its task file.
+    array = f'0-{len(acf_files) - 1}' + (f'%{throttle}' if throttle else '')
+    with cwd_as(task_file.parent):
+        cmd = (f'sbatch --hold --array={array} --time={mins} --cpus-per-task={n_cpus} '
+               f'--comment={task_file} {script_file}')
+        if args:
+            cmd += ' ' + ' '.join(args)
+
+        print(f'Running: {cmd}', file=sys.stderr)
+        proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, text=True)
+
+    match = RE_SUBMITTED.search(proc.stdout)
+    if match is None:
+        print(proc.stdout, end='')
+        return
+
+    array_job_id = match.group(1)
+
+    # All the updates go to a single scontrol process (one command per line) rather than one
+    # process per task. The tasks cd to their own directory anyway, so if this fails they still
+    # run correctly, just with the array's name and their logs in the batch directory.
+    updates = ''.join(f'update JobId={array_job_id}_{task_id} Name={acf_file.stem} '
+                      f'WorkDir={acf_file.parent}\n'
+                      for task_id, acf_file in enumerate(acf_files))
+    update = subprocess.run(['scontrol'], input=updates, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True)
+    if update.returncode != 0 or update.stderr.strip():
+        print(f'Could not name the tasks of array {array_job_id}: {update.stderr.strip()}',
+              file=sys.stderr)
+
+    release = subprocess.run(['scontrol', 'release', array_job_id], stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, text=True)
+    if release.returncode != 0:
+        # Don't leave the array held forever
+        subprocess.run(['scancel', array_job_id], stdout=subprocess.DEVNULL)
+        raise RuntimeError(f'Could not release array {array_job_id}, so it was cancelled: '
+                           f'{release.stderr.strip()}')
+
+    # Only report the submission once the array will run
+    print(proc.stdout, end='')
+
 @contextmanager
 def cwd_as(cwd: Path):
     _cwd = Path.cwd()
@@ -129,17 +211,32 @@ if __name__ == '__main__':
         description=__doc__,
         formatter_class=argparse.RawTextHelpFormatter
         )
-    parser.add_argument('acf_file', type=str, help='Path to the ACF file')
+    parser.add_argument('acf_file', type=str, nargs='?', help='Path to the ACF file')
     parser.add_argument('--mins', 
                         type=int, 
                         default=60*12, 
                         help='Number of minutes for job execution (default: 120)')
+    parser.add_argument('--array',
+                        type=str,
+                        default=None,
+                        help='Submit a job array. A file listing one ACF file per line.')
+    parser.add_argument('--throttle',
+                        type=int,
+                        default=None,
+                        help='Maximum number of array tasks running at once')
     args, other_args = parser.parse_known_args()
 
-    acf_file = Path(args.acf_file).absolute()
     mins = args.mins
 
-    with cwd_as(acf_file.parent):
-        submit(acf_file, mins=mins, args=other_args)
+    if args.array is not None:
+        submit_array(Path(args.array).absolute(), mins=mins, throttle=args.throttle, args=other_args)
+
+    elif args.acf_file is None:
+        parser.error('Either acf_file or --array must be given')
+
+    else:
+        acf_file = Path(args.acf_file).absolute()
+        with cwd_as(acf_file.parent):
+            submit(acf_file, mins=mins, args=other_args)
 
     
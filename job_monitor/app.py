@@ -19,6 +19,8 @@ from .components.header import HEADER
 from .components.job_details_modal import JOB_DETAILS_MODAL
 from .components.job_table import JOB_TABLE
 from .components.job_table import LOAD_BUTTON_ROW
+from .downloads import BLUEPRINT as DOWNLOADS_BLUEPRINT
+from .poller import POLLER
 
 DBC_CSS = 'https://cdn.jsdelivr.net/gh/AnnMarieW/dash-bootstrap-templates/dbc.min.css'
 JS_FILE = Path(__file__).parent / 'assets' / 'filters.js'
@@ -30,6 +32,8 @@ APP = Dash(re.sub(r'\s+', '_', APP_NAME).lower(),
            title=APP_NAME)
 
 # SERVER = APP.server
+APP.server.register_blueprint(DOWNLOADS_BLUEPRINT)
+
 APP.layout = dbc.Container(
     children=[HEADER,
               LOAD_BUTTON_ROW,
@@ -54,6 +58,7 @@ def main():
         root.handlers.remove(old_handler)
     root.addHandler(handler)
 
+    POLLER.start()
     APP.run_server(debug=len(sys.argv) > 1 and sys.argv[1] == '--debug',
                    host='localhost',
                    port=8080)
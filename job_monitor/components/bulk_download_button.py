@@ -1,21 +1,13 @@
-
-import base64
 import logging
-from io import BytesIO
-from pathlib import Path
-from typing import Callable, List
+from typing import List
 
 import dash_bootstrap_components as dbc
-import diskcache
-from dash import Input, Output, State, callback, html, no_update
-from dash.dcc import Download
-from dash.long_callback import DiskcacheLongCallbackManager
+from dash import Input, Output, State, callback, clientside_callback, html, no_update
+from dash.dcc import Interval, Store
 
-from aview_hpc._cli import RES_EXTS, hpc_session
+from ..downloads import PROGRESS, prepare_download
 
 LOG = logging.getLogger(__name__)
-CACHE = diskcache.Cache("./cache")
-LONG_CALLBACK_MANAGER = DiskcacheLongCallbackManager(CACHE)
 
 BULK_DOWNLOAD_BUTTON = html.Div([
     dbc.Button(
@@ -28,7 +20,9 @@ BULK_DOWNLOAD_BUTTON = html.Div([
         className='btn btn-primary',  # Add the bootstrap button class here
         style={'display': 'none'},
     ),
-    Download(id='bulk-download', base64=True)])
+    Store(id='bulk-download-token'),
+    Interval(id='bulk-download-interval', interval=500, disabled=True),
+    dbc.Alert(id='bulk-download-alert', color='warning', is_open=False, duration=5000)])
 
 BULK_DOWNLOAD_PROGRESS_BAR = html.Progress(
     id='bulk-download-progress-bar',
@@ -51,65 +45,58 @@ def show_download_button(row_data: List[dict], loading_state, style: dict):
 
 
 @callback(
-    Output('bulk-download-button-icon', 'children'),
-    Output('bulk-download', 'data'),
+    Output('bulk-download-token', 'data'),
+    Output('bulk-download-alert', 'children'),
+    Output('bulk-download-alert', 'is_open'),
     Input('bulk-download-button', 'n_clicks'),
     State('table', 'selectedRows'),
-    progress=[Output('bulk-download-progress-bar', 'value')],
-    progress_default=['100'],
-    background=True,
-    manager=LONG_CALLBACK_MANAGER,
     prevent_initial_call=True,
 )
-def bulk_download(set_progress: Callable, n: int, row_data: List[dict]):
+def bulk_download(n: int, row_data: List[dict]):
+    """Register the selected jobs for download. The browser then fetches them as one tar stream
+    from `/download/<token>` (see `job_monitor.downloads`)."""
     if n == 0 or not row_data:
-        return [], no_update
-
-    inc = 50/(len(row_data)*len(RES_EXTS))
-    progress = 0
-    set_progress(str(progress))
-
-    with hpc_session() as hpc:
-        _, stdout, _ = hpc.ssh.exec_command('mktemp -d')
-        remote_zip = (Path(stdout.read().decode().strip()) / 'tmp.zip').as_posix()
-
-        LOG.info(f'Creating zip file {remote_zip}')
-        for row in row_data:
-            remote_dir = Path(row['WorkDir'])
-            job_name = Path(row['JobName'])
-
-            fids = [BytesIO() for _ in RES_EXTS]
-            for fid, ext in zip(fids, RES_EXTS):
-
-                remote_file = ((remote_dir / job_name).with_suffix(ext)).as_posix()
-
-                # Check if the file exists...
-                if (Path(remote_file).name in hpc.ftp.listdir(remote_dir.as_posix())):
-                    # If it does, add it to the zip
-                    _, stdout, stderr = hpc.ssh.exec_command(f'zip -j {remote_zip} {remote_file}')
-
-                    if stderr.read().decode() or 'warning' in stdout.read().decode().lower():
-                        LOG.error(f'Error adding {remote_file} to {remote_zip}')
-                    else:
-                        LOG.info(f' Added {remote_file} to {remote_zip}')
-
-                progress += inc
-                set_progress(str(progress))
-
-        def update_progress(transferred: int, total: int):
-            set_progress(str(int(progress + transferred / total * 50)))
-
-        LOG.info(f'Downloading {remote_zip}')
-        fid = BytesIO()
-        hpc.ftp.getfo(remote_zip, fid, callback=update_progress)
+        return no_update, no_update, no_update
+
+    token = prepare_download([row['WorkDir'] for row in row_data])
+    if token is None:
+        return no_update, 'The selected jobs have no result files to download', True
+
+    LOG.info(f'Prepared download {token} of {len(row_data)} jobs')
+    return token, no_update, False
+
+
+# Navigating to an attachment starts the download without leaving the page
+clientside_callback(
+    """
+    function(token) {
+        if (!token) {
+            return window.dash_clientside.no_update;
+        }
+        window.location.href = '/download/' + token;
+        return false;
+    }
+    """,
+    Output('bulk-download-interval', 'disabled'),
+    Input('bulk-download-token', 'data'),
+    prevent_initial_call=True,
+)
 
-    return [], {'content': base64.b64encode(fid.getvalue()).decode(),
-                'filename': Path(job_name).with_suffix('.zip').name}
 
+@callback(
+    Output('bulk-download-progress-bar', 'value'),
+    Output('bulk-download-interval', 'disabled', allow_duplicate=True),
+    Input('bulk-download-interval', 'n_intervals'),
+    State('bulk-download-token', 'data'),
+    prevent_initial_call=True,
+)
+def update_bulk_download_progress(_, token: str):
+    sent, total, done = PROGRESS.get(token, (0, 0, True))
+    if done:
+        PROGRESS.pop(token, None)
+        return '100', True
 
-def add_remote_file_to_zip(remote_file: Path, remote_zip: Path):
-    with hpc_session() as hpc:
-        hpc.ssh.exec_command(f'zip -r {remote_zip} {remote_file}')
+    return str(int(sent / total * 100) if total else 0), False
 
 
 @callback(Output('bulk-download-progress-bar', 'style'),
@@ -1,20 +1,14 @@
 from datetime import datetime
-from io import BytesIO
 from pathlib import Path
-from typing import Callable, List
+from typing import List
 
 import dash_ag_grid as dag
 import dash_bootstrap_components as dbc
-import diskcache
-from dash import Input, Output, State, callback, no_update, html
-from dash.dcc import Download, Loading, Textarea, Markdown
-from dash.long_callback import DiskcacheLongCallbackManager
+from dash import Input, Output, State, callback, clientside_callback, no_update, html
+from dash.dcc import Interval, Loading, Markdown, Store
 
-from aview_hpc._cli import RES_EXTS, get_job_messages, get_last_update
-from aview_hpc._cli import hpc_session
-
-CACHE = diskcache.Cache("./cache")
-LONG_CALLBACK_MANAGER = DiskcacheLongCallbackManager(CACHE)
+from ..downloads import PROGRESS, prepare_file_download
+from ..poller import wait_for_dir
 
 JOB_DETAILS_MODAL = dbc.Modal(dbc.Col(
     [
@@ -89,11 +83,9 @@ def open_modal(cellDoubleClicked: dict, selectedRows: List[dict]):
                                  'resize': 'none'})
 
     download = Loading([dbc.Button('Download', id='download-button', n_clicks=0),
-                        Download(id='res-download'),
-                        Download(id='req-download'),
-                        Download(id='gra-download'),
-                        Download(id='msg-download'),
-                        Download(id='out-download')])
+                        dbc.Checkbox(id='download-compress', label='Compress (gzip)', value=False),
+                        Store(id='download-files'),
+                        Interval(id='download-interval', interval=500, disabled=True)])
     modal_body = [dbc.Row([dbc.Col(table, width=4), dbc.Col(Loading(msg_viewer), width=8)]),
                   dbc.Row(Loading(dbc.Col(id='last-update-timestamp')), justify='center')]
     return True, modal_body, [DOWNLOAD_PROGRESS_BAR, download]
@@ -106,7 +98,7 @@ def open_modal(cellDoubleClicked: dict, selectedRows: List[dict]):
           Input('msg-viewer', 'loading_state'))
 def populate_msg(_, row_data, loading_state: dict):
     remote_dir = Path(next(d['value'] for d in row_data if d['name'] == 'WorkDir'))
-    msg = get_job_messages(remote_dir)
+    msg = wait_for_dir(remote_dir, 'msg') or 'Waiting for the cluster...'
     loading_state['is_loading'] = False
     return f'```adams_msg\n{msg}\n```', loading_state
 
@@ -115,7 +107,11 @@ def populate_msg(_, row_data, loading_state: dict):
           Input('details-table', 'rowData'))
 def update_timestamp(row_data):
     remote_dir = Path(next(d['value'] for d in row_data if d['name'] == 'WorkDir'))
-    last_time, last_file = get_last_update(remote_dir)
+    status = wait_for_dir(remote_dir, 'status')
+    if status is None or status['last_update'] is None:
+        return dbc.Col([dbc.Row('      Last Update: Unknown')], style={'margin': '10px'})
+
+    last_time = datetime.fromtimestamp(status['last_update'])
     time_since = (datetime.now() - last_time)
     time_since_str = []
     if time_since.days:
@@ -128,50 +124,64 @@ def update_timestamp(row_data):
         time_since_str.append(f'{time_since.seconds % 3600 % 60} seconds')
 
     return dbc.Col([dbc.Row(f'      Last Update: {last_time} - ({" ".join(time_since_str)} ago)'),
-                    dbc.Row(f'      Last File: {last_file.name}')],
+                    dbc.Row(f'      Last File: {status["last_file"]}')],
                    style={'margin': '10px'})
 
 
-@callback(Output('res-download', 'data'),
-          Output('req-download', 'data'),
-          Output('gra-download', 'data'),
-          Output('msg-download', 'data'),
-          Output('out-download', 'data'),
+@callback(Output('download-files', 'data'),
           Input('download-button', 'n_clicks'),
           State('details-table', 'rowData'),
-          progress=[Output('download-progress-bar', 'value')],
-          progress_default=['100'],
-          background=True,
-          manager=LONG_CALLBACK_MANAGER,)
-def download_results(set_progress: Callable, n, row_data):
-    """This callback is used to download the job results"""
+          State('download-compress', 'value'),
+          prevent_initial_call=True)
+def download_results(n, row_data, compress: bool):
+    """This callback is used to download the job results. The files are streamed to the browser
+    from `/files/<token>/<filename>` (see `job_monitor.downloads`)."""
     if n == 0:
-        return no_update, no_update, no_update, no_update, no_update
+        return no_update
     remote_dir = Path(next(d['value'] for d in row_data if d['name'] == 'WorkDir'))
-    job_name = str(next(d['value'] for d in row_data if d['name'] == 'JobName'))
-
-    inc = 100/len(RES_EXTS)
-    progress = 0
-    set_progress(str(progress))
-
-    def update_progress(transferred: int, total: int):
-        set_progress(str(int(progress + transferred / total * inc)))
-
-    with hpc_session(remote_dir=remote_dir) as hpc:
-        fids = [BytesIO() for _ in RES_EXTS]
-        for fid, ext in zip(fids, RES_EXTS):
-            try:
-                hpc.ftp.getfo((remote_dir / job_name).with_suffix(ext).as_posix(),
-                              fid,
-                              callback=update_progress)
-            except FileNotFoundError:
-                fid.write(b'')
-
-            progress += inc
-            set_progress(str(progress))
-
-    return [{'content': fid.getvalue().decode(), 'filename': Path(job_name).with_suffix(ext).name}
-            for fid, ext in zip(fids, RES_EXTS)]
+
+    token, filenames = prepare_file_download(remote_dir.as_posix())
+    query = '?compress=gzip' if compress else ''
+    return {'token': token, 'urls': [f'/files/{token}/{name}{query}' for name in filenames]}
+
+
+# Each file is saved by clicking a temporary link, so the browser streams it straight to disk
+clientside_callback(
+    """
+    function(files) {
+        if (!files) {
+            return window.dash_clientside.no_update;
+        }
+        files.urls.forEach(function(url, i) {
+            setTimeout(function() {
+                const link = document.createElement('a');
+                link.href = url;
+                link.download = '';
+                document.body.appendChild(link);
+                link.click();
+                link.remove();
+            }, i * 200);
+        });
+        return false;
+    }
+    """,
+    Output('download-interval', 'disabled'),
+    Input('download-files', 'data'),
+    prevent_initial_call=True,
+)
+
+
+@callback(Output('download-progress-bar', 'value'),
+          Output('download-interval', 'disabled', allow_duplicate=True),
+          Input('download-interval', 'n_intervals'),
+          State('download-files', 'data'),
+          prevent_initial_call=True)
+def update_download_progress(_, files: dict):
+    sent, total, done = PROGRESS.get(files['token'], (0, 0, True))
+    if done:
+        return '100', True
+
+    return str(int(sent / total * 100)), False
 
 
 @callback(Output('download-progress-bar', 'style'),
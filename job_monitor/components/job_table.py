@@ -1,13 +1,13 @@
 import time
-import traceback as tb
 
 import dash_ag_grid as dag
 import dash_bootstrap_components as dbc
-from dash import Input, Output, State, callback, html, no_update
+from dash import Input, Output, State, callback, ctx, html, no_update
 from dash.dcc import Interval
 
-from aview_hpc._cli import get_job_table
+from aview_hpc._cli import JOB_TABLE_COLUMNS
 
+from ..poller import POLLER
 from .bulk_download_button import BULK_DOWNLOAD_BUTTON, BULK_DOWNLOAD_PROGRESS_BAR
 
 DEFAULT_COL_DEF = {'flex': 1, 'minWidth': 50, 'sortable': True, 'resizable': True,
@@ -16,6 +16,19 @@ DEFAULT_COL_DEF = {'flex': 1, 'minWidth': 50, 'sortable': True, 'resizable': Tru
 COL_DEF = {'cellRenderer': 'agAnimateShowChangeCellRenderer',
            'minWidth': 50}
 
+# The headers sacct gives the `JOB_TABLE_COLUMNS` (in the order they are requested)
+SACCT_HEADERS = {'jobid': 'JobID',
+                 'jobname': 'JobName',
+                 'start': 'Start',
+                 'end': 'End',
+                 'elapsed': 'Elapsed',
+                 'state': 'State',
+                 'timelimit': 'Timelimit',
+                 'nnodes': 'NNodes',
+                 'ncpus': 'NCPUS',
+                 'submitline': 'SubmitLine',
+                 'workdir': 'WorkDir'}
+
 
 def get_column_def(col: str):
     if col.lower() in ['start', 'end']:
@@ -59,11 +72,17 @@ def get_column_def(col: str):
     return {'field': col, **col_def, **COL_DEF}
 
 
-INIT_JOB_TABLE = get_job_table()
+def get_columns():
+    """The columns of the job table, without asking the cluster for it"""
+    fields = [col.split('%')[0] for col in JOB_TABLE_COLUMNS]
+    return [SACCT_HEADERS.get(field.lower(), field) for field in fields]
+
+
+# The rows are filled in by `update_data` from the poller's store (last snapshot or first poll)
 JOB_TABLE = dag.AgGrid(
     id='table',
-    rowData=INIT_JOB_TABLE.to_dict('records'),
-    columnDefs=[get_column_def(col) for col in INIT_JOB_TABLE.columns],
+    rowData=[],
+    columnDefs=[get_column_def(col) for col in get_columns()],
     dashGridOptions={
         'rowSelection': 'multiple',
         'enableCellTextSelection': True,
@@ -82,10 +101,15 @@ JOB_TABLE = dag.AgGrid(
           Output('load-button-icon', 'children'),
           Input('load-button', 'n_clicks'),
           Input('interval-component', 'n_intervals'),
-          State('modal', 'is_open'))
-def update_data(n, interval, modal_open):
+          State('modal', 'is_open'),
+          State('last_refresh', 'children'))
+def update_data(n, interval, modal_open, last_refresh):
     """This callback Updates the data in the table. Triggered by the load button and the timer.
 
+    The table is read from the poller's store (see `job_monitor.poller`). The load button asks the
+    poller for a refresh and waits for it. Until the first refresh, the store has the last saved
+    snapshot, which is shown along with any error from the cluster.
+
     Parameters
     ----------
     n : int
@@ -94,6 +118,8 @@ def update_data(n, interval, modal_open):
         Number of times the timer has triggered
     modal_open : bool
         Whether the modal is open
+    last_refresh : str
+        The last refresh time currently displayed
 
     Returns
     -------
@@ -105,17 +131,21 @@ def update_data(n, interval, modal_open):
     if modal_open:
         return no_update, no_update, no_update, no_update, no_update
 
-    try:
-        job_table = get_job_table().to_dict('records')
-        t_str = f'Last Refresh: {time.strftime("%Y-%m-%d %I:%M:%S %p", time.localtime())}'
-    except Exception:
-        return (no_update,
-                no_update,
-                ['!'],
-                [html.Pre(tb.format_exc())],
-                no_update)
+    if ctx.triggered_id == 'load-button':
+        requested = time.time()
+        POLLER.refresh()
+        POLLER.store.wait_for('job_table_error', timeout=30, newer_than=requested)
+
+    error = POLLER.store.get('job_table_error')
+    badge, error_text = (['!'], [html.Pre(error)]) if error is not None else ([], [])
+
+    job_table = POLLER.store.get('job_table')
+    refreshed = time.localtime(POLLER.store.timestamp('job_table'))
+    t_str = f'Last Refresh: {time.strftime("%Y-%m-%d %I:%M:%S %p", refreshed)}'
+    if job_table is None or t_str == last_refresh:
+        return no_update, no_update, badge, error_text, no_update
 
-    return job_table, t_str, [], [], no_update
+    return job_table.to_dict('records'), t_str, badge, error_text, no_update
 
 
 LOAD_BUTTON = dbc.Button([
@@ -150,7 +180,7 @@ LOAD_BUTTON_ROW = html.Div(
                           direction='horizontal',
                           gap=2)),
         dbc.Col(Interval(id='interval-component',
-                         interval=60000,  # Refresh every 60 seconds
+                         interval=10000,  # Check the poller's store every 10 seconds
                          n_intervals=0)),
         dbc.Col(LAST_REFRESH, width=2, style={'justify-content': 'right'}),
     ]))
@@ -0,0 +1,331 @@
+"""Flask routes that stream job results from the cluster straight to the browser
+
+Dash callbacks have to return whole files (base64 encoded) in their JSON response. These routes are
+registered on the Dash app's Flask server instead, and stream the bytes as they arrive from the
+cluster, so nothing is buffered in memory.
+
+A download is started in two steps: a Dash callback calls `prepare_download` (all the results of
+several jobs as one tar) or `prepare_file_download` (the individual result files of one job) to get
+a token, then the browser is pointed at `/download/<token>` or `/files/<token>/<filename>`. The
+bytes sent so far are recorded in `PROGRESS` so a progress bar can follow the download. For
+individual files this is the furthest byte sent of each file, so retried or resumed requests aren't
+counted twice. Tokens expire `TOKEN_TTL` seconds after they were last used.
+
+Individual files support HTTP range requests (so an interrupted download can be resumed by the
+browser) and can be gzip compressed on the fly with `?compress=gzip`.
+"""
+import logging
+import secrets
+import shlex
+import threading
+import time
+import zlib
+from pathlib import PurePosixPath
+from typing import Dict, List, Tuple
+
+from flask import Blueprint, Response, abort, jsonify, request, stream_with_context
+
+from aview_hpc._cli import RES_EXTS, hpc_session
+
+LOG = logging.getLogger(__name__)
+BLUEPRINT = Blueprint('downloads', __name__)
+
+# Size of the blocks read from the remote tar stream
+BLOCK_SIZE = 2**20
+
+# Size of a tar header or data block
+TAR_BLOCK = 512
+
+# Seconds after which an unused token is forgotten
+TOKEN_TTL = 3600
+
+# Downloads that have been prepared but not started: token -> (remote directories, [(path, size)])
+_PENDING: Dict[str, Tuple[List[str], List[Tuple[str, int]]]] = {}
+
+# Single file downloads: token -> (remote directory, {filename: size when listed})
+_FILES: Dict[str, Tuple[str, Dict[str, int]]] = {}
+
+# Progress of each single file download: token -> {filename: (end of the furthest byte sent, size,
+# whether the last request for it failed)}
+_FILE_PROGRESS: Dict[str, Dict[str, Tuple[int, int, bool]]] = {}
+
+# Progress of each download: token -> (bytes sent, total bytes, whether it has finished or failed)
+PROGRESS: Dict[str, Tuple[int, int, bool]] = {}
+
+# The time each token was last used
+_LAST_USED: Dict[str, float] = {}
+
+_LOCK = threading.Lock()
+
+
+def prepare_download(remote_dirs: List[str]) -> str:
+    """Register a bulk download of the result files in `remote_dirs`
+
+    The files are listed straight away, so nothing is registered if there are none.
+
+    Parameters
+    ----------
+    remote_dirs : List[str]
+        The remote directories of the jobs
+
+    Returns
+    -------
+    str
+        A token for `/download/<token>` (None if there are no result files to download)
+    """
+    remote_dirs = [PurePosixPath(d).as_posix() for d in remote_dirs]
+    with hpc_session() as hpc:
+        files = _list_result_files(hpc, remote_dirs)
+    if not files:
+        return None
+
+    token = secrets.token_urlsafe(16)
+    with _LOCK:
+        _expire_tokens()
+        _PENDING[token] = (remote_dirs, files)
+        PROGRESS[token] = (0, sum(_tar_size(size) for _, size in files) + 2 * TAR_BLOCK, False)
+        _LAST_USED[token] = time.monotonic()
+    return token
+
+
+def prepare_file_download(remote_dir: str) -> Tuple[str, List[str]]:
+    """Register the download of the individual result files in `remote_dir`
+
+    The files are listed (with their sizes) straight away so the progress of all of them can be
+    followed under the one token.
+
+    Parameters
+    ----------
+    remote_dir : str
+        The remote directory of the job
+
+    Returns
+    -------
+    str
+        A token for `/files/<token>/<filename>`
+    List[str]
+        The names of the result files
+    """
+    remote_dir = PurePosixPath(remote_dir).as_posix()
+    with hpc_session() as hpc:
+        sizes = {attr.filename: attr.st_size for attr in hpc.ftp.listdir_attr(remote_dir)
+                 if PurePosixPath(attr.filename).suffix in RES_EXTS}
+
+    token = secrets.token_urlsafe(16)
+    with _LOCK:
+        _expire_tokens()
+        _FILES[token] = (remote_dir, sizes)
+        _FILE_PROGRESS[token] = {name: (0, size, False) for name, size in sizes.items()}
+        PROGRESS[token] = (0, sum(sizes.values()), not sizes)
+        _LAST_USED[token] = time.monotonic()
+    return token, list(sizes)
+
+
+@BLUEPRINT.route('/download/<token>')
+def bulk_download(token: str):
+    """Stream one uncompressed tar of the result files of every job registered under `token`
+
+    The files are listed with a single `find` and archived with a single `tar` over all the
+    directories. Each job's files are placed in a folder named after its remote directory.
+    """
+    with _LOCK:
+        remote_dirs, files = _PENDING.pop(token, (None, None))
+    if not files:
+        abort(404, 'No result files to download')
+
+    total = PROGRESS.get(token, (0, 0, False))[1]
+
+    def generate():
+        sent = 0
+        try:
+            with hpc_session() as hpc:
+                # Archive each file relative to the parent of its job directory
+                args = []
+                for path, _ in files:
+                    path = PurePosixPath(path)
+                    args += ['-C', shlex.quote(path.parent.parent.as_posix()),
+                             shlex.quote(f'{path.parent.name}/{path.name}')]
+
+                LOG.info(f'Streaming {len(files)} files ({total*1e-6:.1f} MB) from '
+                         f'{len(remote_dirs)} jobs')
+                _, stdout, stderr = hpc.ssh.exec_command(
+                    f'tar -cf - --format=ustar --record-size={TAR_BLOCK} {" ".join(args)}')
+
+                while block := stdout.read(BLOCK_SIZE):
+                    sent += len(block)
+                    _set_progress(token, sent, max(total, sent))
+                    yield block
+
+                status = stdout.channel.recv_exit_status()
+                if status != 0:
+                    LOG.warning(f'tar reported: {stderr.read().decode().strip()}')
+                if status > 1 or sent == 0:
+                    # Abort the response, so the browser reports a failed download rather than
+                    # saving a broken archive
+                    raise RuntimeError(f'tar failed with exit status {status} after {sent} bytes')
+        finally:
+            # Also when tar or the connection fails, so the progress bar stops
+            _set_progress(token, sent, max(total, sent), done=True)
+
+    name = 'results.tar' if len(remote_dirs) > 1 else f'{PurePosixPath(remote_dirs[0]).name}.tar'
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-tar',
+                    headers={'Content-Disposition': f'attachment; filename="{name}"'})
+
+
+@BLUEPRINT.route('/files/<token>/<filename>')
+def file_download(token: str, filename: str):
+    """Stream a single result file registered under `token` straight from SFTP
+
+    A `Range: bytes=<start>-<end>` header returns just that part of the file (206 Partial Content).
+    `?compress=gzip` compresses the file on the fly instead (ranges are then ignored). The file is
+    stat'ed when the request starts, so a file that has changed since it was listed is sent whole.
+    """
+    with _LOCK:
+        remote_dir, sizes = _FILES.get(token, (None, {}))
+    if filename not in sizes:
+        abort(404)
+
+    remote_file = f'{remote_dir}/{filename}'
+    with hpc_session() as hpc:
+        try:
+            size = hpc.ftp.stat(remote_file).st_size
+        except FileNotFoundError:
+            abort(404)
+    _set_file_progress(token, filename, size=size, failed=False)
+
+    compress = request.args.get('compress') == 'gzip'
+    start, end = (0, size - 1) if compress else _parse_range(request.headers.get('Range'), size)
+    if start is None:
+        return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+    def generate():
+        # gzip wrapper (wbits=31) so the browser saves a valid .gz file
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        try:
+            with hpc_session() as hpc:
+                with hpc.ftp.open(remote_file, 'rb') as fid:
+                    for offset in range(start, end + 1, BLOCK_SIZE):
+                        length = min(BLOCK_SIZE, end + 1 - offset)
+                        block = b''.join(fid.readv([(offset, length)]))
+                        if len(block) < length:
+                            # Abort rather than send a truncated file
+                            raise RuntimeError(f'{remote_file} shrank while it was being sent')
+                        _set_file_progress(token, filename, sent=offset + len(block))
+                        yield compressor.compress(block) if compressor else block
+
+            if compressor:
+                yield compressor.flush()
+
+        except BaseException:
+            # Including the browser going away (GeneratorExit), so the token can still finish
+            _set_file_progress(token, filename, failed=True)
+            raise
+
+    headers = {'Accept-Ranges': 'bytes'}
+    if compress:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}.gz"'
+        return Response(stream_with_context(generate()), mimetype='application/gzip',
+                        headers=headers)
+
+    headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    headers['Content-Length'] = str(end + 1 - start)
+    status = 200
+    if (start, end) != (0, size - 1):
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        status = 206
+
+    return Response(stream_with_context(generate()), status=status,
+                    mimetype='application/octet-stream', headers=headers)
+
+
+@BLUEPRINT.route('/download/<token>/progress')
+def download_progress(token: str):
+    """The progress of a download as JSON (`sent` and `total` bytes)"""
+    sent, total, done = PROGRESS.get(token, (0, 0, True))
+    return jsonify({'sent': sent, 'total': total, 'done': done})
+
+
+def _set_progress(token: str, sent: int, total: int, done: bool = False):
+    with _LOCK:
+        PROGRESS[token] = (sent, total, done)
+        _LAST_USED[token] = time.monotonic()
+
+
+def _set_file_progress(token: str,
+                       filename: str,
+                       sent: int = None,
+                       size: int = None,
+                       failed: bool = None):
+    """Update the progress of one file of a single file download and the total of its token
+
+    `sent` is the end of the bytes just sent. Only the furthest one counts, so bytes sent again
+    (e.g. a retried range) aren't counted twice. The token is done once every file has been sent or
+    its last request failed.
+    """
+    with _LOCK:
+        files = _FILE_PROGRESS.get(token)
+        if files is None:
+            return
+
+        file_sent, file_size, file_failed = files.get(filename, (0, 0, False))
+        files[filename] = (max(file_sent, sent) if sent is not None else file_sent,
+                           size if size is not None else file_size,
+                           failed if failed is not None else file_failed)
+
+        PROGRESS[token] = (sum(min(s, n) for s, n, _ in files.values()),
+                           sum(n for _, n, _ in files.values()),
+                           all(s >= n or f for s, n, f in files.values()))
+        _LAST_USED[token] = time.monotonic()
+
+
+def _expire_tokens():
+    """Forget the tokens that haven't been used for `TOKEN_TTL` seconds (call with `_LOCK` held)"""
+    cutoff = time.monotonic() - TOKEN_TTL
+    for token in [t for t, last_used in _LAST_USED.items() if last_used < cutoff]:
+        for registry in (_PENDING, _FILES, _FILE_PROGRESS, PROGRESS, _LAST_USED):
+            registry.pop(token, None)
+
+
+def _list_result_files(hpc, remote_dirs: List[str]) -> List[Tuple[str, int]]:
+    """List the result files (and their sizes) in several remote directories in one round trip"""
+    names = ' -o '.join(f'-name {shlex.quote("*" + ext)}' for ext in RES_EXTS)
+    dirs = ' '.join(shlex.quote(d) for d in remote_dirs)
+    _, stdout, _ = hpc.ssh.exec_command(
+        f'find {dirs} -maxdepth 1 -type f \\( {names} \\) -printf "%s %p\\n" 2>/dev/null')
+
+    files = []
+    for line in stdout.read().decode().splitlines():
+        size, path = line.split(' ', 1)
+        files.append((path, int(size)))
+
+    return files
+
+
+def _tar_size(size: int) -> int:
+    """The number of bytes a file of `size` bytes takes up in a ustar archive"""
+    return TAR_BLOCK + -(-size // TAR_BLOCK) * TAR_BLOCK
+
+
+def _parse_range(header: str, size: int) -> Tuple[int, int]:
+    """Get the first and last byte of a `Range` header (the whole file if there isn't one)
+
+    Only single ranges are supported. Returns (None, None) if the range can't be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return 0, size - 1
+
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first == '':
+            # The last N bytes
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return 0, size - 1
+
+    if start > end or start >= size:
+        return None, None
+
+    return start, end
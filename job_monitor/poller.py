@@ -0,0 +1,260 @@
+"""A background poller that keeps the job monitor's view of the cluster up to date
+
+Callbacks never talk to the cluster themselves. A single `Poller` thread holds one pooled
+`HPCSession` and refreshes a shared, in-memory `TTLStore`:
+
+* `job_table`: The job table, every `JOB_TABLE_INTERVAL` seconds (or straight away on `refresh`)
+* `('status', remote_dir)`: The files and last update of each watched job directory, every
+  `DIR_INTERVAL` seconds, for all watched directories in one round trip
+* `('msg', remote_dir)`: The .msg file of each watched job. Only the bytes appended since the last
+  poll are fetched, and only when the file has changed (see `aview_hpc.msg.MsgTail`)
+
+Values are set again on every poll that confirms them, so a value's timestamp is the last time it
+was known to be current and callbacks can wait for a fresh one with `TTLStore.wait_for`.
+
+A job directory is watched for `WATCH_TTL` seconds after a callback asks for it (`watch`), e.g.
+while its details modal is open. Browser tabs share the store, so opening a second tab doesn't add
+any load on the cluster.
+
+Each job table is also saved to `SNAPSHOT_FILE`. When the poller starts, the last snapshot is put in
+the store (with the time it was saved), so the app shows the last known table while the first
+refresh runs, or if the cluster can't be reached.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import traceback as tb
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Hashable
+
+import pandas as pd
+
+from aview_hpc._cli import HPCSession
+from aview_hpc.config import DATA_DIR
+from aview_hpc.msg import MsgTail
+
+LOG = logging.getLogger(__name__)
+
+# Seconds between refreshes of the job table
+JOB_TABLE_INTERVAL = 60
+
+# Seconds between refreshes of watched job directories
+DIR_INTERVAL = 10
+
+# Seconds a job directory is watched for after it was last asked for
+WATCH_TTL = 300
+
+# The last job table, shown at startup until the first refresh
+SNAPSHOT_FILE = DATA_DIR / 'job_monitor_snapshot.json'
+
+
+class TTLStore():
+    """A thread safe store of values and the time they were set"""
+
+    def __init__(self):
+        self._data: Dict[Hashable, tuple] = {}
+        self._cond = threading.Condition()
+
+    def set(self, key: Hashable, value: Any, timestamp: float = None):
+        with self._cond:
+            self._data[key] = (value, timestamp if timestamp is not None else time.time())
+            self._cond.notify_all()
+
+    def get(self, key: Hashable, default: Any = None, ttl: float = None) -> Any:
+        """Get a value (`default` if it isn't set or is older than `ttl` seconds)"""
+        with self._cond:
+            if not self._is_fresh(key, ttl):
+                return default
+            return self._data[key][0]
+
+    def timestamp(self, key: Hashable) -> float:
+        """The time a value was set (0 if it isn't set)"""
+        with self._cond:
+            return self._data[key][1] if key in self._data else 0.0
+
+    def wait_for(self,
+                 key: Hashable,
+                 timeout: float,
+                 newer_than: float = 0.0,
+                 ttl: float = None,
+                 default: Any = None) -> Any:
+        """Wait up to `timeout` seconds for a value set after `newer_than` and no older than `ttl`
+        seconds. Returns the current value (however old) if none is set in time."""
+        with self._cond:
+            self._cond.wait_for(lambda: (self.timestamp(key) > newer_than
+                                         and self._is_fresh(key, ttl)), timeout)
+        return self.get(key, default)
+
+    def _is_fresh(self, key: Hashable, ttl: float = None) -> bool:
+        return key in self._data and (ttl is None or time.time() - self._data[key][1] <= ttl)
+
+
+class Poller():
+    """Refreshes a `TTLStore` from the cluster on a background thread
+
+    Parameters
+    ----------
+    job_table_interval : float, optional
+        Seconds between refreshes of the job table, by default `JOB_TABLE_INTERVAL`
+    dir_interval : float, optional
+        Seconds between refreshes of watched directories, by default `DIR_INTERVAL`
+    watch_ttl : float, optional
+        Seconds a directory is watched for after `watch`, by default `WATCH_TTL`
+    snapshot_file : Path, optional
+        Where the last job table is saved, by default `SNAPSHOT_FILE`
+    """
+
+    def __init__(self,
+                 job_table_interval: float = JOB_TABLE_INTERVAL,
+                 dir_interval: float = DIR_INTERVAL,
+                 watch_ttl: float = WATCH_TTL,
+                 snapshot_file: Path = SNAPSHOT_FILE):
+        self.job_table_interval = job_table_interval
+        self.dir_interval = dir_interval
+        self.watch_ttl = watch_ttl
+        self.snapshot_file = Path(snapshot_file)
+        self.store = TTLStore()
+
+        self._hpc: HPCSession = None
+        self._watched: Dict[str, float] = {}
+        self._tails: Dict[str, MsgTail] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._force = False
+        self._thread: threading.Thread = None
+        self._last_table = 0.0
+
+    def start(self):
+        """Load the last snapshot and start polling (does nothing if the poller is already
+        running)"""
+        if self._thread is None or not self._thread.is_alive():
+            self.load_snapshot()
+            self._thread = threading.Thread(target=self._run, name='job_monitor_poller',
+                                            daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        """Refresh the job table now"""
+        self._force = True
+        self._wake.set()
+
+    def load_snapshot(self):
+        """Put the last saved job table in the store, unless it already has a newer one"""
+        try:
+            timestamp = self.snapshot_file.stat().st_mtime
+            if timestamp > self.store.timestamp('job_table'):
+                with open(self.snapshot_file, 'r') as fid:
+                    job_table = pd.DataFrame.from_records(json.load(fid))
+                self.store.set('job_table', job_table, timestamp)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as err:
+            LOG.warning(f'Could not load the job table snapshot {self.snapshot_file}: {err}')
+
+    def save_snapshot(self, job_table: pd.DataFrame):
+        """Save a job table to `snapshot_file`"""
+        tmp_file = self.snapshot_file.with_suffix('.tmp')
+        try:
+            self.snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+            job_table.to_json(tmp_file, orient='records')
+            os.replace(tmp_file, self.snapshot_file)
+        except OSError as err:
+            LOG.warning(f'Could not save the job table snapshot {self.snapshot_file}: {err}')
+
+    def watch(self, remote_dir: str):
+        """Keep the status and .msg file of a job directory up to date for the next `watch_ttl`
+        seconds"""
+        remote_dir = PurePosixPath(remote_dir).as_posix()
+        with self._lock:
+            is_new = remote_dir not in self._watched
+            self._watched[remote_dir] = time.monotonic() + self.watch_ttl
+
+        if is_new:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception:  # noqa: BLE001
+                LOG.exception('Error while polling the cluster')
+                self._reset_session()
+
+            with self._lock:
+                watching = bool(self._watched)
+            self._wake.wait(self.dir_interval if watching else
+                            max(self._last_table + self.job_table_interval - time.monotonic(), 1))
+
+    def poll(self):
+        """Run one polling cycle"""
+        if self._force or time.monotonic() - self._last_table >= self.job_table_interval:
+            self._force = False
+            # Set before connecting so a cluster that can't be reached is retried at the job table
+            # interval (or on `refresh`) rather than straight away
+            self._last_table = time.monotonic()
+            try:
+                if self._hpc is None:
+                    self._hpc = HPCSession()
+                job_table = self._hpc.get_job_table()
+            except Exception:  # noqa: BLE001
+                self.store.set('job_table_error', tb.format_exc())
+                self._reset_session()
+                return
+
+            self.store.set('job_table', job_table)
+            self.store.set('job_table_error', None)
+            self.save_snapshot(job_table)
+
+        now = time.monotonic()
+        with self._lock:
+            self._watched = {d: expiry for d, expiry in self._watched.items() if expiry > now}
+            remote_dirs = list(self._watched)
+
+        self._tails = {d: tail for d, tail in self._tails.items() if d in remote_dirs}
+        if remote_dirs:
+            if self._hpc is None:
+                self._hpc = HPCSession()
+            self._poll_dirs(remote_dirs)
+
+    def _poll_dirs(self, remote_dirs):
+        status = self._hpc.get_dirs_status(remote_dirs)
+        for remote_dir, dir_status in status.items():
+            previous = self.store.get(('status', remote_dir))
+            self.store.set(('status', remote_dir), dir_status)
+
+            msg_file = next((f for f in dir_status['files'] if f['name'].endswith('.msg')), None)
+            if msg_file is None:
+                self._tails.pop(remote_dir, None)
+                self.store.set(('msg', remote_dir), f'No message file found in {remote_dir}')
+                continue
+
+            old = (next((f for f in previous['files'] if f['name'] == msg_file['name']), None)
+                   if previous is not None else None)
+            tail = self._tails.get(remote_dir)
+            if tail is None:
+                tail = self._tails[remote_dir] = MsgTail(remote_dir, keep_text=True)
+                tail.msg_file = f'{remote_dir}/{msg_file["name"]}'
+                tail.update(self._hpc.ftp)
+            elif old != msg_file:
+                tail.update(self._hpc.ftp)
+
+            self.store.set(('msg', remote_dir), tail.text)
+
+    def _reset_session(self):
+        if self._hpc is not None:
+            self._hpc.close(discard=True)
+            self._hpc = None
+
+
+POLLER = Poller()
+
+
+def wait_for_dir(remote_dir: Path, key: str, timeout: float = 30) -> Any:
+    """Watch a job directory and get its `status` or `msg` from the store, waiting for the next
+    poll if the stored value wasn't refreshed by the last one (e.g. the directory wasn't watched)"""
+    remote_dir = Path(remote_dir).as_posix()
+    POLLER.watch(remote_dir)
+    return POLLER.store.wait_for((key, remote_dir), timeout, ttl=2 * POLLER.dir_interval)
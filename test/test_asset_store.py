@@ -0,0 +1,106 @@
+import multiprocessing
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from aview_hpc import asset_store
+from aview_hpc.asset_store import AssetStore, file_hash
+
+
+def add_hashes(index_file: Path, name: str):
+    asset_store.INDEX_FILE = index_file
+    for i in range(20):
+        asset_store.AssetStore._update_index(
+            lambda index: index['hashes'].__setitem__(f'{name}_{i}', {}))
+
+
+def fake_ssh(output: str):
+    ssh = MagicMock()
+    stdout = MagicMock()
+    stdout.read.return_value = output.encode()
+    stdout.channel.recv_exit_status.return_value = 0
+    ssh.exec_command.return_value = (MagicMock(), stdout, MagicMock())
+    return ssh
+
+
+class TestAssetStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.patcher = patch.object(asset_store, 'INDEX_FILE', Path(self.tmp_dir.name) / 'index.json')
+        self.patcher.start()
+
+        self.file = Path(self.tmp_dir.name) / 'geometry.x_t'
+        self.file.write_bytes(b'x' * 100)
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def test_file_hash_is_cached(self):
+        sha = file_hash(self.file)
+
+        with patch('hashlib.sha256') as sha256:
+            self.assertEqual(file_hash(self.file), sha)
+            sha256.assert_not_called()
+
+    def test_unknown_files_are_not_linked(self):
+        store = AssetStore(fake_ssh(''), 'user@host', Path('/tmp'), min_size=0)
+        files = [(self.file, '/tmp/job/geometry.x_t')]
+
+        self.assertEqual(store.link_known(files), files)
+
+    def test_known_files_are_linked(self):
+        AssetStore(fake_ssh(''), 'user@host', Path('/tmp'), min_size=0).add(
+            [(self.file, '/tmp/job_1/geometry.x_t')])
+
+        store = AssetStore(fake_ssh('0 hard\n'), 'user@host', Path('/tmp'), min_size=0)
+        not_linked = store.link_known([(self.file, '/tmp/job_2/geometry.x_t')])
+
+        self.assertEqual(not_linked, [])
+
+    def test_symlinked_and_recent_objects_are_not_evicted(self):
+        AssetStore(fake_ssh(''), 'user@host', Path('/tmp'), min_size=0).add(
+            [(self.file, '/tmp/job_1/geometry.x_t')])
+        AssetStore(fake_ssh('0 sym\n'), 'user@host', Path('/tmp'), min_size=0).link_known(
+            [(self.file, '/tmp/job_2/geometry.x_t')])
+
+        for min_age in (0, 3600):
+            ssh = fake_ssh('')
+            AssetStore(ssh, 'user@host', Path('/tmp'), max_size=0, min_size=0,
+                       min_age=min_age).evict()
+            ssh.exec_command.assert_not_called()
+
+        sha = file_hash(self.file)
+        self.assertIn(sha, asset_store._load_index()['objects']['user@host'])
+
+    def test_only_unlinked_objects_are_evicted(self):
+        other = Path(self.tmp_dir.name) / 'other.x_t'
+        other.write_bytes(b'y' * 100)
+        AssetStore(fake_ssh(''), 'user@host', Path('/tmp'), min_size=0).add(
+            [(self.file, '/tmp/job_1/geometry.x_t'), (other, '/tmp/job_1/other.x_t')])
+        AssetStore._update_index(lambda index: [obj.update(last_used=0)
+                                                for obj in index['objects']['user@host'].values()])
+
+        linked, unlinked = file_hash(self.file), file_hash(other)
+        ssh = fake_ssh(f'2 {linked}\n1 {unlinked}\n')
+        AssetStore(ssh, 'user@host', Path('/tmp'), max_size=0, min_size=0).evict()
+
+        self.assertEqual(list(asset_store._load_index()['objects']['user@host']), [linked])
+        self.assertTrue(ssh.exec_command.call_args[0][0].endswith(f'rm -f {unlinked}'))
+
+    def test_index_is_shared_between_processes(self):
+        index_file = asset_store.INDEX_FILE
+        processes = [multiprocessing.Process(target=add_hashes, args=(index_file, f'p{i}'))
+                     for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+
+        self.assertEqual(len(asset_store._load_index()['hashes']), 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
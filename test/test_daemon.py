@@ -0,0 +1,58 @@
+import socket
+import threading
+import unittest
+from unittest.mock import patch
+
+from aview_hpc import aview_hpc, daemon
+
+
+class TestDaemonClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.state = {'port': self.server.getsockname()[1], 'token': 'token'}
+
+    def tearDown(self):
+        self.server.close()
+
+    def _accept_and_close(self):
+        def run():
+            conn, _ = self.server.accept()
+            conn.recv(4096)
+            conn.close()
+        threading.Thread(target=run, daemon=True).start()
+
+    def test_unreachable(self):
+        self.server.close()
+        with self.assertRaises(daemon.DaemonUnavailable):
+            daemon._request(self.state, 'ping', {}, timeout=5)
+
+    def test_connection_lost_after_send(self):
+        self._accept_and_close()
+        with self.assertRaises(daemon.DaemonConnectionLost):
+            daemon._request(self.state, 'ping', {}, timeout=5)
+
+    def test_timeout_is_passed_to_the_method(self):
+        with patch.object(daemon, '_read_state', return_value=self.state), \
+                patch.object(daemon, '_ping', return_value=True), \
+                patch.object(daemon, '_request') as request:
+            daemon.call('wait_for_jobs', job_ids=['1'], timeout=60)
+
+        _, _, params = request.call_args[0]
+        self.assertEqual(params, {'job_ids': ['1'], 'timeout': 60})
+        self.assertIsNone(request.call_args[1]['timeout'])
+
+    def test_no_fallback_for_submit(self):
+        lost = daemon.DaemonConnectionLost('lost')
+        with patch.object(daemon, 'call', side_effect=lost), \
+                patch.object(aview_hpc, 'is_enabled', return_value=True):
+            with self.assertRaises(RuntimeError):
+                aview_hpc._call_daemon('submit', acf_file='model.acf')
+
+            self.assertIsNone(aview_hpc._call_daemon('get_job_table'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from aview_hpc.dir_status import parse_status_output, status_command
+
+
+class TestDirStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmpdir.name)
+
+        self.finished = self.tmp / 'job 1'
+        self.finished.mkdir()
+        (self.finished / 'job.msg').write_text('---- START: ERROR ----\nbad\n---- END: ERROR ----\n'
+                                               'Finished -----\n')
+        (self.finished / 'job.res').write_text('<Results/>')
+
+        self.running = self.tmp / 'job_2'
+        self.running.mkdir()
+        (self.running / 'job.msg').write_text(' command: sim/dyn\n')
+
+        self.missing = self.tmp / 'job_3'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_status(self):
+        dirs = [d.as_posix() for d in (self.finished, self.running, self.missing)]
+        output = subprocess.run(['sh', '-c', status_command(dirs)], capture_output=True,
+                                text=True, check=True).stdout
+        status = parse_status_output(output, dirs)
+
+        finished, running, missing = (status[d] for d in dirs)
+        self.assertTrue(finished['finished'])
+        self.assertEqual(finished['n_errors'], 1)
+        self.assertEqual(sorted(f['name'] for f in finished['files']), ['job.msg', 'job.res'])
+
+        self.assertFalse(running['finished'])
+        self.assertEqual(running['n_errors'], 0)
+        self.assertEqual(running['last_file'], 'job.msg')
+        self.assertAlmostEqual(running['last_update'], (self.running / 'job.msg').stat().st_mtime,
+                               places=3)
+
+        self.assertEqual(missing['files'], [])
+        self.assertIsNone(missing['last_update'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+import unittest
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+
+from aview_hpc.extract import helper_command, read_helper_output
+from aview_hpc.res import read_res
+
+RES_FILE = Path(__file__).parent / 'results' / 'test.res'
+
+
+class TestExtractHelper(unittest.TestCase):
+    """Runs the helper script locally, as it would be run on the cluster"""
+
+    def run_helper(self, channels):
+        cmd = helper_command(RES_FILE.as_posix(), channels, python=sys.executable)
+        return subprocess.run(cmd, shell=True, capture_output=True, check=False)
+
+    def test_matches_res_reader(self):
+        channels = ['time.TIME', 'PART_2_XFORM.Y', 'PART_2_XFORM.VY']
+        proc = self.run_helper(channels)
+        self.assertEqual(proc.returncode, 0, proc.stderr.decode())
+
+        with open(RES_FILE, 'rb') as fid:
+            expected = read_res(fid, channels)
+
+        data = read_helper_output(BytesIO(proc.stdout))
+
+        self.assertEqual(list(data), channels)
+        for name in channels:
+            np.testing.assert_array_equal(data[name], expected[name])
+
+    def test_missing_channel(self):
+        proc = self.run_helper(['PART_3_XFORM.X'])
+        self.assertNotEqual(proc.returncode, 0)
+        self.assertIn('PART_3_XFORM.X', proc.stderr.decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
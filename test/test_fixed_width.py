@@ -0,0 +1,44 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from aview_hpc.fixed_width import read_gra, read_req
+from aview_hpc.res import read_res
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+class TestFixedWidthReader(unittest.TestCase):
+
+    def test_gra(self):
+        data = read_gra(RESULTS_DIR / 'test.gra')
+
+        self.assertEqual(data.values.shape, (27, 1, 6))
+        self.assertEqual(data.times[0], -9.99999E+05)
+
+        # The part positions match the .res (to the precision of the .gra)
+        with open(RESULTS_DIR / 'test.res', 'rb') as fid:
+            res = read_res(fid, ['PART_2_XFORM.Y'])
+        np.testing.assert_allclose(data.values[:, 0, 1], res['PART_2_XFORM.Y'], rtol=1e-5, atol=1e-12)
+
+    def test_req(self):
+        data = read_req(RESULTS_DIR / 'test.req')
+
+        np.testing.assert_allclose(data.times, np.arange(26) * 0.01, atol=1e-12)
+        self.assertEqual(data.values.shape, (26, 0))
+
+    def test_bytes_match_file(self):
+        content = (RESULTS_DIR / 'test.gra').read_bytes()
+        np.testing.assert_array_equal(read_gra(content).values, read_gra(RESULTS_DIR / 'test.gra').values)
+
+    def test_fallback(self):
+        content = (RESULTS_DIR / 'test.gra').read_bytes().replace(b'-1.22465E-16', b' -1.22465-160')
+        data = read_gra(content)
+
+        self.assertEqual(data.values.shape, (27, 1, 6))
+        self.assertEqual(data.values[-1, 0, 3], -1.22465E-160)
+
+
+if __name__ == '__main__':
+    unittest.main()
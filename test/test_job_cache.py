@@ -0,0 +1,76 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pandas as pd
+
+from aview_hpc import job_cache
+from aview_hpc.job_cache import JobTableCache
+
+
+def make_table(rows):
+    return pd.DataFrame(rows, columns=['JobID', 'State', 'End'])
+
+
+class TestJobTableCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime.now()
+        self.starts = []
+        self.responses = []
+
+    def query(self, start):
+        self.starts.append(start)
+        return self.responses.pop(0)
+
+    def test_full_load_then_delta(self):
+        cache = JobTableCache(days=7)
+        self.responses = [make_table([[1, 'RUNNING', None], [2, 'PENDING', None]]),
+                          make_table([[2, 'RUNNING', None], [3, 'PENDING', None]])]
+
+        cache.refresh(self.query)
+        table = cache.refresh(self.query)
+
+        self.assertEqual(self.starts[0], 'now-7days')
+        self.assertRegex(self.starts[1], r'^now-\d+seconds$')
+        self.assertEqual(table['JobID'].tolist(), ['1', '2', '3'])
+        self.assertEqual(table['State'].tolist(), ['RUNNING', 'RUNNING', 'PENDING'])
+
+    def test_old_jobs_dropped(self):
+        cache = JobTableCache(days=7)
+        old = (self.now - timedelta(days=8)).strftime('%Y-%m-%dT%H:%M:%S')
+        recent = (self.now - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S')
+        self.responses = [make_table([[1, 'COMPLETED', old], [2, 'COMPLETED', recent]]),
+                          make_table([])]
+
+        cache.refresh(self.query)
+        table = cache.refresh(self.query)
+
+        self.assertEqual(table['JobID'].tolist(), ['2'])
+
+    def test_periodic_full_refresh(self):
+        cache = JobTableCache(days=7)
+        self.responses = [make_table([[1, 'RUNNING', None]]), make_table([[1, 'FAILED', None]])]
+
+        cache.refresh(self.query)
+        with patch.object(job_cache, 'FULL_REFRESH', -1):
+            table = cache.refresh(self.query)
+
+        self.assertEqual(self.starts, ['now-7days', 'now-7days'])
+        self.assertEqual(table['State'].tolist(), ['FAILED'])
+
+    def test_mixed_type_delta(self):
+        cache = JobTableCache(days=7)
+        self.responses = [make_table([['99999', 'COMPLETED', None], ['100', 'RUNNING', None],
+                                      ['101_1', 'PENDING', None], ['101_0', 'RUNNING', None]]),
+                          make_table([[100, 'COMPLETED', None], [100000, 'PENDING', None]])]
+
+        cache.refresh(self.query)
+        table = cache.refresh(self.query)
+
+        self.assertEqual(table['JobID'].tolist(), ['100', '101_0', '101_1', '99999', '100000'])
+        self.assertEqual(table['State'].tolist()[0], 'COMPLETED')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from aview_hpc import aview_hpc
+from aview_hpc.aview_hpc import (CANCELLED, DONE, FAILED, SUBMITTED, SUBMITTING, WAITING,
+                                 submit_async, submit_multi_async)
+
+
+class TestJobHandle(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.cancelled = []
+
+        def fake_submit(acf_file, **_):
+            self.release.wait(5)
+            if acf_file.name == 'bad.acf':
+                raise RuntimeError('Could not submit')
+            return Path('/remote') / acf_file.stem, acf_file.stem, 1234
+
+        patches = [patch.object(aview_hpc, 'submit', fake_submit),
+                   patch.object(aview_hpc, 'cancel_job', self.cancelled.append),
+                   patch.object(aview_hpc, '_EXECUTOR', None),
+                   patch.object(aview_hpc, '_WAIT_EXECUTOR', None),
+                   patch.object(aview_hpc, 'get_config', lambda: {'submit_workers': 1})]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(self.release.set)
+
+    def test_result_and_callback(self):
+        handle = submit_async(Path('model.acf'))
+        called = threading.Event()
+        handle.add_done_callback(lambda h: called.set())
+
+        self.assertFalse(handle.done())
+        self.release.set()
+
+        self.assertEqual(handle.result(5), (Path('/remote/model'), 'model', 1234))
+        self.assertTrue(called.wait(5))
+        self.assertEqual(handle.state, SUBMITTED)
+
+    def test_failure(self):
+        handle = submit_async(Path('bad.acf'))
+        self.release.set()
+
+        self.assertIsInstance(handle.exception(5), RuntimeError)
+        self.assertEqual(handle.state, FAILED)
+
+    def test_cancel_queued_and_submitting(self):
+        submitting = submit_async(Path('first.acf'))
+        queued = submit_async(Path('second.acf'))
+        while submitting.state != SUBMITTING:
+            time.sleep(0.01)
+
+        self.assertTrue(queued.cancel())
+        self.assertEqual(queued.state, CANCELLED)
+
+        self.assertTrue(submitting.cancel())
+        self.release.set()
+        submitting.result(5)
+        self.assertEqual(submitting.state, CANCELLED)
+        self.assertEqual(self.cancelled, [1234])
+
+    def test_wait_for_completion(self):
+        with patch.object(aview_hpc, '_wait_for_job', lambda *_: {'state': 'COMPLETED'}):
+            handle = submit_async(Path('model.acf'), wait_for_completion=True)
+            self.release.set()
+            handle.result(5)
+
+        self.assertEqual(handle.state, DONE)
+        self.assertEqual(handle.wait_result, {'state': 'COMPLETED'})
+
+    def test_cancel_while_waiting_sends_one_scancel(self):
+        waiting = threading.Event()
+        finish = threading.Event()
+        self.addCleanup(finish.set)
+
+        def fake_wait(*_):
+            waiting.set()
+            finish.wait(5)
+            return {'state': 'CANCELLED'}
+
+        with patch.object(aview_hpc, '_wait_for_job', fake_wait):
+            handle = submit_async(Path('model.acf'), wait_for_completion=True)
+            self.release.set()
+            self.assertTrue(waiting.wait(5))
+            self.assertTrue(handle.cancel())
+            self.assertFalse(handle.cancel())
+            finish.set()
+            handle.result(5)
+
+        self.assertEqual(handle.state, CANCELLED)
+        self.assertEqual(self.cancelled, [1234])
+
+    def test_wait_does_not_block_submissions(self):
+        finish = threading.Event()
+        self.addCleanup(finish.set)
+
+        def fake_wait(*_):
+            finish.wait(5)
+            return {'state': 'COMPLETED'}
+
+        with patch.object(aview_hpc, '_wait_for_job', fake_wait):
+            waiting = submit_async(Path('first.acf'), wait_for_completion=True)
+            other = submit_async(Path('second.acf'))
+            self.release.set()
+
+            self.assertEqual(other.result(5), (Path('/remote/second'), 'second', 1234))
+            self.assertFalse(waiting.done())
+            self.assertEqual(waiting.state, WAITING)
+
+            finish.set()
+            waiting.result(5)
+
+        self.assertEqual(waiting.state, DONE)
+
+    def test_submit_multi_async_uses_submit_multi(self):
+        calls = []
+
+        def fake_submit_multi(acf_files, adm_files, aux_files, **kwargs):
+            calls.append((acf_files, kwargs))
+            return ([Path('/remote') / f.stem for f in acf_files],
+                    [f.stem for f in acf_files],
+                    [f'99_{i}' for i in range(len(acf_files))])
+
+        with patch.object(aview_hpc, 'submit_multi', fake_submit_multi):
+            handles = submit_multi_async([Path('a.acf'), Path('b.acf')],
+                                         [Path('a.adm'), Path('b.adm')],
+                                         array=True)
+            results = [handle.result(5) for handle in handles]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0][1], {'max_user_jobs': None, 'array': True})
+        self.assertEqual(results, [(Path('/remote/a'), 'a', '99_0'),
+                                   (Path('/remote/b'), 'b', '99_1')])
+        self.assertTrue(all(handle.state == SUBMITTED for handle in handles))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from aview_hpc.job_index import JobIndex, hash_files
+
+HOST = 'user@host'
+
+
+class TestJobIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmpdir.name)
+        self.index = JobIndex(self.tmp / 'index.sqlite')
+
+        self.acf_file = self.tmp / 'model_x.acf'
+        self.acf_file.write_text('sim/dyn, end=1\n')
+
+    def tearDown(self):
+        self.index.close()
+        self.tmpdir.cleanup()
+
+    def test_submission_and_transitions(self):
+        self.index.record_submission(HOST, 101, 'model_x', '/tmp/model_x_abcd', self.acf_file,
+                                     [self.acf_file])
+        table = pd.DataFrame({'JobID': [101, 102],
+                              'JobName': ['model_x', 'other'],
+                              'State': ['FAILED', 'CANCELLED by 1234'],
+                              'Start': ['2024-06-01T12:00:00', None],
+                              'WorkDir': ['/tmp/model_x_abcd', '/tmp/other']})
+        self.index.record_states(HOST, table)
+        self.index.record_states(HOST, table)
+
+        failed = self.index.query(job_name='model%', state='failed')
+        self.assertEqual(failed['job_id'].tolist(), ['101'])
+        self.assertEqual(failed['input_hash'].iloc[0], hash_files([self.acf_file]))
+
+        self.assertEqual(self.index.query(state='CANCELLED')['job_id'].tolist(), ['102'])
+        self.assertEqual(self.index.history(101)['state'].tolist(), ['SUBMITTED', 'FAILED'])
+
+    def test_resubmission_keeps_input_hash(self):
+        self.index.record_submission(HOST, 101, 'model_x', '/tmp/model_x_abcd', self.acf_file,
+                                     [self.acf_file])
+        self.index.record_submission(HOST, 105, 'model_x', '/tmp/model_x_abcd')
+
+        jobs = self.index.query(input_hash=hash_files([self.acf_file]))
+        self.assertEqual(sorted(jobs['job_id']), ['101', '105'])
+
+    def test_hash_ignores_directory_and_order(self):
+        other = self.tmp / 'copy'
+        other.mkdir()
+        (other / 'model_x.acf').write_text(self.acf_file.read_text())
+        (other / 'model_x.adm').write_text('adm')
+        adm_file = self.tmp / 'model_x.adm'
+        adm_file.write_text('adm')
+
+        self.assertEqual(hash_files([self.acf_file, adm_file]),
+                         hash_files([other / 'model_x.adm', other / 'model_x.acf']))
+
+
+if __name__ == '__main__':
+    unittest.main()
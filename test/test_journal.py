@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from aview_hpc import journal
+from aview_hpc.journal import SUBMITTED, UPLOADED, Journal
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        patcher = patch.object(journal, 'JOURNAL_DIR', Path(self.tmp_dir.name) / 'journals')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.acf_files = []
+        for i in range(3):
+            acf_file = Path(self.tmp_dir.name) / f'job_{i}.acf'
+            acf_file.write_text(f'job {i}')
+            self.acf_files.append(acf_file)
+        self.adm_files = [f.with_suffix('.adm') for f in self.acf_files]
+        self.aux_files = [[] for _ in self.acf_files]
+
+    def get_journal(self, **kwargs):
+        return Journal.for_batch(self.acf_files, self.adm_files, self.aux_files, **kwargs)
+
+    def test_resume(self):
+        jrnl = self.get_journal()
+        jrnl.record(0, SUBMITTED, remote_dir='/tmp/a', job_name='job_0', job_id=1)
+        jrnl.record(1, UPLOADED, remote_dir='/tmp/b', job_name='job_1')
+
+        entries = self.get_journal().entries
+
+        self.assertEqual(entries[0]['job_id'], 1)
+        self.assertEqual(entries[1]['state'], UPLOADED)
+        self.assertNotIn(2, entries)
+
+    def test_changed_input_is_ignored(self):
+        self.get_journal().record(0, SUBMITTED, remote_dir='/tmp/a', job_name='job_0', job_id=1)
+        self.acf_files[0].write_text('changed job 0')
+
+        self.assertEqual(self.get_journal().entries, {})
+
+    def test_different_options_and_complete(self):
+        jrnl = self.get_journal()
+        jrnl.record(0, SUBMITTED, remote_dir='/tmp/a', job_name='job_0', job_id=1)
+
+        self.assertEqual(self.get_journal(mins=60).entries, {})
+
+        jrnl.complete()
+        self.assertFalse(jrnl.file.exists())
+        self.assertEqual(self.get_journal().entries, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from io import BytesIO
+from pathlib import Path
+
+from adamspy.postprocess.msg import check_if_finished, get_errors
+
+from aview_hpc.msg import MsgTail
+
+MSG_FILE = Path(__file__).parent / 'results' / 'test.msg'
+
+CXX_MSG = '''  Adams C++ Solver
+ command: sim/dyn, end=1
+---- START: ERROR ----
+Static equilibrium analysis has not been successful.
+---- END: ERROR ----
+ command: sim/dyn, end=2
+---- START: ERROR ----
+Something else went wrong.
+---- END: ERROR ----
+Finished -----
+'''
+
+
+class FakeFile(BytesIO):
+    def readv(self, chunks):
+        for offset, length in chunks:
+            self.seek(offset)
+            yield self.read(length)
+
+
+class FakeStat():
+    def __init__(self, size):
+        self.st_size = size
+
+
+class FakeSFTP():
+    """An SFTP client serving a single growing .msg file"""
+
+    def __init__(self):
+        self.data = b''
+        self.bytes_read = 0
+
+    def listdir(self, path):
+        return ['job.acf', 'job.msg']
+
+    def stat(self, path):
+        return FakeStat(len(self.data))
+
+    def open(self, path, mode='rb'):
+        ftp = self
+
+        class File(FakeFile):
+            def readv(self, chunks):
+                for block in super().readv(chunks):
+                    ftp.bytes_read += len(block)
+                    yield block
+
+        return File(self.data)
+
+
+class TestMsgTail(unittest.TestCase):
+
+    def test_incremental(self):
+        ftp = FakeSFTP()
+        tail = MsgTail(Path('/remote/job'))
+
+        # Feed the file in small pieces that split lines and error blocks
+        data = CXX_MSG.encode()
+        for i in range(0, len(data), 7):
+            ftp.data = data[:i]
+            tail.update(ftp)
+            self.assertFalse(tail.finished)
+
+        ftp.data = data
+        tail.update(ftp)
+
+        self.assertTrue(tail.finished)
+        self.assertEqual(len(tail.errors), 2)
+        self.assertIn('Something else went wrong.', tail.errors[1])
+        self.assertEqual(ftp.bytes_read, len(data))
+
+    def test_matches_adamspy(self):
+        ftp = FakeSFTP()
+        tail = MsgTail(Path('/remote/job'))
+        data = MSG_FILE.read_bytes()
+        for i in range(0, len(data) + 4096, 4096):
+            ftp.data = data[:i]
+            tail.update(ftp)
+
+        self.assertEqual(tail.finished, check_if_finished(MSG_FILE))
+        self.assertEqual(tail.errors, get_errors(MSG_FILE))
+
+    def test_truncated_file_is_reread(self):
+        ftp = FakeSFTP()
+        tail = MsgTail(Path('/remote/job'))
+        ftp.data = CXX_MSG.encode()
+        tail.update(ftp)
+
+        ftp.data = b'  Adams C++ Solver\n'
+        tail.update(ftp)
+
+        self.assertFalse(tail.finished)
+        self.assertEqual(tail.errors, [])
+
+    def test_keep_text(self):
+        ftp = FakeSFTP()
+        tail = MsgTail(Path('/remote/job'), keep_text=True)
+        data = CXX_MSG.encode()
+        for i in range(0, len(data) + 10, 10):
+            ftp.data = data[:i]
+            tail.update(ftp)
+
+        self.assertEqual(tail.text, CXX_MSG)
+        self.assertEqual(ftp.bytes_read, len(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
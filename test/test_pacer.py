@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import patch
+
+from aview_hpc._cli import MAX_SLEEP_TIME, SLEEP_TIME, Pacer, SubmissionBackpressure
+
+
+class TestPacer(unittest.TestCase):
+
+    def setUp(self):
+        self.pacer = Pacer()
+
+    def test_no_delay_by_default(self):
+        with patch('time.sleep') as sleep:
+            with self.pacer:
+                pass
+            with self.pacer:
+                pass
+
+        sleep.assert_not_called()
+
+    def test_backs_off_on_backpressure(self):
+        for _ in range(10):
+            try:
+                with patch('time.sleep'), self.pacer:
+                    raise SubmissionBackpressure('busy')
+            except SubmissionBackpressure:
+                pass
+
+        self.assertEqual(self.pacer.delay, MAX_SLEEP_TIME)
+
+    def test_recovers_on_success(self):
+        try:
+            with self.pacer:
+                raise SubmissionBackpressure('busy')
+        except SubmissionBackpressure:
+            pass
+        self.assertEqual(self.pacer.delay, SLEEP_TIME)
+
+        with patch('time.sleep'):
+            for _ in range(10):
+                with self.pacer:
+                    pass
+
+        self.assertEqual(self.pacer.delay, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
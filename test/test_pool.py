@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import MagicMock
+
+from aview_hpc.pool import ConnectionPool
+
+
+def fake_connect():
+    ssh = MagicMock()
+    ssh.get_transport.return_value.is_active.return_value = True
+    ssh.get_transport.return_value.is_authenticated.return_value = True
+    ftp = MagicMock()
+    ftp.sock.closed = False
+    return ssh, ftp
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool(max_size=1, max_idle=60)
+
+    def test_reuse(self):
+        conn = self.pool.acquire('host', 'user', fake_connect)
+        self.pool.release('host', 'user', conn)
+        conn_2 = self.pool.acquire('host', 'user', fake_connect)
+
+        self.assertIs(conn, conn_2)
+        self.assertEqual(self.pool.stats['hits'], 1)
+        self.assertEqual(self.pool.stats['misses'], 1)
+
+    def test_unhealthy_is_discarded(self):
+        conn = self.pool.acquire('host', 'user', fake_connect)
+        self.pool.release('host', 'user', conn)
+        conn.ssh.get_transport.return_value.is_active.return_value = False
+
+        conn_2 = self.pool.acquire('host', 'user', fake_connect)
+
+        self.assertIsNot(conn, conn_2)
+        self.assertEqual(self.pool.stats['discards'], 1)
+
+    def test_max_size(self):
+        conns = [self.pool.acquire('host', 'user', fake_connect) for _ in range(2)]
+        for conn in conns:
+            self.pool.release('host', 'user', conn)
+
+        self.assertEqual(self.pool.stats['idle'], 1)
+        self.assertEqual(self.pool.stats['evictions'], 1)
+
+    def test_idle_eviction(self):
+        conn = self.pool.acquire('host', 'user', fake_connect)
+        self.pool.release('host', 'user', conn)
+        conn.last_used -= 120
+
+        self.pool.evict_idle()
+
+        self.assertEqual(self.pool.stats['idle'], 0)
+        conn.ssh.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
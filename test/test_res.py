@@ -0,0 +1,58 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from aview_hpc.res import ResBlock, concat_blocks, iter_res, read_res
+
+RES_FILE = Path(__file__).parent / 'results' / 'test.res'
+
+
+def chunks(size: int):
+    with open(RES_FILE, 'rb') as fid:
+        while chunk := fid.read(size):
+            yield chunk
+
+
+class TestResReader(unittest.TestCase):
+
+    def test_select_components(self):
+        data = read_res(chunks(100), ['time.TIME', 'PART_2_XFORM.Y'])
+
+        self.assertEqual(list(data), ['time.TIME', 'PART_2_XFORM.Y'])
+        self.assertEqual(len(data['time.TIME']), 27)
+        self.assertAlmostEqual(data['time.TIME'][-1], 0.25)
+        self.assertAlmostEqual(data['PART_2_XFORM.Y'][-1], -12.06541299259351163)
+
+    def test_entity_selects_all_components(self):
+        data = read_res(chunks(4096), ['PART_2_XFORM'])
+        self.assertEqual(len(data), 18)
+
+    def test_blocks(self):
+        blocks = [(b.data, b.step_type, len(b.values)) for b in iter_res(chunks(64), steps_per_block=10)]
+
+        self.assertEqual(blocks, [('modelInput_001', 'input', 1),
+                                  ('initialConditions_001', 'initialConditions', 1),
+                                  ('dynamic_001', 'dynamic', 10),
+                                  ('dynamic_001', 'dynamic', 10),
+                                  ('dynamic_001', 'dynamic', 5)])
+
+    def test_missing_component(self):
+        with self.assertRaises(RuntimeError):
+            read_res(chunks(4096), ['PART_3_XFORM.X'])
+
+    def test_concat_changed_step_map(self):
+        blocks = [ResBlock('dynamic_001', 'dynamic', ['time.TIME', 'A.X'], np.array([[0., 1.]])),
+                  ResBlock('dynamic_002', 'dynamic', ['time.TIME', 'B.X'],
+                           np.array([[1., 2.], [2., 3.]]))]
+
+        data = concat_blocks(blocks)
+
+        self.assertEqual(list(data), ['time.TIME', 'A.X', 'B.X'])
+        np.testing.assert_array_equal(data['time.TIME'], [0., 1., 2.])
+        np.testing.assert_array_equal(data['A.X'], [1., np.nan, np.nan])
+        np.testing.assert_array_equal(data['B.X'], [np.nan, 2., 3.])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from aview_hpc.result_cache import ResultCache, parse_result_file
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.data = parse_result_file(RESULTS_DIR / 'test.res')
+
+    def get_cache(self, **kwargs):
+        return ResultCache('user@host', cache_dir=Path(self.tmp_dir.name), **kwargs)
+
+    def test_roundtrip(self):
+        cache = self.get_cache()
+        cache.put('/remote/test.res', 6023, 100, self.data)
+
+        data = cache.get('/remote/test.res', 6023, 100)
+
+        self.assertEqual(list(data), list(self.data))
+        self.assertIsInstance(data['time.TIME'], np.memmap)
+        np.testing.assert_array_equal(data['PART_2_XFORM.Y'], self.data['PART_2_XFORM.Y'])
+
+    def test_changed_remote_file_misses(self):
+        cache = self.get_cache()
+        cache.put('/remote/test.res', 6023, 100, self.data)
+
+        self.assertIsNone(cache.get('/remote/test.res', 6023, 101))
+        self.assertIsNone(cache.get('/remote/test.res', 7000, 100))
+
+    def test_compressed(self):
+        cache = self.get_cache(compress=True)
+        cache.put('/remote/test.gra', 1, 1, parse_result_file(RESULTS_DIR / 'test.gra'))
+
+        data = cache.get('/remote/test.gra', 1, 1)
+        self.assertEqual(data['values'].shape, (27, 1, 6))
+
+    def test_lru_eviction(self):
+        cache = self.get_cache(max_size=2**40)
+        for i in range(3):
+            cache.put(f'/remote/{i}.res', 1, 1, self.data)
+            time.sleep(0.05)
+        cache.get('/remote/0.res', 1, 1)
+
+        entry_size = sum(f.stat().st_size for f in cache.entry_dir('/remote/0.res', 1, 1).iterdir())
+        cache.max_size = entry_size * 2
+        cache.evict()
+
+        self.assertIsNotNone(cache.get('/remote/0.res', 1, 1))
+        self.assertIsNone(cache.get('/remote/1.res', 1, 1))
+        self.assertIsNotNone(cache.get('/remote/2.res', 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
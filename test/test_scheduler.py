@@ -0,0 +1,133 @@
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from aview_hpc.scheduler import (CANCELLED, FAILED, PENDING, SUBMITTED, SUBMITTING, Scheduler,
+                                 SubmitQueue)
+
+HOST = 'user@host'
+
+
+def job_table(states, ncpus=None):
+    return pd.DataFrame({'JobID': range(len(states)),
+                         'State': states,
+                         'NCPUS': ncpus or [1] * len(states)})
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue = SubmitQueue(Path(self.tmpdir.name) / 'queue.sqlite')
+        self.submitted = []
+
+        def submit_fn(acf_file, **_):
+            if acf_file == 'bad.acf':
+                raise RuntimeError('Could not submit')
+            self.submitted.append(acf_file)
+            return f'/remote/{acf_file}', acf_file, 100 + len(self.submitted)
+
+        self.scheduler = Scheduler(self.queue, HOST, session=None, submit_fn=submit_fn)
+
+    def tearDown(self):
+        self.queue._db.close()
+        self.tmpdir.cleanup()
+
+    def test_priority_and_job_limit(self):
+        low = self.queue.enqueue(HOST, {'acf_file': 'low.acf'}, priority=0, max_jobs=3)
+        high = self.queue.enqueue(HOST, {'acf_file': 'high.acf'}, priority=5, max_jobs=3)
+
+        self.scheduler.release(job_table(['RUNNING', 'PENDING', 'COMPLETED']))
+
+        self.assertEqual(self.submitted, ['high.acf'])
+        self.assertEqual(self.queue.get(high)['state'], SUBMITTED)
+        self.assertEqual(self.queue.get(high)['job_id'], '101')
+        self.assertEqual(self.queue.get(low)['state'], PENDING)
+
+        self.scheduler.release(job_table(['RUNNING', 'COMPLETED', 'COMPLETED']))
+        self.assertEqual(self.queue.get(low)['state'], SUBMITTED)
+
+    def test_cpu_limit(self):
+        ticket = self.queue.enqueue(HOST, {'acf_file': 'big.acf'}, ncpus=8, max_cpus=16)
+
+        self.scheduler.release(job_table(['RUNNING', 'RUNNING'], ncpus=[4, 8]))
+        self.assertEqual(self.queue.get(ticket)['state'], PENDING)
+
+        self.scheduler.release(job_table(['RUNNING', 'COMPLETED'], ncpus=[4, 8]))
+        self.assertEqual(self.queue.get(ticket)['state'], SUBMITTED)
+
+    def test_cancel_and_failure(self):
+        cancelled = self.queue.enqueue(HOST, {'acf_file': 'a.acf'})
+        failed = self.queue.enqueue(HOST, {'acf_file': 'bad.acf'})
+
+        self.assertTrue(self.queue.cancel(cancelled))
+        self.scheduler.release(job_table([]))
+
+        self.assertEqual(self.queue.get(cancelled)['state'], CANCELLED)
+        self.assertFalse(self.queue.cancel(failed))
+        self.assertEqual(self.queue.get(failed)['state'], FAILED)
+        self.assertIn('Could not submit', self.queue.get(failed)['error'])
+
+    def test_shared_between_connections(self):
+        other = SubmitQueue(self.queue.db_file)
+        ticket = other.enqueue(HOST, {'acf_file': 'a.acf'})
+
+        self.assertTrue(self.queue.claim(ticket))
+        self.assertFalse(other.claim(ticket))
+        other._db.close()
+
+    def test_expire_only_without_heartbeat(self):
+        ticket = self.queue.enqueue(HOST, {'acf_file': 'a.acf'})
+        self.queue._db.execute('UPDATE tickets SET updated=? WHERE ticket=?',
+                               (time.time() - 7200, ticket))
+        self.assertTrue(self.queue.claim(ticket))
+
+        # Claimed long ago, but its owner is still beating
+        self.queue._db.execute('UPDATE tickets SET updated=? WHERE ticket=?',
+                               (time.time() - 7200, ticket))
+        self.queue.beat([ticket])
+        self.queue.expire(HOST, stale_after=60)
+        self.assertEqual(self.queue.get(ticket)['state'], SUBMITTING)
+
+        self.queue._db.execute('UPDATE tickets SET heartbeat=? WHERE ticket=?',
+                               (time.time() - 120, ticket))
+        self.queue.expire(HOST, stale_after=60)
+        self.assertEqual(self.queue.get(ticket)['state'], FAILED)
+
+    def test_complete_after_expire_is_logged(self):
+        ticket = self.queue.enqueue(HOST, {'acf_file': 'a.acf'})
+
+        def submit_fn(acf_file, **_):
+            self.queue.fail(ticket, 'Interrupted while being submitted')
+            return f'/remote/{acf_file}', acf_file, 101
+
+        self.scheduler.submit_fn = submit_fn
+        with self.assertLogs('aview_hpc.scheduler', 'ERROR') as logs:
+            self.scheduler.release(job_table([]))
+
+        self.assertIn('submitted as job 101', logs.output[0])
+        self.assertEqual(self.queue.get(ticket)['state'], FAILED)
+
+    def test_migrate_old_schema(self):
+        db_file = Path(self.tmpdir.name) / 'old.sqlite'
+        db = sqlite3.connect(db_file)
+        db.execute('CREATE TABLE tickets (ticket INTEGER PRIMARY KEY AUTOINCREMENT, '
+                   'host TEXT NOT NULL, state TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0, '
+                   'ncpus INTEGER NOT NULL DEFAULT 1, max_jobs INTEGER, max_cpus INTEGER, '
+                   'request TEXT NOT NULL, remote_dir TEXT, job_name TEXT, job_id TEXT, '
+                   'error TEXT, created REAL NOT NULL, updated REAL NOT NULL)')
+        db.close()
+
+        queue = SubmitQueue(db_file)
+        ticket = queue.enqueue(HOST, {'acf_file': 'a.acf'})
+        self.assertTrue(queue.claim(ticket))
+        self.assertIsNotNone(queue.get(ticket)['heartbeat'])
+        queue._db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
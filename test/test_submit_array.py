@@ -0,0 +1,154 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pandas as pd
+
+from aview_hpc._cli import HPCSession
+from aview_hpc.journal import SUBMITTED, SUBMITTING, UPLOADED, Journal
+
+
+class FakeArraySession(HPCSession):
+    """An `HPCSession` that records what it would do on the cluster"""
+
+    def __init__(self, max_array_size: int):
+        self.max_array_size = max_array_size
+        self.ftp = MagicMock()
+        self.submitted = []
+        self.uploaded = []
+        self.remote_dir = None
+        self.job_name = None
+        self.job_id = None
+        self.job_table = pd.DataFrame(columns=['JobID', 'WorkDir', 'SubmitLine'])
+        self.queue = pd.DataFrame(columns=['JobID', 'WorkDir', 'Comment'])
+
+    def upload_job(self, acf_file, adm_file=None, aux_files=None, transfer_mode=None):
+        self.remote_dir = Path('/remote') / acf_file.stem
+        self.job_name = acf_file.stem
+        self.uploaded.append(acf_file)
+
+    def mkdtemp_remote(self, name=None, n_rand=4):
+        return Path('/remote') / name
+
+    def get_max_array_size(self):
+        return self.max_array_size
+
+    def run_submit_cmd(self, *args, **kwargs):
+        self.submitted.append(kwargs['array'])
+        return 100 + len(self.submitted)
+
+    def get_job_table(self, days=7):
+        return self.job_table
+
+    def get_queued_jobs(self):
+        return self.queue
+
+    def _index_submission(self, *args, **kwargs):
+        pass
+
+
+class TestSubmitArray(unittest.TestCase):
+
+    def test_split_by_max_array_size(self):
+        hpc = FakeArraySession(max_array_size=2)
+        acf_files = [Path(f'model_{i}.acf') for i in range(5)]
+
+        remote_dirs, job_names, job_ids = hpc.submit_array(acf_files,
+                                                           [Path('model.adm')] * 5,
+                                                           [[]] * 5)
+
+        self.assertEqual(len(hpc.submitted), 3)
+        self.assertEqual(job_ids, ['101_0', '101_1', '102_0', '102_1', '103_0'])
+        self.assertEqual(job_names, [f'model_{i}' for i in range(5)])
+        self.assertEqual(remote_dirs[4], Path('/remote/model_4'))
+
+    def test_resume_does_not_resubmit(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        journal = Journal(Path(tmp_dir.name) / 'batch.jsonl', [[]] * 5)
+        journal.record(0, SUBMITTED, remote_dir='/remote/model_0', job_name='model_0',
+                       job_id='50_0')
+        for i, task_file in [(1, '/remote/array/tasks_0.txt'), (2, '/remote/array/tasks_1.txt')]:
+            journal.record(i, SUBMITTING, remote_dir=f'/remote/model_{i}', job_name=f'model_{i}',
+                           task_file=task_file, task_id=0)
+        journal.record(3, UPLOADED, remote_dir='/remote/model_3', job_name='model_3')
+
+        hpc = FakeArraySession(max_array_size=10)
+        # The array of job 1 was submitted but its task wasn't moved to its own directory yet
+        hpc.job_table = pd.DataFrame({'JobID': ['60_[0]'],
+                                      'WorkDir': ['/remote/array'],
+                                      'SubmitLine': ['sbatch --comment=/remote/array/tasks_0.txt']})
+
+        acf_files = [Path(f'model_{i}.acf') for i in range(5)]
+        _, _, job_ids = hpc.submit_array(acf_files, [Path('model.adm')] * 5, [[]] * 5,
+                                         journal=journal)
+
+        self.assertEqual(hpc.uploaded, [Path('model_4.acf')])
+        self.assertEqual(len(hpc.submitted), 1)
+        written = hpc.ftp.open.return_value.__enter__.return_value.write.call_args[0][0]
+        self.assertEqual(written.split(), ['/remote/model_2/model_2.acf',
+                                           '/remote/model_3/model_3.acf',
+                                           '/remote/model_4/model_4.acf'])
+        self.assertEqual(job_ids, ['50_0', '60_0', '101_0', '101_1', '101_2'])
+        self.assertTrue(all(journal.entries[i]['state'] == SUBMITTED for i in range(5)))
+
+    def _interrupted_journal(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        journal = Journal(Path(tmp_dir.name) / 'batch.jsonl', [[]] * 2)
+        journal.record_many({i: {'remote_dir': f'/remote/model_{i}', 'job_name': f'model_{i}',
+                                 'task_file': '/remote/array/tasks_0.txt', 'task_id': i}
+                             for i in range(2)}, SUBMITTING)
+        return journal
+
+    def test_resume_finds_array_in_queue(self):
+        journal = self._interrupted_journal()
+
+        # sacct doesn't show the held array yet, but squeue does
+        hpc = FakeArraySession(max_array_size=10)
+        hpc.queue = pd.DataFrame({'JobID': ['70_0', '70_1'],
+                                  'WorkDir': ['/remote/array'] * 2,
+                                  'Comment': ['/remote/array/tasks_0.txt'] * 2})
+
+        acf_files = [Path(f'model_{i}.acf') for i in range(2)]
+        _, _, job_ids = hpc.submit_array(acf_files, [Path('model.adm')] * 2, [[]] * 2,
+                                         journal=journal)
+
+        self.assertEqual(hpc.submitted, [])
+        self.assertEqual(job_ids, ['70_0', '70_1'])
+
+    def test_resume_unmatched_queued_array_is_not_resubmitted(self):
+        journal = self._interrupted_journal()
+
+        hpc = FakeArraySession(max_array_size=10)
+        hpc.queue = pd.DataFrame({'JobID': ['70_0'], 'WorkDir': ['/remote/array'], 'Comment': ['']})
+
+        acf_files = [Path(f'model_{i}.acf') for i in range(2)]
+        with self.assertRaises(RuntimeError):
+            hpc.submit_array(acf_files, [Path('model.adm')] * 2, [[]] * 2, journal=journal)
+
+        self.assertEqual(hpc.submitted, [])
+        self.assertTrue(all(journal.entries[i]['state'] == SUBMITTING for i in range(2)))
+
+    def test_resume_resubmits_array_cancelled_before_it_ran(self):
+        journal = self._interrupted_journal()
+
+        # The submit command cancelled the array because it couldn't release it
+        hpc = FakeArraySession(max_array_size=10)
+        hpc.job_table = pd.DataFrame({'JobID': ['70_[0-1]'],
+                                      'State': ['CANCELLED by 1000'],
+                                      'Start': [None],
+                                      'WorkDir': ['/remote/array'],
+                                      'SubmitLine': ['sbatch --comment=/remote/array/tasks_0.txt']})
+
+        acf_files = [Path(f'model_{i}.acf') for i in range(2)]
+        _, _, job_ids = hpc.submit_array(acf_files, [Path('model.adm')] * 2, [[]] * 2,
+                                         journal=journal)
+
+        self.assertEqual(len(hpc.submitted), 1)
+        self.assertEqual(job_ids, ['101_0', '101_1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
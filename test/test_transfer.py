@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from paramiko import SFTPAttributes
+
+from aview_hpc import transfer
+from aview_hpc.transfer import download_files, sync_files
+
+
+class FakeRemoteFile():
+    def __init__(self, file: Path, fail_after: int = None):
+        self.fid = open(file, 'rb')
+        self.fail_after = fail_after
+
+    def readv(self, chunks):
+        for i, (offset, length) in enumerate(chunks):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise EOFError('Connection lost')
+            self.fid.seek(offset)
+            yield self.fid.read(length)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fid.close()
+
+
+class FakeSFTP():
+    """Serves the local filesystem as if it were remote"""
+
+    def __init__(self, fail_after: int = None):
+        self.fail_after = fail_after
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode='rb'):
+        return FakeRemoteFile(Path(path), self.fail_after)
+
+    def close(self):
+        pass
+
+
+class TestDownloadFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.remote = Path(self.tmp_dir.name) / 'remote.res'
+        self.remote.write_bytes(os.urandom(10 * 2**20 + 123))
+        self.local = Path(self.tmp_dir.name) / 'local' / 'remote.res'
+
+        for name, value in {'BLOCK_SIZE': 2**18, 'CHECKPOINT_SIZE': 2**19}.items():
+            patcher = patch.object(transfer, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def download(self, ftp: FakeSFTP, **kwargs):
+        with patch.object(transfer.SFTPClient, 'from_transport', return_value=ftp):
+            download_files(None, [(self.remote.as_posix(), self.local)], ftp=ftp,
+                           split_size=2**20 * 3, **kwargs)
+
+    def test_split_download(self):
+        progress = []
+        self.download(FakeSFTP(), callback=lambda *args: progress.append(args))
+
+        self.assertEqual(self.local.read_bytes(), self.remote.read_bytes())
+        self.assertEqual(max(p[1] for p in progress), self.remote.stat().st_size)
+        self.assertFalse(self.local.with_name('remote.res.part.json').exists())
+
+    def test_resume(self):
+        with self.assertRaises(EOFError):
+            self.download(FakeSFTP(fail_after=6), concurrency=1)
+        self.assertTrue(self.local.with_name('remote.res.part.json').exists())
+
+        progress = []
+        self.download(FakeSFTP(), concurrency=1, callback=lambda *args: progress.append(args))
+
+        self.assertEqual(self.local.read_bytes(), self.remote.read_bytes())
+        # Only the part that wasn't checkpointed is downloaded again
+        self.assertGreater(progress[0][1] - 2**18, 0)
+
+
+class TestSyncFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.remote_dir = Path(self.tmp_dir.name) / 'remote'
+        self.local_dir = Path(self.tmp_dir.name) / 'local'
+        self.remote_dir.mkdir()
+        (self.remote_dir / 'job.msg').write_text('line 1\n')
+        (self.remote_dir / 'job.res').write_text('<Results/>')
+        self.ftp = FakeSFTP()
+        self.patcher = patch.object(transfer.SFTPClient, 'from_transport', return_value=self.ftp)
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def sync(self):
+        files = [((self.remote_dir / name).as_posix(), self.local_dir / name)
+                 for name in ('job.msg', 'job.res')]
+        attrs = [SFTPAttributes.from_stat(os.stat(remote)) for remote, _ in files]
+        return sync_files(None, files, attrs, self.local_dir / transfer.MANIFEST_NAME, ftp=self.ftp)
+
+    def test_unchanged_files_are_skipped(self):
+        self.assertEqual(len(self.sync()), 2)
+        self.assertEqual(self.sync(), [])
+
+    def test_grown_file_is_appended(self):
+        self.sync()
+        with open(self.remote_dir / 'job.msg', 'a') as fid:
+            fid.write('line 2\n')
+
+        with patch.object(transfer, '_Download', wraps=transfer._Download) as download:
+            self.assertEqual(self.sync(), [self.local_dir / 'job.msg'])
+
+        self.assertEqual(download.call_args.kwargs['start'], len('line 1\n'))
+        self.assertEqual((self.local_dir / 'job.msg').read_text(), 'line 1\nline 2\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
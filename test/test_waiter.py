@@ -0,0 +1,94 @@
+import unittest
+from contextlib import nullcontext
+from io import BytesIO
+from unittest.mock import patch
+
+import pandas as pd
+
+from aview_hpc import waiter
+from aview_hpc.waiter import Waiter
+
+
+class FakeSSH():
+    def __init__(self, session):
+        self.session = session
+
+    def exec_command(self, cmd):
+        self.session.commands.append(cmd)
+        lines = [f'{job_id},{state},{workdir}' for job_id, (state, workdir)
+                 in self.session.states.items()]
+        return None, BytesIO('\n'.join(lines).encode()), BytesIO()
+
+
+class FakeSession():
+    def __init__(self):
+        self.ssh = FakeSSH(self)
+        self.commands = []
+        self.probes = []
+        self.states = {}
+        self.dirs = {}
+        self.workdirs = {}
+
+    def get_job_table(self):
+        return pd.DataFrame({'JobID': list(self.workdirs.values()),
+                             'WorkDir': list(self.workdirs.keys())})
+
+    def get_dirs_status(self, remote_dirs):
+        self.probes.append(list(remote_dirs))
+        return {d: self.dirs.get(d, {'finished': False, 'n_errors': 0}) for d in remote_dirs}
+
+    def check_if_finished_and_get_errors(self, remote_dir, ignore_static, ignore_parse):
+        return True, [f'error in {remote_dir.as_posix()}']
+
+
+class TestWaiter(unittest.TestCase):
+
+    def setUp(self):
+        self.hpc = FakeSession()
+        self.waiter = Waiter(lambda: nullcontext(self.hpc), min_interval=0, max_interval=0)
+
+    def test_one_query_per_cycle(self):
+        for i in range(50):
+            self.waiter.add(job_id=i)
+        self.hpc.states = {str(i): ('RUNNING', f'/jobs/{i}') for i in range(50)}
+
+        self.assertEqual(self.waiter.poll(), [])
+        self.assertEqual(len(self.hpc.commands), 1)
+        self.assertEqual(len(self.hpc.probes), 1)
+        self.assertEqual(len(self.hpc.probes[0]), 50)
+
+    def test_resolved_by_state_or_msg(self):
+        by_state = self.waiter.add(job_id='1')
+        by_msg = self.waiter.add(remote_dir='/jobs/2')
+        self.hpc.states = {'1': ('CANCELLED by 1000', '/jobs/1')}
+        self.hpc.dirs = {'/jobs/2': {'finished': True, 'n_errors': 1}}
+
+        results = self.waiter.wait()
+
+        self.assertEqual(results, [by_state, by_msg])
+        self.assertEqual(by_state.state, 'CANCELLED')
+        self.assertEqual(by_state.remote_dir, '/jobs/1')
+        self.assertEqual(by_state.errors, [])
+        self.assertTrue(by_msg.finished)
+        self.assertEqual(by_msg.errors, ['error in /jobs/2'])
+
+    def test_job_id_found_from_remote_dir(self):
+        result = self.waiter.add(remote_dir='/jobs/3')
+        self.hpc.workdirs = {'/jobs/3': '3'}
+        self.hpc.states = {'3': ('OUT_OF_MEMORY', '/jobs/3')}
+
+        self.assertEqual(self.waiter.poll(), [result])
+        self.assertEqual(result.job_id, '3')
+        self.assertEqual(result.state, 'OUT_OF_MEMORY')
+
+    def test_timeout(self):
+        self.waiter.add(job_id='1')
+        self.hpc.states = {'1': ('PENDING', '/jobs/1')}
+        self.waiter.min_interval = self.waiter.max_interval = 10
+
+        with patch.object(waiter.time, 'sleep'), self.assertRaises(TimeoutError):
+            self.waiter.wait(timeout=5)
+
+
+if __name__ == '__main__':
+    unittest.main()